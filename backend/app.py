@@ -1,5 +1,8 @@
-import os, json, threading, collections, sys
-from flask import Flask, request, jsonify
+import time
+_BOOT_T0 = time.perf_counter()  # startup report measures from here
+import os, json, threading, collections, sys, hashlib, base64, queue, contextlib
+import click
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from google.cloud import pubsub_v1
 from google.api_core.exceptions import NotFound
@@ -8,7 +11,21 @@ import time
 from google.oauth2 import service_account
 from collections import deque
 import threading
-from datetime import datetime, timezone
+from datetime import datetime, timezone, date, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import ThreadPoolExecutor
+from backend.puller import AdaptivePuller
+from backend.ingest import IngestSink, row_from_message
+from backend.leader import FileLeaderLock, PostgresLeaderLock, run_for_leadership
+from backend.shared_ring import SharedRing
+from backend.pubsub_clients import PubSubClients
+from backend import metrics
+from backend.eventlog import EventLog
+from backend.partitions import MessagePartitions, keyed_insert_sql
+from backend.db import hot, make_engine, stats as pool_stats
+from backend.export import FORMATS as EXPORT_FORMATS, MessageExporter, content_type as export_content_type
+from backend.rollups import GRANULARITIES as ROLLUP_GRANULARITIES, MessageRollups, floor_to
+import atexit
 
 # -----------------------------
 # Config via env
@@ -17,17 +34,183 @@ PROJECT_ID = os.environ.get("PROJECT_ID", "").strip()
 TOPIC_ID = os.environ.get("TOPIC_ID", "app-messages").strip()
 SUB_PULL_ID = os.environ.get("SUB_PULL_ID", "app-sub-pull-test").strip()
 USE_SYNC_POLL = os.environ.get("USE_SYNC_POLL", "0") == "1"
+# publish pipeline: client-side batching + background DB writes
+PUBLISH_BATCH_MAX_MESSAGES = int(os.environ.get("PUBLISH_BATCH_MAX_MESSAGES", "100"))
+PUBLISH_BATCH_MAX_BYTES = int(os.environ.get("PUBLISH_BATCH_MAX_BYTES", str(1024 * 1024)))
+PUBLISH_BATCH_MAX_LATENCY = float(os.environ.get("PUBLISH_BATCH_MAX_LATENCY", "0.01"))
+PUBLISH_DB_WORKERS = int(os.environ.get("PUBLISH_DB_WORKERS", "4"))
+PUBLISH_BATCH_MAX_ITEMS = int(os.environ.get("PUBLISH_BATCH_MAX_ITEMS", "500"))
+CLIENT_ID_CACHE_SIZE = int(os.environ.get("CLIENT_ID_CACHE_SIZE", "100000"))
+CLIENT_ID_CACHE_TTL = float(os.environ.get("CLIENT_ID_CACHE_TTL", "3600"))
+MODERATION_CACHE_SIZE = int(os.environ.get("MODERATION_CACHE_SIZE", "10000"))
+MODERATION_CACHE_TTL = float(os.environ.get("MODERATION_CACHE_TTL", "3600"))
+# /api/messages total: exact | estimate | cached (overridable per request with ?count=)
+MESSAGES_COUNT_STRATEGY = os.environ.get("MESSAGES_COUNT_STRATEGY", "exact").strip().lower()
+MESSAGES_COUNT_CACHE_TTL = float(os.environ.get("MESSAGES_COUNT_CACHE_TTL", "30"))
+# seconds browsers may reuse a CORS preflight: the dashboard's polls send
+# If-None-Match, so without this every cross-origin poll costs two round trips
+# (Chromium caps it at 7200)
+CORS_MAX_AGE = int(os.environ.get("CORS_MAX_AGE", "7200"))
+# gunicorn --threads per worker (render.yaml's startCommand passes this)
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "32"))
+# /api/stream: events kept for Last-Event-ID resume, per-client queue bound,
+# keepalive interval and a cap on open streams. Each stream holds a worker
+# thread for its whole life, so by default streams get a quarter of them and
+# /publish and /api/messages keep the rest.
+STREAM_HISTORY = int(os.environ.get("STREAM_HISTORY", "1000"))
+STREAM_CLIENT_QUEUE = int(os.environ.get("STREAM_CLIENT_QUEUE", "256"))
+STREAM_KEEPALIVE = float(os.environ.get("STREAM_KEEPALIVE", "15"))
+STREAM_MAX_CLIENTS = int(os.environ.get("STREAM_MAX_CLIENTS", str(max(1, WEB_THREADS // 4))))
+# zone used to interpret /api/messages start/end when the client sends no ?tz=
+DEFAULT_TIMEZONE = os.environ.get("DEFAULT_TIMEZONE", "UTC").strip()
+MESSAGES_RESPONSE_CACHE_SIZE = int(os.environ.get("MESSAGES_RESPONSE_CACHE_SIZE", "512"))
+MESSAGES_RESPONSE_CACHE_TTL = float(os.environ.get("MESSAGES_RESPONSE_CACHE_TTL", "60"))
+# /api/messages/export: rows per server-side FETCH, concurrent exports per
+# process (each holds a pooled connection while it streams), gzip level
+EXPORT_FETCH_SIZE = int(os.environ.get("EXPORT_FETCH_SIZE", "2000"))
+EXPORT_MAX_CONCURRENT = int(os.environ.get("EXPORT_MAX_CONCURRENT", "2"))
+EXPORT_GZIP_LEVEL = int(os.environ.get("EXPORT_GZIP_LEVEL", "6"))
+# /api/stats rollups: seconds between flushes of the per-process deltas, days
+# of minute rows kept (hour rows are kept), and a cap on buckets per response
+ROLLUP_FLUSH_INTERVAL = float(os.environ.get("ROLLUP_FLUSH_INTERVAL", "5"))
+ROLLUP_MINUTE_RETENTION_DAYS = int(os.environ.get("ROLLUP_MINUTE_RETENTION_DAYS", "14"))
+STATS_MAX_BUCKETS = int(os.environ.get("STATS_MAX_BUCKETS", "1500"))
+# text search configuration of the full-text index (idx_messages_data_fts)
+SEARCH_TS_CONFIG = os.environ.get("SEARCH_TS_CONFIG", "english").strip().lower()
 _LAST_PULL_AT = 0 
+# sync pull loop: concurrent streams, adaptive batch size, batched acks
+SYNC_PULL_STREAMS = int(os.environ.get("SYNC_PULL_STREAMS", "2"))
+SYNC_PULL_MIN_BATCH = int(os.environ.get("SYNC_PULL_MIN_BATCH", "10"))
+SYNC_PULL_MAX_BATCH = int(os.environ.get("SYNC_PULL_MAX_BATCH", "1000"))
+SYNC_ACK_BATCH = int(os.environ.get("SYNC_ACK_BATCH", "500"))
+SYNC_ACK_INTERVAL = float(os.environ.get("SYNC_ACK_INTERVAL", "0.1"))
+SYNC_IDLE_BACKOFF_MAX = float(os.environ.get("SYNC_IDLE_BACKOFF_MAX", "5"))
+SYNC_PULLER = None
+# consumed messages -> messages table, in batches, acked after commit
+INGEST_TO_DB = os.environ.get("INGEST_TO_DB", "1") == "1"
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", "1.0"))
+INGEST_METHOD = os.environ.get("INGEST_METHOD", "insert").strip().lower()
+INGEST_SINK = None
+# multi-worker mode: none (every process pulls) | file | postgres
+PULLER_LEADER_LOCK = os.environ.get("PULLER_LEADER_LOCK", "none").strip().lower()
+PULLER_LOCK_PATH = os.environ.get("PULLER_LOCK_PATH", "/tmp/pubsub-puller.lock")
+PULLER_IS_LEADER = False
+# shared recent-message ring (e.g. /dev/shm/pubsub-recent); empty = per-process deque
+RECENT_SHM_PATH = os.environ.get("RECENT_SHM_PATH", "").strip()
+RECENT_SHM_SLOT_SIZE = int(os.environ.get("RECENT_SHM_SLOT_SIZE", "4096"))
+# shared Pub/Sub channels: keepalive pings and extra grpc options (JSON object)
+PUBSUB_KEEPALIVE_MS = int(os.environ.get("PUBSUB_KEEPALIVE_MS", "30000"))
+PUBSUB_KEEPALIVE_TIMEOUT_MS = int(os.environ.get("PUBSUB_KEEPALIVE_TIMEOUT_MS", "10000"))
+PUBSUB_KEEPALIVE_WITHOUT_CALLS = os.environ.get("PUBSUB_KEEPALIVE_WITHOUT_CALLS", "0") == "1"
+PUBSUB_CHANNEL_OPTIONS = json.loads(os.environ.get("PUBSUB_CHANNEL_OPTIONS", "") or "{}")
+# pull-loop logging: JSON lines from a background writer; per-event sampling /
+# rate limits, overridable with LOG_EVENT_POLICIES='{"pull.message": {"every": 1}}'
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_SUPPRESSED_REPORT_INTERVAL = float(os.environ.get("LOG_SUPPRESSED_REPORT_INTERVAL", "60"))
+LOG_EVENT_POLICIES = {
+    "sync.pull": {"rate": 1.0, "burst": 5},
+    "sync.idle": {"rate": 1 / 60},
+    "pull.message": {"every": 100, "rate": 10.0, "burst": 10},
+    "pull.error": {"rate": 5.0, "burst": 20},
+    "sync.puller": {"rate": 5.0, "burst": 20},
+    "ingest": {"rate": 5.0, "burst": 20},
+    **json.loads(os.environ.get("LOG_EVENT_POLICIES", "") or "{}"),
+}
+# startup: LAZY_INIT=1 builds clients on first use / in a background warm-up
+# so the server can bind and answer /healthz immediately; 0 builds them at
+# import like before. Schema DDL only runs on boot with MIGRATE_ON_BOOT=1,
+# otherwise use `flask --app backend.app migrate`.
+LAZY_INIT = os.environ.get("LAZY_INIT", "1") == "1"
+MIGRATE_ON_BOOT = os.environ.get("MIGRATE_ON_BOOT", "0") == "1"
+
+def _flask_cli_command() -> bool:
+    # Flask loads the app inside the click context of the command being run;
+    # only `flask run` serves requests
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and ctx.command.name != "run"
+
+# False under `flask migrate` and the other CLI commands: no warm-up (which
+# would race the command's own migration) and no background threads
+SERVING = not _flask_cli_command()
+# messages partitioning: day | month (empty = plain table). New tables are
+# created partitioned; an existing one is converted with
+# `flask --app backend.app partition-messages`. Partitions that ended more
+# than MESSAGES_RETENTION_DAYS ago are archived to MESSAGES_ARCHIVE_DIR.
+MESSAGES_PARTITION_INTERVAL = os.environ.get("MESSAGES_PARTITION_INTERVAL", "").strip().lower()
+MESSAGES_PARTITION_PREMAKE = int(os.environ.get("MESSAGES_PARTITION_PREMAKE", "3"))
+MESSAGES_RETENTION_DAYS = int(os.environ.get("MESSAGES_RETENTION_DAYS", "0"))
+MESSAGES_ARCHIVE_DIR = os.environ.get("MESSAGES_ARCHIVE_DIR", "archive").strip()
+PARTITION_MAINTENANCE_INTERVAL = float(os.environ.get("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+
+# --- startup phases ---
+# phase -> {"start_ms", "ms"} relative to _BOOT_T0; phases may overlap when
+# the warm-up runs them in parallel
+BOOT_PHASES = collections.OrderedDict()
+# degraded: checks that failed without holding readiness back (missing topic)
+BOOT_STATE = {"ready": False, "ready_ms": None, "warming": False, "errors": {}, "degraded": {}}
+BOOT_LOCK = threading.Lock()
+
+def _boot_ms(t=None) -> float:
+    return round(((t if t is not None else time.perf_counter()) - _BOOT_T0) * 1000, 1)
+
+@contextlib.contextmanager
+def _boot_phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        with BOOT_LOCK:
+            BOOT_STATE["errors"][name] = repr(e)
+        raise
+    finally:
+        with BOOT_LOCK:
+            BOOT_PHASES[name] = {"start_ms": _boot_ms(t0), "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+class _Lazy:
+    """Stand-in for an expensive module-level client, built on first use.
+
+    Attribute access is forwarded to the real object, so call sites keep
+    using e.g. `publisher.publish(...)`. A failed build is retried on the
+    next use.
+    """
+
+    def __init__(self, name: str, factory):
+        self._name = name
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        obj = self._obj
+        if obj is None:
+            with self._lock:
+                if self._obj is None:
+                    with _boot_phase(self._name):
+                        self._obj = self._factory()
+                obj = self._obj
+        return obj
+
+    @property
+    def built(self) -> bool:
+        return self._obj is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+BOOT_PHASES["imports"] = {"start_ms": 0.0, "ms": _boot_ms()}
+
 CREDS_PATH = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
 if not CREDS_PATH:
     raise RuntimeError("GOOGLE_APPLICATION_CREDENTIALS env var not set")
 
-CREDS = service_account.Credentials.from_service_account_file(CREDS_PATH)
+CREDS = _Lazy("credentials", lambda: service_account.Credentials.from_service_account_file(CREDS_PATH))
 
 # === Cloud SQL setup ===
 from google.cloud.sql.connector import Connector, IPTypes
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy import CheckConstraint
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy import text
 import os
 
@@ -36,96 +219,468 @@ DB_NAME     = os.getenv("DB_NAME", "appdb")
 DB_USER     = os.getenv("DB_USER", "appuser")
 DB_PASS     = os.getenv("DB_PASS")
 
-connector = Connector()
+connector = _Lazy("cloud_sql_connector", Connector)
+
+def _cloud_sql_creator(instance):
+    def getconn():
+        return connector.connect(
+            instance,
+            "pg8000",
+            user=DB_USER,
+            password=DB_PASS,
+            db=DB_NAME,
+            ip_type=IPTypes.PUBLIC  
+        )
+    return getconn
+
+getconn = _cloud_sql_creator(DB_INSTANCE)
+
+# DATABASE_URL points the app at a plain Postgres (local dev, benchmarks)
+# instead of going through the Cloud SQL connector.
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+# Reads (/api/messages, exports) use their own pool. DATABASE_READ_URL or
+# DB_READ_INSTANCE (a Cloud SQL read replica) move them off the primary;
+# without either the read pool connects to the same database as writes.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "").strip()
+DB_READ_INSTANCE = os.getenv("DB_READ_INSTANCE", "").strip()
+DB_WRITE_POOL_SIZE = int(os.environ.get("DB_WRITE_POOL_SIZE", "5"))
+DB_WRITE_MAX_OVERFLOW = int(os.environ.get("DB_WRITE_MAX_OVERFLOW", "5"))
+DB_READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", "5"))
+DB_READ_MAX_OVERFLOW = int(os.environ.get("DB_READ_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+# always = pre-ping every checkout; idle = only after DB_POOL_PING_IDLE seconds unused
+DB_POOL_PING = os.environ.get("DB_POOL_PING", "idle").strip().lower()
+DB_POOL_PING_IDLE = float(os.environ.get("DB_POOL_PING_IDLE", "30"))
+# opt-in per-connection prepared statements for the hot queries; they lean on
+# pg8000 internals (see backend/db.py) and need session pooling, not pgbouncer
+DB_PREPARE_STATEMENTS = os.environ.get("DB_PREPARE_STATEMENTS", "0") == "1"
+DB_MAX_PREPARED = int(os.environ.get("DB_MAX_PREPARED", "64"))
+# after a local write, don't cache reads from a replica for this long (lag)
+DB_REPLICA_LAG_GRACE = float(os.environ.get("DB_REPLICA_LAG_GRACE", "2"))
+
+_POOL_OPTIONS = dict(
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    ping=DB_POOL_PING,
+    ping_idle=DB_POOL_PING_IDLE,
+    prepare=DB_PREPARE_STATEMENTS,
+    max_prepared=DB_MAX_PREPARED,
+)
 
-def getconn():
-    return connector.connect(
-        DB_INSTANCE,
-        "pg8000",
-        user=DB_USER,
-        password=DB_PASS,
-        db=DB_NAME,
-        ip_type=IPTypes.PUBLIC  
-    )
+engine = make_engine(
+    DATABASE_URL or "postgresql+pg8000://",
+    role="write",
+    creator=None if DATABASE_URL else getconn,
+    pool_size=DB_WRITE_POOL_SIZE,
+    max_overflow=DB_WRITE_MAX_OVERFLOW,
+    **_POOL_OPTIONS,
+)
 
-engine = create_engine(
-    "postgresql+pg8000://",
-    creator=getconn,
-    pool_size=5,
-    max_overflow=5,
-    pool_pre_ping=True,
-    pool_recycle=1800,
-    pool_timeout=30,
+READ_IS_REPLICA = bool(DATABASE_READ_URL or DB_READ_INSTANCE)
+if DATABASE_READ_URL:
+    _read_url, _read_creator = DATABASE_READ_URL, None
+elif DB_READ_INSTANCE:
+    _read_url, _read_creator = "postgresql+pg8000://", _cloud_sql_creator(DB_READ_INSTANCE)
+else:
+    _read_url, _read_creator = DATABASE_URL or "postgresql+pg8000://", None if DATABASE_URL else getconn
+
+read_engine = make_engine(
+    _read_url,
+    role="read",
+    creator=_read_creator,
+    pool_size=DB_READ_POOL_SIZE,
+    max_overflow=DB_READ_MAX_OVERFLOW,
+    **_POOL_OPTIONS,
 )
 
-with engine.begin() as conn:
-    conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id BIGSERIAL PRIMARY KEY,
-            client_message_id TEXT,
-            pubsub_message_id TEXT,
-            data TEXT NOT NULL,
-            source TEXT,
-            attributes JSONB,
-            publish_time TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-            is_duplicate BOOLEAN NOT NULL DEFAULT FALSE
-        );
-    """))
-
-
-with engine.begin() as conn:
-    conn.execute(text("""
-        CREATE INDEX IF NOT EXISTS idx_messages_client_message_id
-        ON messages(client_message_id);
-    """))
-
-    conn.execute(text("""
-        CREATE INDEX IF NOT EXISTS idx_messages_publish_time
-        ON messages(publish_time DESC);
-    """))
+if not SEARCH_TS_CONFIG.replace("_", "").isalpha():
+    raise RuntimeError(f"SEARCH_TS_CONFIG must be a text search config name, got {SEARCH_TS_CONFIG!r}")
+# full-text queries must spell this exactly as idx_messages_data_fts does
+DATA_TSV_SQL = f"to_tsvector('{SEARCH_TS_CONFIG}', data)"
 
+DATA_HASH_BACKFILL_CHUNK = int(os.environ.get("DATA_HASH_BACKFILL_CHUNK", "5000"))
 
-def start_sync_poll_loop():
-    sub = pubsub_v1.SubscriberClient(credentials=CREDS)
-    sub_path = sub.subscription_path(PROJECT_ID, SUB_PULL_ID)
-    print(f"[SYNC] starting sync poll loop on {sub_path}", flush=True)
+PARTITIONS = MessagePartitions(
+    engine,
+    interval=MESSAGES_PARTITION_INTERVAL,
+    premake=MESSAGES_PARTITION_PREMAKE,
+    retention_days=MESSAGES_RETENTION_DAYS,
+    archive_dir=MESSAGES_ARCHIVE_DIR,
+    log=lambda line: print(line, flush=True),
+)
 
-    def _loop():
-        global _LAST_PULL_AT
-        while True:
-            try:
-                resp = sub.pull(
-                    request={"subscription": sub_path, "max_messages": 10},
-                    retry=None,
-                    timeout=10,
+# per-source counts by minute/hour for /api/stats; every process flushes its
+# own deltas, so the flusher runs everywhere, not just on the puller leader
+ROLLUPS = MessageRollups(
+    engine,
+    flush_interval=ROLLUP_FLUSH_INTERVAL,
+    minute_retention_days=ROLLUP_MINUTE_RETENTION_DAYS,
+    log=lambda line: print(line, flush=True),
+)
+if SERVING:
+    ROLLUPS.start()
+atexit.register(ROLLUPS.stop)
+
+def migrate_schema():
+    """Create/upgrade the messages table and its indexes. Idempotent."""
+    if MESSAGES_PARTITION_INTERVAL and not PARTITIONS.is_partitioned(refresh=True):
+        with engine.begin() as conn:
+            exists = conn.execute(text("SELECT to_regclass('messages')")).scalar()
+            if exists is None:
+                PARTITIONS.create_table(conn)
+            else:
+                print("[MIGRATE] messages is not partitioned; run "
+                      "`flask --app backend.app partition-messages` to convert it", flush=True)
+    partitioned = PARTITIONS.is_partitioned(refresh=True)
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id BIGSERIAL PRIMARY KEY,
+                client_message_id TEXT,
+                pubsub_message_id TEXT,
+                data TEXT NOT NULL,
+                source TEXT,
+                attributes JSONB,
+                publish_time TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                is_duplicate BOOLEAN NOT NULL DEFAULT FALSE
+            );
+        """))
+
+    if partitioned:
+        # uniqueness lives in message_keys; these only serve lookups
+        with engine.begin() as conn:
+            PARTITIONS.create_keys_table(conn)
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_messages_client_message_id
+                ON messages(client_message_id);
+            """))
+        PARTITIONS.ensure_partitions()
+
+    with engine.begin() as conn:
+        # ON CONFLICT (client_message_id) needs a unique index to arbitrate on.
+        # Older deployments only had a plain index and may hold repeated IDs:
+        # keep the oldest row per ID, flag it duplicate (what the upsert would
+        # have done) and clear the ID on the later copies. The original ID is
+        # still in their attributes JSON.
+        has_unique = partitioned or conn.execute(text("""
+            SELECT 1 FROM pg_indexes
+            WHERE tablename = 'messages' AND indexname = 'uq_messages_client_message_id'
+        """)).first()
+        if not has_unique:
+            conn.execute(text("""
+                WITH d AS (
+                    SELECT client_message_id, MIN(id) AS keep_id
+                    FROM messages
+                    WHERE client_message_id IS NOT NULL
+                    GROUP BY client_message_id
+                    HAVING COUNT(*) > 1
+                ), keep AS (
+                    UPDATE messages m SET is_duplicate = TRUE
+                    FROM d WHERE m.id = d.keep_id
                 )
-                # mark attempted pull 
-                _LAST_PULL_AT = int(time.time())
+                UPDATE messages m
+                SET client_message_id = NULL, is_duplicate = TRUE
+                FROM d
+                WHERE m.client_message_id = d.client_message_id
+                  AND m.id <> d.keep_id
+            """))
+            conn.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_messages_client_message_id
+                ON messages(client_message_id);
+            """))
+            conn.execute(text("DROP INDEX IF EXISTS idx_messages_client_message_id"))
+
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_messages_publish_time
+            ON messages(publish_time DESC);
+        """))
+
+        # consumer-side ingest skips messages already stored under this id
+        if not partitioned:
+            conn.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_messages_pubsub_message_id
+                ON messages(pubsub_message_id);
+            """))
+
+        # keyset pagination: ORDER BY publish_time DESC, id DESC
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_messages_publish_time_id
+            ON messages(publish_time DESC, id DESC);
+        """))
+
+    # --- text search indexes ---
+    # substring search (data ILIKE '%q%') is served by a pg_trgm GIN index,
+    # ranked full-text search by a GIN index on DATA_TSV_SQL. Both are built
+    # CONCURRENTLY, since this runs at boot against a live table. Each step
+    # runs on its own so a missing extension privilege doesn't block startup.
+    for label, step in (
+        ("pg_trgm", lambda: _run_ddl("CREATE EXTENSION IF NOT EXISTS pg_trgm")),
+        ("idx_messages_data_trgm", lambda: _create_index_concurrently(
+            "idx_messages_data_trgm", "USING GIN (data gin_trgm_ops)")),
+        ("idx_messages_data_fts", lambda: _create_index_concurrently(
+            "idx_messages_data_fts", f"USING GIN ({DATA_TSV_SQL})")),
+        # the stored tsvector column it replaces; dropping it (and its index)
+        # only touches the catalog, but must not queue behind long readers
+        ("data_tsv", lambda: _run_ddl(
+            "ALTER TABLE messages DROP COLUMN IF EXISTS data_tsv", lock_timeout="5s")),
+    ):
+        try:
+            step()
+        except Exception as e:
+            print(f"[BOOT] search index step {label} skipped: {e!r}", flush=True)
+
+    # --- content-hash dedup ---
+    # data_hash = sha256(data) lets duplicate detection use an index instead of
+    # scanning every body. original_hash is set on the one row per text that
+    # counts as the original; it is separate from is_duplicate because a
+    # client-ID replay flags the replayed row without making its text new
+    # again. Its unique index is created once the backfill (migrate_data_hash)
+    # has filled in hashes for pre-existing rows.
+    with engine.begin() as conn:
+        conn.execute(text("""
+            ALTER TABLE messages ADD COLUMN IF NOT EXISTS data_hash TEXT;
+        """))
+        if not partitioned:
+            conn.execute(text("""
+                ALTER TABLE messages ADD COLUMN IF NOT EXISTS original_hash TEXT;
+            """))
 
-                if resp.received_messages:
-                    ack_ids = []
-                    for rm in resp.received_messages:
-                        m = rm.message
-                        item = {
-                            "data": m.data.decode("utf-8"),
-                            "attributes": dict(m.attributes or {}),
-                            "messageId": m.message_id,
-                            "publishTime": str(m.publish_time),
-                        }
-                        with RECENT_LOCK:
-                            RECENT.append(item)
-                        ack_ids.append(rm.ack_id)
-                    sub.acknowledge(request={"subscription": sub_path, "ack_ids": ack_ids})
-                    print(f"[SYNC] pulled {len(ack_ids)} msg(s), recent_len={len(RECENT)}", flush=True)
-                else:
-                    print("[SYNC] no messages in this cycle", flush=True)
-                    time.sleep(1)
-            except Exception as e:
-                print(f"[SYNC] poll error: {e!r}", flush=True)
-                time.sleep(2)
+    with engine.begin() as conn:
+        ROLLUPS.create_tables(conn)
+
+def _run_ddl(ddl: str, lock_timeout: str = None):
+    with engine.begin() as conn:
+        if lock_timeout:
+            conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        conn.execute(text(ddl))
+
+def _create_index_concurrently(name: str, using: str):
+    """CREATE INDEX CONCURRENTLY on messages; `using` follows ON messages.
+
+    A partitioned table gets the index ON ONLY the parent, built
+    concurrently on each partition that lacks it and attached. An invalid
+    leftover from an interrupted build is dropped and rebuilt.
+    """
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not PARTITIONS.is_partitioned():
+            _build_index_concurrently(conn, name, "messages", using)
+            return
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY messages {using}"))
+        for part in PARTITIONS.attached(conn):
+            has_child = conn.execute(text("""
+                SELECT 1 FROM pg_inherits i
+                JOIN pg_index x ON x.indexrelid = i.inhrelid
+                WHERE i.inhparent = CAST(:parent AS regclass) AND x.indrelid = CAST(:part AS regclass)
+            """), {"parent": name, "part": part}).first()
+            if has_child:
+                continue
+            child = f"{part}_{name.removeprefix('idx_messages_')}_idx"
+            _build_index_concurrently(conn, child, part, using)
+            conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+
+def _build_index_concurrently(conn, name: str, table: str, using: str):
+    valid = conn.execute(text("""
+        SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(CAST(:name AS TEXT))
+    """), {"name": name}).scalar()
+    if valid:
+        return
+    if valid is not None:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY {name} ON {table} {using}"))
+
+def _content_hash(data: str) -> str:
+    # must match encode(sha256(convert_to(data, 'UTF8')), 'hex') in SQL
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def migrate_data_hash(chunk_size: int = DATA_HASH_BACKFILL_CHUNK):
+    """Backfill messages.data_hash in chunks, then add the dedup index.
+
+    Each chunk is its own short transaction so the table is never locked
+    for the whole backfill. Safe to re-run.
+    """
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            n = conn.execute(text("""
+                UPDATE messages
+                SET data_hash = encode(sha256(convert_to(data, 'UTF8')), 'hex')
+                WHERE id IN (
+                    SELECT id FROM messages
+                    WHERE data_hash IS NULL
+                    ORDER BY id
+                    LIMIT :n
+                )
+            """), {"n": chunk_size}).rowcount
+        total += n
+        if n < chunk_size:
+            break
+    print(f"[MIGRATE] data_hash backfilled {total} row(s)", flush=True)
+    if PARTITIONS.is_partitioned():
+        # one original per text is enforced by message_keys.original_hash
+        return
+
+    with engine.begin() as conn:
+        # legacy rows may have more than one "original" per text; keep the oldest
+        conn.execute(text("""
+            UPDATE messages m
+            SET is_duplicate = TRUE
+            FROM (
+                SELECT data_hash, MIN(id) AS keep_id
+                FROM messages
+                WHERE NOT is_duplicate AND data_hash IS NOT NULL
+                GROUP BY data_hash
+                HAVING COUNT(*) > 1
+            ) d
+            WHERE m.data_hash = d.data_hash
+              AND NOT m.is_duplicate
+              AND m.id <> d.keep_id
+        """))
+        conn.execute(text("""
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_messages_original_hash
+            ON messages(original_hash);
+        """))
+        # the oldest row per text is the original, whatever its is_duplicate
+        conn.execute(text("""
+            UPDATE messages m
+            SET original_hash = o.data_hash
+            FROM (
+                SELECT data_hash, MIN(id) AS id
+                FROM messages
+                WHERE data_hash IS NOT NULL
+                GROUP BY data_hash
+            ) o
+            WHERE m.id = o.id
+              AND m.original_hash IS NULL
+              AND NOT EXISTS (SELECT 1 FROM messages x WHERE x.original_hash = o.data_hash)
+        """))
+        conn.execute(text("DROP INDEX IF EXISTS uq_messages_data_hash_original"))
+    print("[MIGRATE] uq_messages_original_hash ready", flush=True)
+
+# a /readyz retry re-runs the warm-up: the schema migration runs once per
+# process and the backfill thread is only started when none is running
+SCHEMA_MIGRATED = threading.Event()
+DATA_HASH_MIGRATED = threading.Event()
+_MIGRATE_LOCK = threading.Lock()
+_data_hash_thread = None
+
+def _migrate_data_hash_bg():
+    try:
+        migrate_data_hash()
+        DATA_HASH_MIGRATED.set()
+    except Exception as e:
+        print(f"[MIGRATE] data_hash migration failed: {e!r}", flush=True)
+
+def _migrate_schema_once():
+    with _MIGRATE_LOCK:
+        if not SCHEMA_MIGRATED.is_set():
+            migrate_schema()
+            SCHEMA_MIGRATED.set()
+
+def _start_data_hash_migration():
+    global _data_hash_thread
+    with _MIGRATE_LOCK:
+        if DATA_HASH_MIGRATED.is_set() or (_data_hash_thread is not None and _data_hash_thread.is_alive()):
+            return
+        _data_hash_thread = threading.Thread(target=_migrate_data_hash_bg, name="migrate-data-hash", daemon=True)
+        _data_hash_thread.start()
+
+# started by the boot warm-up (or `flask migrate`) once the column exists
+MIGRATE_DATA_HASH_ON_BOOT = os.environ.get("MIGRATE_DATA_HASH_ON_BOOT", "1") == "1"
+
+
+def _pulled_item(m) -> dict:
+    return {
+        "data": m.data.decode("utf-8"),
+        "attributes": dict(m.attributes or {}),
+        "messageId": m.message_id,
+        "publishTime": str(m.publish_time),
+    }
+
+# pull-loop events: emit() only queues; the writer thread does the I/O
+EVENTS = EventLog(
+    sys.stdout,
+    policies=LOG_EVENT_POLICIES,
+    queue_size=LOG_QUEUE_SIZE,
+    report_interval=LOG_SUPPRESSED_REPORT_INTERVAL,
+)
+if SERVING:
+    EVENTS.start()
+atexit.register(EVENTS.stop)
+
+def _ingest_stored(rows):
+    _bump_messages_version()
+    ROLLUPS.record_rows(rows)
+
+def _start_ingest_sink(on_commit, on_failed=None):
+    """Start the consumer-side DB writer, or return None if INGEST_TO_DB is off."""
+    global INGEST_SINK
+    if not INGEST_TO_DB:
+        return None
+    INGEST_SINK = IngestSink(
+        engine,
+        on_commit,
+        batch_size=INGEST_BATCH_SIZE,
+        flush_interval=INGEST_FLUSH_INTERVAL,
+        method=INGEST_METHOD,
+        on_failed=on_failed,
+        on_stored=_ingest_stored,
+        partitioned=PARTITIONS.is_partitioned,
+        log=EVENTS.logger("ingest"),
+    )
+    INGEST_SINK.start()
+    return INGEST_SINK
+
+def start_sync_poll_loop():
+    global SYNC_PULLER
+    sub = PUBSUB.subscriber()
+    sub_path = sub.subscription_path(PROJECT_ID, SUB_PULL_ID)
+    EVENTS.emit("sync.start", subscription=sub_path)
 
-    threading.Thread(target=_loop, daemon=True).start()
-    print("[SYNC] thread started", flush=True)
+    def _on_pull(n):
+        global _LAST_PULL_AT
+        # mark attempted pull 
+        _LAST_PULL_AT = int(time.time())
+        metrics.PULL_BATCH_SIZE.observe(n)
+        if not n:
+            metrics.PULL_IDLE_CYCLES.inc()
+        if n:
+            EVENTS.emit("sync.pull", n=n, recent_len=len(RECENT))
+        else:
+            EVENTS.emit("sync.idle")
+
+    def _on_ack(n, seconds):
+        metrics.PULL_ACK_SECONDS.observe(seconds)
+        metrics.PULL_ACKED.inc(n)
+
+    # bound to this puller: the sink's last flush can run after SYNC_PULLER is cleared
+    sink = _start_ingest_sink(lambda ack_ids: puller.ack(ack_ids))
+
+    def _on_message(m, ack_id=None):
+        _record_received(_pulled_item(m))
+        if sink is not None:
+            # acked by the sink once the row is committed
+            sink.add(row_from_message(m), ack_id)
+
+    SYNC_PULLER = puller = AdaptivePuller(
+        sub,
+        sub_path,
+        _on_message,
+        manual_ack=sink is not None,
+        streams=SYNC_PULL_STREAMS,
+        min_batch=SYNC_PULL_MIN_BATCH,
+        max_batch=SYNC_PULL_MAX_BATCH,
+        ack_batch=SYNC_ACK_BATCH,
+        ack_interval=SYNC_ACK_INTERVAL,
+        idle_backoff_max=SYNC_IDLE_BACKOFF_MAX,
+        on_pull=_on_pull,
+        on_ack=_on_ack,
+        log=EVENTS.logger("sync.puller"),
+    )
+    SYNC_PULLER.start()
+    EVENTS.emit("sync.started", streams=SYNC_PULL_STREAMS)
 
 def die(msg: str):
     print(f"[FATAL] {msg}", file=sys.stderr, flush=True)
@@ -149,66 +704,172 @@ def _now_iso():
 
 # Flask
 app = Flask(__name__)
-CORS(app)  
-# Publisher + topic path
-try:
-    publisher = pubsub_v1.PublisherClient(credentials=CREDS)
-    topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
-    print(f"[BOOT] topic_path={topic_path}", flush=True)
-    # Verify topic exists 
-    admin_pub = pubsub_v1.PublisherClient(credentials=CREDS)
-    admin_pub.get_topic(request={"topic": topic_path})
+CORS(app, expose_headers=["ETag"], max_age=CORS_MAX_AGE)
+# Publisher + topic path (the path is plain string formatting, no client needed)
+topic_path = pubsub_v1.PublisherClient.topic_path(PROJECT_ID, TOPIC_ID)
+print(f"[BOOT] topic_path={topic_path}", flush=True)
+
+# One publisher and one subscriber per process, shared by the publish
+# routes, pull loops and debug endpoints; closed when the worker exits.
+PUBSUB = PubSubClients(
+    credentials=CREDS.resolve,
+    batch_settings=pubsub_v1.types.BatchSettings(
+        max_messages=PUBLISH_BATCH_MAX_MESSAGES,
+        max_bytes=PUBLISH_BATCH_MAX_BYTES,
+        max_latency=PUBLISH_BATCH_MAX_LATENCY,
+    ),
+    keepalive_ms=PUBSUB_KEEPALIVE_MS,
+    keepalive_timeout_ms=PUBSUB_KEEPALIVE_TIMEOUT_MS,
+    keepalive_without_calls=PUBSUB_KEEPALIVE_WITHOUT_CALLS,
+    extra_options=PUBSUB_CHANNEL_OPTIONS,
+    log=lambda line: print(line, flush=True),
+)
+atexit.register(PUBSUB.close)
+
+publisher = _Lazy("publisher", PUBSUB.publisher)
+
+def _verify_topic():
+    # a missing topic is logged and reported, as before lazy init; it must
+    # not keep /readyz failing, since that leaves the service never ready
+    try:
+        publisher.get_topic(request={"topic": topic_path})
+    except NotFound:
+        print(f"[BOOT] TOPIC NOT FOUND: {topic_path}", flush=True)
+        with BOOT_LOCK:
+            BOOT_STATE["degraded"]["topic"] = f"not found: {topic_path}"
+        return
     print(f"[BOOT] Verified topic exists: {topic_path}", flush=True)
-except NotFound:
-    print(f"[BOOT] TOPIC NOT FOUND: {topic_path}", flush=True)
-except Exception as e:
-    die(f"Failed to init PublisherClient/topic_path: {e!r}")
+    with BOOT_LOCK:
+        BOOT_STATE["degraded"].pop("topic", None)
 
 # In-memory ring buffer for UI 
-RECENT = collections.deque(maxlen=2000)
+# With RECENT_SHM_PATH set it lives in a shared mmap ring instead, so every
+# gunicorn worker sees what the (single) puller leader received.
+if RECENT_SHM_PATH:
+    RECENT = SharedRing(RECENT_SHM_PATH, slots=2000, slot_size=RECENT_SHM_SLOT_SIZE)
+else:
+    RECENT = collections.deque(maxlen=2000)
 RECENT_LOCK = threading.Lock()
+if PULLER_LEADER_LOCK != "none" and not RECENT_SHM_PATH and SERVING:
+    # only the leader pulls, so without the shared ring every other worker
+    # serves an empty RECENT and an /api/stream that never sends anything
+    print(f"[BOOT] WARNING: PULLER_LEADER_LOCK={PULLER_LEADER_LOCK} without RECENT_SHM_PATH: "
+          "only the puller leader's worker has recent messages and a live feed", flush=True)
+
+@metrics.add_sampler
+def _sample_recent():
+    metrics.RECENT_ITEMS.set(len(RECENT))
+    metrics.RECENT_CAPACITY.set(RECENT.maxlen)
+
+# --- live feed for /api/stream ---
+class StreamHub:
+    """Fans received messages out to every connected /api/stream client.
+
+    Each client gets its own bounded queue. A client that falls behind is
+    cut off rather than slowing down the puller; its EventSource reconnects
+    with Last-Event-ID and resumes from `history`.
+    """
+
+    def __init__(self, history: int, client_queue: int):
+        self.client_queue = client_queue
+        self._history = collections.deque(maxlen=history)
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.published = 0
+        self.slow_disconnects = 0
+        self.refused = 0
+
+    def publish(self, item: dict):
+        with self._lock:
+            event = (self._next_id, item)
+            self._next_id += 1
+            self._history.append(event)
+            clients = list(self._clients)
+            self.published += 1
+        for client in clients:
+            try:
+                client.queue.put_nowait(event)
+            except queue.Full:
+                if not client.lagging:
+                    client.lagging = True
+                    with self._lock:
+                        self.slow_disconnects += 1
+
+    def subscribe(self, last_event_id=None, max_clients=None):
+        """Register a client, or return None when max_clients are connected."""
+        client = _StreamClient(self.client_queue)
+        with self._lock:
+            if max_clients is not None and len(self._clients) >= max_clients:
+                self.refused += 1
+                return None
+            if last_event_id is not None:
+                oldest = self._history[0][0] if self._history else self._next_id
+                # gap since the client's last event is gone from history
+                client.reset = last_event_id < oldest - 1 or last_event_id >= self._next_id
+                backlog = [e for e in self._history if e[0] > last_event_id]
+                for event in backlog[-self.client_queue:]:
+                    client.queue.put_nowait(event)
+            self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "history": len(self._history),
+                "last_event_id": self._next_id - 1,
+                "published": self.published,
+                "slow_disconnects": self.slow_disconnects,
+                "refused": self.refused,
+            }
+
+class _StreamClient:
+    def __init__(self, maxsize: int):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lagging = False
+        self.reset = False
+
+STREAM_HUB = StreamHub(STREAM_HISTORY, STREAM_CLIENT_QUEUE)
+
+def _record_received(item: dict) -> bool:
+    # every pulled message goes through here: UI buffer + live feed.
+    # The shared ring has a single writer, the puller leader; other workers
+    # (debug pulls) skip it. Returns whether the item was recorded.
+    if RECENT_SHM_PATH and not PULLER_IS_LEADER:
+        return False
+    with RECENT_LOCK:
+        RECENT.append(item)
+    if not RECENT_SHM_PATH:
+        STREAM_HUB.publish(item)
+    return True
+
+def _tail_shared_recent():
+    # each worker feeds its own /api/stream clients from the shared ring
+    last = RECENT.seq
+    while True:
+        for seq, item in RECENT.since(last):
+            STREAM_HUB.publish(item)
+            last = seq
+        time.sleep(0.1)
+
+if RECENT_SHM_PATH and SERVING:
+    threading.Thread(target=_tail_shared_recent, name="recent-tail", daemon=True).start()
+
 # --- Puller thread guards ---
 SYNC_THREAD_STARTED = False
-SUBSCRIBER = pubsub_v1.SubscriberClient(credentials=CREDS)
+SUBSCRIBER = _Lazy("subscriber", PUBSUB.subscriber)
 SUB_FUTURE = None
 
-from better_profanity import profanity
-import regex as re, unicodedata as ud
+from backend.moderation import ModerationEngine
 
 # --- profanity helpers  ---
-profanity.load_censor_words()
-_extra = [w.strip() for w in os.getenv("PROFANITY_EXTRA_WORDS","").split(",") if w.strip()]
-_white = [w.strip() for w in os.getenv("PROFANITY_WHITELIST","").split(",") if w.strip()]
-if _extra: profanity.add_censor_words(_extra)
-for w in _white: profanity.remove_word(w)
-
-def _norm(t: str) -> str:
-    t = ud.normalize("NFKC", t)
-
-    # --- basic leetspeak normalization ---
-    t = re.sub(r"[@4]", "a", t, flags=re.I)
-    t = re.sub(r"[!1|]", "i", t, flags=re.I)
-    t = re.sub(r"[$5]", "s", t, flags=re.I)
-    t = re.sub(r"[0]", "o", t, flags=re.I)
-    t = re.sub(r"[3]", "e", t, flags=re.I)
-
-    # collapse 3+ repeated characters 
-    t = re.sub(r"(.)\1{2,}", r"\1\1", t)
-
-    t = re.sub(
-        r"\b([a-z]{3,})[\W_]*\1\b",
-        r"\1 \1",
-        t,
-        flags=re.I
-    )
-
-    return t
-
-def contains_bad(t: str) -> bool:
-    return profanity.contains_profanity(_norm(t))
-
-def mask_text(t: str) -> str:
-    return profanity.censor(_norm(t), censor_char="*")
+# word list + PROFANITY_EXTRA_WORDS - PROFANITY_WHITELIST, compiled once
+MODERATION = _Lazy("moderation", ModerationEngine.from_env)
 
 
 # -----------------------------
@@ -218,10 +879,37 @@ def mask_text(t: str) -> str:
 def index():
     return "backend is running", 200
 
+@app.route("/metrics")
+def metrics_route():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route("/healthz")
 def healthz():
+    # liveness only: the process is up and serving; see /readyz for deps
     return "ok", 200
 
+@app.route("/readyz")
+def readyz():
+    with BOOT_LOCK:
+        state = {**BOOT_STATE, "errors": dict(BOOT_STATE["errors"]), "degraded": dict(BOOT_STATE["degraded"])}
+    if not state["ready"] and not state["warming"]:
+        # a failed warm-up is retried rather than leaving the worker unready
+        _start_warm_up()
+    return jsonify(state), 200 if state["ready"] else 503
+
+@app.route("/_debug/startup")
+def debug_startup():
+    with BOOT_LOCK:
+        phases = dict(BOOT_PHASES)
+        state = {**BOOT_STATE, "errors": dict(BOOT_STATE["errors"]), "degraded": dict(BOOT_STATE["degraded"])}
+    return jsonify({
+        "lazy_init": LAZY_INIT,
+        "migrate_on_boot": MIGRATE_ON_BOOT,
+        **state,
+        "phases": phases,
+    }), 200
+
 @app.route("/debug/env")
 def debug_env():
     return jsonify({
@@ -238,15 +926,42 @@ def debug_state():
         "use_sync_poll": USE_SYNC_POLL,
         "recent_len": len(RECENT),
         "last_pull_at": _LAST_PULL_AT,
+        "puller_leader": PULLER_IS_LEADER,
+        "sync_pull": SYNC_PULLER.stats() if SYNC_PULLER is not None else None,
+        "ingest": INGEST_SINK.stats() if INGEST_SINK is not None else None,
+        "pubsub_clients": PUBSUB.stats(),
+        "event_log": EVENTS.stats(),
+        "partitions": PARTITIONS.stats(),
+        "export": EXPORTER.stats(),
+        "rollups": ROLLUPS.stats(),
+        "db_pools": {"write": pool_stats(engine), "read": pool_stats(read_engine)},
         "topic": TOPIC_ID,
         "subscription": SUB_PULL_ID,
         "project": PROJECT_ID,
+        "publish": dict(PUBLISH_STATS),
+        "client_id_cache": CLIENT_ID_CACHE.stats(),
+        "moderation_cache": _moderation_cache_stats(),
+        "count_cache": COUNT_CACHE.stats(),
+    }), 200
+
+@app.route("/_debug/cache")
+def debug_cache():
+    with RESPONSE_CACHE_LOCK:
+        served = dict(RESPONSE_CACHE_STATS)
+    return jsonify({
+        "messages_version": _messages_version(),
+        "response_cache": RESPONSE_CACHE.stats(),
+        "responses": served,
+        "count_cache": COUNT_CACHE.stats(),
+        "client_id_cache": CLIENT_ID_CACHE.stats(),
+        "moderation_cache": _moderation_cache_stats(),
+        "stream": {**STREAM_HUB.stats(), "max_clients": STREAM_MAX_CLIENTS},
     }), 200
 
 @app.route("/_debug/subscription_info")
 def debug_subscription_info():
     try:
-        sub = pubsub_v1.SubscriberClient(credentials=CREDS)
+        sub = PUBSUB.subscriber()
         sub_path = sub.subscription_path(PROJECT_ID, SUB_PULL_ID)
         info = sub.get_subscription(request={"subscription": sub_path})
         return {
@@ -276,136 +991,745 @@ def debug_publish():
 def debug_pull_once():
     # Pull a few messages immediately and append them to RECENT
     try:
-        sub = pubsub_v1.SubscriberClient(credentials=CREDS)
+        sub = PUBSUB.subscriber()
         sub_path = sub.subscription_path(PROJECT_ID, SUB_PULL_ID)
         resp = sub.pull(subscription=sub_path, max_messages=5, retry=None, timeout=120)
         out = []
+        recorded = 0
         for rm in resp.received_messages:
-            m = rm.message
-            item = {
-                "data": m.data.decode("utf-8"),
-                "attributes": dict(m.attributes or {}),
-                "messageId": m.message_id,
-                "publishTime": str(m.publish_time),
-            }
+            item = _pulled_item(rm.message)
             out.append(item)
-            RECENT.append(item)
+            recorded += _record_received(item)
         if resp.received_messages:
             sub.acknowledge(subscription=sub_path, ack_ids=[rm.ack_id for rm in resp.received_messages])
-        return {"pulled": out, "recent_len": len(RECENT)}, 200
+        return {"pulled": out, "recorded": recorded, "recent_len": len(RECENT)}, 200
     except NotFound:
         return {"error": "subscription not found", "subscription": SUB_PULL_ID}, 404
     except Exception as e:
         return {"error": "pull_once failed", "details": str(e)}, 500
 
-@app.route("/publish", methods=["POST"])
-def publish_route():
-    payload = request.get_json(silent=True) or {}
-    raw = (payload.get("data") or payload.get("message") or "").strip()
-    attrs = payload.get("attributes") or {}
-    client_id_raw = (attrs.get("messageId") or "").strip()
+# -----------------------------
+# Publish pipeline
+# -----------------------------
+# Pub/Sub acks and DB writes finish on these threads so /publish doesn't
+# hold the (sync) gunicorn worker for a full round trip.
+PUBLISH_EXECUTOR = ThreadPoolExecutor(max_workers=PUBLISH_DB_WORKERS, thread_name_prefix="publish-db")
+PUBLISH_STATS = {"accepted": 0, "replays": 0, "acked": 0, "stored": 0, "pubsub_errors": 0, "db_errors": 0}
+PUBLISH_STATS_LOCK = threading.Lock()
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < now:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+# --- change tracking ---
+# Bumped on every write to `messages`; read-side caches remember the version
+# they were computed at and treat any newer write as an invalidation. With
+# RECENT_SHM_PATH the counter lives in the shared ring's header, so a write
+# on one worker invalidates every worker's caches.
+MESSAGES_VERSION = 0
+MESSAGES_VERSION_LOCK = threading.Lock()
+MESSAGES_CHANGED_AT = 0.0  # monotonic time of the last local write
+
+def _messages_version() -> int:
+    return RECENT.version if RECENT_SHM_PATH else MESSAGES_VERSION
+
+def _bump_messages_version():
+    global MESSAGES_VERSION, MESSAGES_CHANGED_AT
+    with MESSAGES_VERSION_LOCK:
+        if RECENT_SHM_PATH:
+            RECENT.bump_version()
+        else:
+            MESSAGES_VERSION += 1
+        MESSAGES_CHANGED_AT = time.monotonic()
+
+def _replica_may_lag() -> bool:
+    """True while a replica might not have our latest write yet; don't cache reads from it."""
+    return READ_IS_REPLICA and time.monotonic() - MESSAGES_CHANGED_AT < DB_REPLICA_LAG_GRACE
+
+# Recently stored client_message_ids. Producers replay the same IDs after
+# timeouts; a hit here answers the replay without Pub/Sub or a DB round trip.
+CLIENT_ID_CACHE = TTLCache(CLIENT_ID_CACHE_SIZE, CLIENT_ID_CACHE_TTL)
+
+def _remember_client_id(client_id, row_id, pubsub_id):
+    if client_id and row_id is not None:
+        CLIENT_ID_CACHE.put(client_id, {
+            "row_id": row_id,
+            "pubsub_message_id": pubsub_id,
+            "mark_queued": False,
+        })
+
+_MARK_LOCK = threading.Lock()
 
+def _mark_duplicate(seen):
+    # same effect the ON CONFLICT upsert has on a replayed ID
+    with _MARK_LOCK:
+        # replays from here on need another UPDATE to move publish_time
+        seen["mark_queued"] = False
+    row_id = seen["row_id"]
+    try:
+        with engine.begin() as conn:
+            conn.execute(hot("""
+                UPDATE messages
+                SET is_duplicate = TRUE, publish_time = NOW()
+                WHERE id = :id
+            """), {"id": row_id})
+            if PARTITIONS.is_partitioned():
+                conn.execute(hot("""
+                    UPDATE message_keys SET publish_time = NOW() WHERE id = :id
+                """), {"id": row_id})
+        _bump_messages_version()
+    except Exception as e:
+        print(f"[PUBLISH] mark duplicate failed row_id={row_id}: {e!r}", flush=True)
+
+# Moderation results by content: producers send many identical/templated
+# bodies. Keyed by the raw text's hash and the word-list version, so a
+# different extra/whitelist set never reads another set's results.
+MODERATION_CACHE = TTLCache(MODERATION_CACHE_SIZE, MODERATION_CACHE_TTL)
+MODERATION_CACHE_MAX_CHARS = 16 * 1024  # bigger bodies aren't worth pinning
+MODERATION_STATS = {"cpu_seconds": 0.0, "saved_cpu_seconds": 0.0}
+MODERATION_STATS_LOCK = threading.Lock()
+
+def moderate(t: str):
+    """(flagged, text to publish) -- masked if flagged, raw otherwise."""
+    with metrics.MODERATION_SECONDS.time():
+        return _moderate(t)
+
+def _moderate(t: str):
+    if len(t) > MODERATION_CACHE_MAX_CHARS:
+        return MODERATION.moderate(t)
+    key = (MODERATION.version, hashlib.sha256(t.encode("utf-8")).digest())
+    hit = MODERATION_CACHE.get(key)
+    if hit is not None:
+        flagged, to_send, cost = hit
+        with MODERATION_STATS_LOCK:
+            MODERATION_STATS["saved_cpu_seconds"] += cost
+        return flagged, to_send if flagged else t
+    t0 = time.perf_counter()
+    flagged, to_send = MODERATION.moderate(t)
+    cost = time.perf_counter() - t0
+    with MODERATION_STATS_LOCK:
+        MODERATION_STATS["cpu_seconds"] += cost
+    # unflagged results are the raw text itself; don't keep a second copy
+    MODERATION_CACHE.put(key, (flagged, to_send if flagged else None, cost))
+    return flagged, to_send if flagged else t
+
+def _moderation_cache_stats() -> dict:
+    with MODERATION_STATS_LOCK:
+        spent = MODERATION_STATS["cpu_seconds"]
+        saved = MODERATION_STATS["saved_cpu_seconds"]
+    return {
+        **MODERATION_CACHE.stats(),
+        "wordlist_version": MODERATION.version,
+        "cpu_seconds": round(spent, 6),
+        "saved_cpu_seconds": round(saved, 6),
+    }
+
+def _replayed(client_id, source=None, flagged=False):
+    """Return the cached row for a replayed client ID, or None on a miss."""
+    seen = CLIENT_ID_CACHE.get(client_id)
+    if seen is None:
+        return None
+    # every replay flags the row and bumps its publish_time, as the upsert
+    # did, but off the request path; replays that arrive while an UPDATE is
+    # still queued share it
+    with _MARK_LOCK:
+        queue_mark = not seen["mark_queued"]
+        seen["mark_queued"] = True
+    if queue_mark:
+        PUBLISH_EXECUTOR.submit(_mark_duplicate, seen)
+    _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "replays")
+    # answered as a stored duplicate, so counted like one
+    ROLLUPS.record(source, duplicate=True, flagged=flagged)
+    return seen
+
+def _bump(stats: dict, lock, key: str, n: int = 1):
+    with lock:
+        stats[key] = stats.get(key, 0) + n
+
+def _truthy(val) -> bool:
+    return str(val).strip().lower() in ("1", "true", "yes", "on")
+
+def _insert_message_sql(client_id) -> str:
+    # A row is a text duplicate when a row with original_hash = its data_hash
+    # already exists; that lookup is a single index probe and earlier rows
+    # are never rewritten. Otherwise it becomes that text's original.
+    client_sql = ":client_message_id" if client_id else "NULL"
+    if PARTITIONS.is_partitioned():
+        return keyed_insert_sql(f"""
+            SELECT CAST({client_sql} AS TEXT) AS client_message_id,
+                   CAST(:pubsub_message_id AS TEXT) AS pubsub_message_id,
+                   CAST(:data AS TEXT) AS data, CAST(:data_hash AS TEXT) AS data_hash,
+                   CAST(:source AS TEXT) AS source, CAST(:attributes AS JSONB) AS attributes,
+                   NOW() AS publish_time, FALSE AS dup
+        """, replay=True)
+    # a replay flags the existing row but leaves its original_hash alone; the
+    # same Pub/Sub message already written by the ingest sink is left as is
+    # and returns nothing (see _INGESTED_ROW_SQL)
+    conflict_sql = """
+        ON CONFLICT (client_message_id)
+        DO UPDATE SET
+            is_duplicate = TRUE,
+            publish_time = EXCLUDED.publish_time
+        WHERE messages.pubsub_message_id IS DISTINCT FROM EXCLUDED.pubsub_message_id
+    """ if client_id else ""
+    return f"""
+        INSERT INTO messages (
+            client_message_id, pubsub_message_id, data, data_hash, source,
+            attributes, publish_time, is_duplicate, original_hash
+        )
+        SELECT {client_sql}, :pubsub_message_id, :data, :data_hash, :source,
+               CAST(:attributes AS JSONB), NOW(),
+               o.taken, CASE WHEN o.taken THEN NULL ELSE CAST(:data_hash AS TEXT) END
+        FROM (
+            SELECT EXISTS (
+                SELECT 1 FROM messages WHERE original_hash = :data_hash
+            ) AS taken
+        ) o
+        {conflict_sql}
+        RETURNING id, is_duplicate
+    """
+
+# The ingest sink also consumes this app's own publishes and may store one
+# before the publish path does. That row is this message, not a replay.
+_INGESTED_ROW_SQL = """
+    SELECT id, is_duplicate FROM messages
+    WHERE client_message_id = :client_message_id
+      AND pubsub_message_id = :pubsub_message_id
+"""
+
+def _insert_message_params(client_id, pubsub_id, to_send, source, attrs) -> dict:
+    return {
+        "client_message_id": client_id,
+        "pubsub_message_id": pubsub_id,
+        "data": to_send,
+        "data_hash": _content_hash(to_send),
+        "source": source,
+        "attributes": json.dumps(attrs),
+    }
+
+def _message_stored(client_id, pubsub_id, row, source=None, flagged=False, ingested=False):
+    """Bookkeeping after an insert commits. Returns (row_id, is_duplicate).
+
+    ingested: the row was written by the ingest sink, which already counted it.
+    """
+    row_id = row.id if row else None
+    is_dup = bool(row.is_duplicate) if row else False
+    _bump_messages_version()
+    _remember_client_id(client_id, row_id, pubsub_id)
+    if row and not ingested:
+        ROLLUPS.record(source, duplicate=is_dup, flagged=flagged)
+    return row_id, is_dup
+
+def _store_message(client_id, pubsub_id, to_send, source, attrs, flagged=False):
+    """Insert one published message and run duplicate detection.
+
+    Returns (row_id, is_duplicate).
+    """
+    sql = hot(_insert_message_sql(client_id))
+    params = _insert_message_params(client_id, pubsub_id, to_send, source, attrs)
+    for attempt in range(2):
+        try:
+            with metrics.DB_TX_SECONDS.time(), engine.begin() as conn:
+                row = conn.execute(sql, params).first()
+                ingested = row is None
+                if ingested:
+                    row = conn.execute(text(_INGESTED_ROW_SQL), params).first()
+            break
+        except IntegrityError:
+            # another request inserted the same text as an original between
+            # our EXISTS check and the insert; the retry will see it
+            if attempt:
+                raise
+    return _message_stored(client_id, pubsub_id, row, source, flagged, ingested)
+
+def _client_id_error(client_id_raw: str):
+    """Return a validation message for a client message ID, or None if it's fine."""
     # 1) Require a Message ID
     if not client_id_raw:
-        return jsonify({"error": "Message ID is required."}), 400
+        return "Message ID is required."
 
     # 2) Enforce numeric-only
     if not client_id_raw.isdigit():
-        return jsonify({"error": "Message ID must contain only numbers."}), 400
+        return "Message ID must contain only numbers."
 
     # 3) Put length cap
     if len(client_id_raw) > 18:
-        return jsonify({"error": "Message ID is too long."}), 400
+        return "Message ID is too long."
 
-    client_id = client_id_raw
-    source = (attrs.get("source") or "").strip() or None
+    return None
 
+def _store_messages_bulk(rows):
+    """Insert many published messages with one multi-row upsert.
 
-    # profanity handling
-    flagged = contains_bad(raw)
-    to_send = mask_text(raw) if flagged else raw
+    rows: list of dicts with client_message_id, pubsub_message_id, data,
+    source, attributes. client_message_id must be unique within rows.
+    Returns {client_message_id: (row_id, is_duplicate, ingested)}; ingested
+    rows were already written (and counted) by the ingest sink.
+    """
+    partitioned = PARTITIONS.is_partitioned()
+    values = []
+    params: dict[str, object] = {}
+    seen_hashes = set()
+    for i, r in enumerate(rows):
+        h = _content_hash(r["data"])
+        # on a partitioned table message_keys decides which rows are originals;
+        # the VALUES list feeds a CTE there, so untyped params would become text
+        is_dup = f"CAST(:dup{i} AS BOOLEAN)" if partitioned else (
+            f":dup{i} OR EXISTS (SELECT 1 FROM messages WHERE original_hash = :hash{i})"
+        )
+        values.append(
+            f"(:cid{i}, :pid{i}, :data{i}, :hash{i}, :source{i}, CAST(:attrs{i} AS JSONB), NOW(), {is_dup})"
+        )
+        params[f"cid{i}"] = r["client_message_id"]
+        params[f"pid{i}"] = r["pubsub_message_id"]
+        params[f"data{i}"] = r["data"]
+        params[f"hash{i}"] = h
+        params[f"source{i}"] = r["source"]
+        params[f"attrs{i}"] = json.dumps(r["attributes"])
+        # the EXISTS checks can't see rows from this same statement, so the
+        # second copy of a text inside the batch is marked here
+        params[f"dup{i}"] = h in seen_hashes
+        seen_hashes.add(h)
+
+    if partitioned:
+        sql = keyed_insert_sql(f"""
+            SELECT * FROM (VALUES {", ".join(values)}) AS v (
+                client_message_id, pubsub_message_id, data, data_hash, source,
+                attributes, publish_time, dup
+            )
+        """, replay=True)
+    else:
+        sql = f"""
+            INSERT INTO messages (
+                client_message_id, pubsub_message_id, data, data_hash, source,
+                attributes, publish_time, is_duplicate, original_hash
+            )
+            SELECT v.*, CASE WHEN v.is_duplicate THEN NULL ELSE v.data_hash END
+            FROM (VALUES {", ".join(values)}) AS v (
+                client_message_id, pubsub_message_id, data, data_hash, source,
+                attributes, publish_time, is_duplicate
+            )
+            ON CONFLICT (client_message_id)
+            DO UPDATE SET
+                is_duplicate = TRUE,
+                publish_time = EXCLUDED.publish_time
+            WHERE messages.pubsub_message_id IS DISTINCT FROM EXCLUDED.pubsub_message_id
+            RETURNING id, client_message_id, is_duplicate
+        """
+
+    for attempt in range(2):
+        try:
+            with metrics.DB_TX_SECONDS.time(), engine.begin() as conn:
+                result = conn.execute(text(sql), params)
+                out = {r.client_message_id: (r.id, bool(r.is_duplicate), False) for r in result.fetchall()}
+                out.update(_ingested_rows(conn, [r for r in rows if r["client_message_id"] not in out]))
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+
+    _bump_messages_version()
+    pubsub_ids = {r["client_message_id"]: r["pubsub_message_id"] for r in rows}
+    for cid, (row_id, _, _) in out.items():
+        _remember_client_id(cid, row_id, pubsub_ids.get(cid))
+    return out
+
+def _ingested_rows(conn, rows) -> dict:
+    # bulk form of _INGESTED_ROW_SQL for rows the upsert returned nothing for
+    if not rows:
+        return {}
+    pubsub_ids = {r["client_message_id"]: r["pubsub_message_id"] for r in rows}
+    found = conn.execute(text("""
+        SELECT id, client_message_id, pubsub_message_id, is_duplicate FROM messages
+        WHERE client_message_id = ANY(CAST(:cids AS TEXT[]))
+    """), {"cids": list(pubsub_ids)})
+    return {
+        r.client_message_id: (r.id, bool(r.is_duplicate), True)
+        for r in found if pubsub_ids.get(r.client_message_id) == r.pubsub_message_id
+    }
+
+def _finish_publish(future, client_id, to_send, source, attrs, flagged=False):
+    # runs on the publisher's callback thread once Pub/Sub answers
+    try:
+        pubsub_id = future.result()
+    except Exception as e:
+        _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "pubsub_errors")
+        print(f"[PUBLISH] pubsub publish failed client_message_id={client_id}: {e!r}", flush=True)
+        return
+    _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "acked")
+
+    def _persist():
+        try:
+            _store_message(client_id, pubsub_id, to_send, source, attrs, flagged)
+            _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "stored")
+        except Exception as e:
+            _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "db_errors")
+            print(f"[PUBLISH] DB insert failed client_message_id={client_id}: {e!r}", flush=True)
+
+    PUBLISH_EXECUTOR.submit(_persist)
+
+def _prepare_publish(payload: dict):
+    """Validate and moderate one /publish payload.
+
+    Returns (msg, None), or (None, error message) for a bad message ID.
+    """
+    raw = (payload.get("data") or payload.get("message") or "").strip()
+    attrs = payload.get("attributes") or {}
+    client_id_raw = (attrs.get("messageId") or "").strip()
 
+    err = _client_id_error(client_id_raw)
+    if err:
+        return None, err
+
+    # profanity handling
+    flagged, to_send = moderate(raw)
+    return {
+        "client_id": client_id_raw,
+        "source": (attrs.get("source") or "").strip() or None,
+        "attrs": attrs,
+        "flagged": flagged,
+        "to_send": to_send,
+    }, None
+
+def _observe_ack(future):
+    # publish() -> Pub/Sub ack, including time spent in the client-side batch
+    t0 = time.perf_counter()
+    future.add_done_callback(lambda f: metrics.PUBSUB_ACK_SECONDS.observe(time.perf_counter() - t0))
+    return future
+
+def _start_publish(msg: dict):
     # publish to Pub/Sub & pass through attributes for traceability
-    pub_attrs = {k: str(v) for k, v in attrs.items()}
+    pub_attrs = {k: str(v) for k, v in msg["attrs"].items()}
     future = publisher.publish(
         topic_path,
-        to_send.encode("utf-8"),
+        msg["to_send"].encode("utf-8"),
         **pub_attrs,
     )
-    pubsub_id = future.result(timeout=20)
+    _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "accepted")
+    return _observe_ack(future)
+
+def _finish_in_background(msg: dict, future):
+    # ack + insert finish in the background; the message is already
+    # queued in the client-side batch
+    future.add_done_callback(
+        lambda f: _finish_publish(f, msg["client_id"], msg["to_send"], msg["source"], msg["attrs"], msg["flagged"])
+    )
+
+def _publish_result(msg: dict, pubsub_id, row_id, is_dup, **extra) -> dict:
+    return {
+        "ok": True,
+        **extra,
+        "flagged": msg["flagged"],
+        "pubsub_message_id": pubsub_id,
+        "client_message_id": msg["client_id"],
+        "row_id": row_id,
+        "is_duplicate": is_dup,
+        "data": msg["to_send"],
+    }
+
+@app.route("/publish", methods=["POST"])
+def publish_route():
+    payload = request.get_json(silent=True) or {}
+    # wait=1 blocks until Pub/Sub acks and the row is committed (old behavior)
+    wait = _truthy(request.args.get("wait", payload.get("wait", "")))
+
+    msg, err = _prepare_publish(payload)
+    if err:
+        return jsonify({"error": err}), 400
+
+    # replayed ID we stored recently: answer without Pub/Sub or the DB
+    seen = _replayed(msg["client_id"], msg["source"], msg["flagged"])
+    if seen is not None:
+        return jsonify(_publish_result(
+            msg, seen["pubsub_message_id"], seen["row_id"], True, cached=True
+        )), 200
+
+    future = _start_publish(msg)
+
+    if not wait:
+        _finish_in_background(msg, future)
+        return jsonify(_publish_result(msg, None, None, None, accepted=True)), 202
 
     try:
-        with engine.begin() as conn:
+        pubsub_id = future.result(timeout=20)
+    except Exception as e:
+        _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "pubsub_errors")
+        app.logger.exception("Pub/Sub publish failed")
+        return jsonify({"error": "publish failed", "detail": str(e)}), 502
+    _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "acked")
 
-            if client_id:
-                result = conn.execute(text("""
-                    INSERT INTO messages (
-                        client_message_id, pubsub_message_id, data, source,
-                        attributes, publish_time, is_duplicate
-                    )
-                    VALUES (
-                        :client_message_id, :pubsub_message_id, :data, :source,
-                        CAST(:attributes AS JSONB), NOW(), FALSE
-                    )
-                    ON CONFLICT (client_message_id)
-                    DO UPDATE SET
-                        is_duplicate = TRUE,
-                        publish_time = EXCLUDED.publish_time
-                    RETURNING id, is_duplicate
-                """), {
-                    "client_message_id": client_id,
-                    "pubsub_message_id": pubsub_id,
-                    "data": to_send,
-                    "source": source,
-                    "attributes": json.dumps(attrs),
-                })
-            else:
-                result = conn.execute(text("""
-                    INSERT INTO messages (
-                        client_message_id, pubsub_message_id, data, source,
-                        attributes, publish_time, is_duplicate
-                    )
-                    VALUES (
-                        NULL, :pubsub_message_id, :data, :source,
-                        CAST(:attributes AS JSONB), NOW(), FALSE
-                    )
-                    RETURNING id, is_duplicate
-                """), {
-                    "pubsub_message_id": pubsub_id,
-                    "data": to_send,
-                    "source": source,
-                    "attributes": json.dumps(attrs),
-                })
-
-            #  text-based duplicate detection
-            conn.execute(text("""
-                UPDATE messages
-                SET is_duplicate = TRUE
-                WHERE data = :data
-                  AND id != (
-                      SELECT MIN(id) FROM messages WHERE data = :data
-                  )
-            """), {
-                "data": to_send
-            })
-
-            row = result.first()
-            row_id = row.id if row else None
-            is_dup = bool(row.is_duplicate) if row else False
+    try:
+        row_id, is_dup = _store_message(
+            msg["client_id"], pubsub_id, msg["to_send"], msg["source"], msg["attrs"], msg["flagged"]
+        )
+        _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "stored")
+        return jsonify(_publish_result(msg, pubsub_id, row_id, is_dup)), 200
 
-        return jsonify({
+    except Exception as e:
+        _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "db_errors")
+        app.logger.exception("DB insert/upsert failed")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+
+@app.route("/publish/batch", methods=["POST"])
+def publish_batch_route():
+    payload = request.get_json(silent=True)
+    items = payload.get("messages") if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty array of {data, attributes} objects."}), 400
+    if len(items) > PUBLISH_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Batch is too large (max {PUBLISH_BATCH_MAX_ITEMS})."}), 400
+
+    results: list[dict] = [None] * len(items)
+    pending = []  # (index, future, client_id, to_send, source, attrs, flagged)
+    first_by_cid = {}
+    repeats = []  # (index, index of the ID's first item, source, flagged)
+
+    # validate + moderate everything, then hand the whole lot to the
+    # publisher so it goes out as one client-side batch
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = {"index": i, "ok": False, "error": "Item must be an object."}
+            continue
+        raw = (item.get("data") or item.get("message") or "").strip()
+        attrs = item.get("attributes") or {}
+        if not isinstance(attrs, dict):
+            results[i] = {"index": i, "ok": False, "error": "attributes must be an object."}
+            continue
+        client_id = str(attrs.get("messageId") or "").strip()
+        err = _client_id_error(client_id)
+        if err:
+            results[i] = {"index": i, "ok": False, "error": err, "client_message_id": client_id or None}
+            continue
+
+        source = (attrs.get("source") or "").strip() or None
+        flagged, to_send = moderate(raw)
+        if client_id in first_by_cid:
+            # same ID again in this request: a replay of its first item, not
+            # published again; it gets that item's result below
+            repeats.append((i, first_by_cid[client_id], source, flagged))
+            continue
+        first_by_cid[client_id] = i
+        seen = _replayed(client_id, source, flagged)
+        if seen is not None:
+            results[i] = {
+                "index": i,
+                "ok": True,
+                "flagged": flagged,
+                "pubsub_message_id": seen["pubsub_message_id"],
+                "client_message_id": client_id,
+                "row_id": seen["row_id"],
+                "is_duplicate": True,
+                "cached": True,
+                "data": to_send,
+            }
+            continue
+        pub_attrs = {k: str(v) for k, v in attrs.items()}
+        future = _observe_ack(publisher.publish(topic_path, to_send.encode("utf-8"), **pub_attrs))
+        pending.append((i, future, client_id, to_send, source, attrs, flagged))
+    _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "accepted", len(pending))
+
+    rows = []
+    published = []
+    for i, future, client_id, to_send, source, attrs, flagged in pending:
+        try:
+            pubsub_id = future.result(timeout=20)
+        except Exception as e:
+            _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "pubsub_errors")
+            results[i] = {"index": i, "ok": False, "error": "publish failed",
+                          "detail": str(e), "client_message_id": client_id}
+            continue
+        _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "acked")
+        published.append((i, client_id, pubsub_id, to_send, source, flagged))
+        rows.append({
+            "client_message_id": client_id,
+            "pubsub_message_id": pubsub_id,
+            "data": to_send,
+            "source": source,
+            "attributes": attrs,
+        })
+
+    stored = {}
+    if rows:
+        try:
+            stored = _store_messages_bulk(rows)
+            _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "stored", len(rows))
+        except Exception as e:
+            _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "db_errors")
+            app.logger.exception("DB bulk insert/upsert failed")
+            return jsonify({"error": "db_error", "detail": str(e)}), 500
+
+    for i, client_id, pubsub_id, to_send, source, flagged in published:
+        row_id, is_dup, ingested = stored.get(client_id, (None, False, False))
+        if not ingested:
+            ROLLUPS.record(source, duplicate=is_dup, flagged=flagged)
+        results[i] = {
+            "index": i,
             "ok": True,
             "flagged": flagged,
             "pubsub_message_id": pubsub_id,
             "client_message_id": client_id,
             "row_id": row_id,
             "is_duplicate": is_dup,
-            "data": to_send
-        }), 200
+            "data": to_send,
+        }
 
-    except Exception as e:
-        app.logger.exception("DB insert/upsert failed")
-        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    for i, first, source, flagged in repeats:
+        results[i] = {**results[first], "index": i}
+        if results[i]["ok"]:
+            _bump(PUBLISH_STATS, PUBLISH_STATS_LOCK, "replays")
+            # answered like a replay, so counted like one
+            ROLLUPS.record(source, duplicate=True, flagged=flagged)
+
+    ok_count = sum(1 for r in results if r["ok"])
+    return jsonify({
+        "ok": ok_count == len(results),
+        "accepted": ok_count,
+        "rejected": len(results) - ok_count,
+        "results": results,
+    }), 200
+
+# --- keyset pagination cursors ---
+# Opaque to clients: base64url(JSON) of the (publish_time, id) of the row
+# to page from, plus the direction.
+def _encode_cursor(publish_time, row_id, direction: str) -> str:
+    raw = json.dumps({"t": publish_time.isoformat(), "id": row_id, "d": direction})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(val: str):
+    """Return (publish_time, id, direction) or None if the cursor is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(val + "=" * (-len(val) % 4))
+        obj = json.loads(raw)
+        if not isinstance(obj, dict):
+            return None
+        direction = obj.get("d", "next")
+        if direction not in ("next", "prev"):
+            return None
+        return datetime.fromisoformat(obj["t"]), int(obj["id"]), direction
+    except (ValueError, KeyError, TypeError):
+        return None
+
+# --- total counts for /api/messages ---
+COUNT_STRATEGIES = ("exact", "estimate", "cached")
+COUNT_CACHE = TTLCache(1024, MESSAGES_COUNT_CACHE_TTL)
+
+def _estimate_count(conn, where_sql: str, params: dict) -> int:
+    if not where_sql and PARTITIONS.is_partitioned():
+        return PARTITIONS.estimate_rows(conn)
+    if not where_sql:
+        # planner statistics for the whole table; -1 means never analyzed
+        n = conn.execute(text("""
+            SELECT reltuples::bigint FROM pg_class WHERE oid = 'messages'::regclass
+        """)).scalar()
+        if n is not None and n >= 0:
+            return int(n)
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM messages {where_sql}"), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def _count_messages(conn, where_sql: str, params: dict, strategy: str) -> int:
+    if strategy == "estimate":
+        return _estimate_count(conn, where_sql, params)
+
+    exact_sql = f"SELECT COUNT(*) FROM messages {where_sql}"
+    if strategy == "cached":
+        key = (where_sql, tuple(sorted((k, str(v)) for k, v in params.items())))
+        version = _messages_version()
+        hit = COUNT_CACHE.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        total = conn.execute(hot(exact_sql), params).scalar() or 0
+        if not _replica_may_lag():
+            COUNT_CACHE.put(key, (version, total))
+        return total
+
+    return conn.execute(hot(exact_sql), params).scalar() or 0
+
+# --- date range filters ---
+# start/end are turned into half-open timestamp bounds in the caller's time
+# zone so `publish_time` stays bare and the (publish_time) indexes apply.
+def _parse_range_bound(val: str, tz, is_end: bool):
+    """
+    Turn a start/end filter value into an aware datetime.
+
+    Plain dates ('2025-11-13') cover the whole day: start -> that midnight,
+    end -> the next midnight (exclusive). datetime-local values keep their
+    time of day; as an end bound they cover the named minute or second.
+    Raises ValueError on anything else.
+    """
+    if "T" in val or " " in val:
+        dt = _parse_dt(val)
+        if dt is None:
+            raise ValueError(val)
+        if is_end and dt.microsecond == 0:
+            time_part = val.replace(" ", "T").split("T", 1)[1]
+            dt += timedelta(minutes=1) if time_part.count(":") == 1 else timedelta(seconds=1)
+    else:
+        dt = datetime.combine(date.fromisoformat(val), datetime.min.time())
+        if is_end:
+            dt += timedelta(days=1)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz)
+    return dt
 
 # helper if datetime-local is missing seconds
 def _parse_dt(val: str):
@@ -424,22 +1748,101 @@ def _parse_dt(val: str):
             return None
 
 
+# --- /api/messages response cache ---
+# The receiver page polls the same query every few seconds. Serialized
+# responses are kept per normalized query string and reused until the next
+# write bumps the messages version (or the TTL runs out, for writes made by
+# other instances). Clients revalidate with If-None-Match and get a 304.
+RESPONSE_CACHE = TTLCache(MESSAGES_RESPONSE_CACHE_SIZE, MESSAGES_RESPONSE_CACHE_TTL)
+RESPONSE_CACHE_STATS = {"served": 0, "not_modified": 0, "bytes_sent": 0, "bytes_saved": 0}
+RESPONSE_CACHE_LOCK = threading.Lock()
+
 @app.get("/api/messages")
 def list_messages():
-    msg_id = request.args.get("messageId", "").strip()
-    source = request.args.get("source", "").strip()
-    start  = request.args.get("start", "").strip()
-    end    = request.args.get("end", "").strip()
-    dup    = request.args.get("is_duplicate", "").strip().lower()
-    text_q = request.args.get("text", "").strip()
+    key = _messages_cache_key(request.args.items(multi=True))
+    cached = _messages_cache_get(key)
+    if cached is not None:
+        body, etag = cached
+    else:
+        version = _messages_version()
+        plan, err = _plan_messages_query(request.args)
+        if err:
+            # validation errors aren't cached
+            return jsonify({"error": err}), 400
+        with read_engine.begin() as conn:
+            payload = _run_messages_query(conn, plan)
+        body, etag = _messages_cache_put(key, version, payload, store=not _replica_may_lag())
+
+    resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.make_conditional(request)
+    _messages_cache_served(len(body), resp.status_code == 304)
+    return resp
+
+def _messages_cache_key(items) -> tuple:
+    return tuple(sorted(items))
+
+def _messages_cache_get(key):
+    """Return (body, etag) if a response for key is still current."""
+    hit = RESPONSE_CACHE.get(key)
+    if hit is not None and hit[0] == _messages_version():
+        return hit[1], hit[2]
+    return None
+
+def _messages_cache_put(key, version, payload: dict, store: bool = True):
+    body = json.dumps(payload).encode("utf-8")
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    if store:
+        RESPONSE_CACHE.put(key, (version, body, etag))
+    return body, etag
+
+def _messages_cache_served(size: int, not_modified: bool):
+    with RESPONSE_CACHE_LOCK:
+        RESPONSE_CACHE_STATS["served"] += 1
+        if not_modified:
+            RESPONSE_CACHE_STATS["not_modified"] += 1
+            RESPONSE_CACHE_STATS["bytes_saved"] += size
+        else:
+            RESPONSE_CACHE_STATS["bytes_sent"] += size
+
+def _plan_messages_query(args):
+    """
+    Turn /api/messages query args into SQL.
+
+    Returns (plan, None), or (None, error message) for bad input. Shared by
+    the Flask route and the ASGI app so both answer with the same contract.
+    """
+    msg_id = args.get("messageId", "").strip()
+    source = args.get("source", "").strip()
+    start  = args.get("start", "").strip()
+    end    = args.get("end", "").strip()
+    dup    = args.get("is_duplicate", "").strip().lower()
+    text_q = args.get("text", "").strip()
+    # substring: ILIKE via the trigram index; fulltext: ranked tsvector match
+    search = args.get("search", "substring").strip().lower()
+    if search not in ("substring", "fulltext"):
+        return None, "search must be substring or fulltext."
+    ranked = search == "fulltext" and bool(text_q)
+
+    tz_name = args.get("tz", DEFAULT_TIMEZONE).strip() or DEFAULT_TIMEZONE
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None, f"Unknown time zone: {tz_name}"
+    try:
+        start_dt = _parse_range_bound(start, tz, is_end=False) if start else None
+        end_dt = _parse_range_bound(end, tz, is_end=True) if end else None
+    except ValueError:
+        return None, "start/end must be YYYY-MM-DD or YYYY-MM-DDTHH:MM[:SS]."
 
     # pagination
     try:
-        page = int(request.args.get("page", "1"))
+        page = int(args.get("page", "1"))
     except ValueError:
         page = 1
     try:
-        limit = int(request.args.get("limit", "10"))
+        limit = int(args.get("limit", "10"))
     except ValueError:
         limit = 10
 
@@ -449,6 +1852,20 @@ def list_messages():
         limit = 10
     offset = (page - 1) * limit
 
+    count_strategy = args.get("count", MESSAGES_COUNT_STRATEGY).strip().lower()
+    if count_strategy not in COUNT_STRATEGIES:
+        return None, f"count must be one of {', '.join(COUNT_STRATEGIES)}."
+
+    # cursor wins over page: every cursor page costs one index range scan
+    cursor = None
+    cursor_raw = args.get("cursor", "").strip()
+    if cursor_raw:
+        cursor = _decode_cursor(cursor_raw)
+        if cursor is None:
+            return None, "Invalid cursor."
+        if ranked:
+            return None, "Full-text results are ranked; page with page, not cursor."
+
     # --- build WHERE clauses dynamically ---
     where = []
     params: dict[str, object] = {}
@@ -464,18 +1881,21 @@ def list_messages():
             params["source"] = source
 
     # case-insensitive partial search on message body
-    if text_q:
+    if ranked:
+        where.append(f"{DATA_TSV_SQL} @@ websearch_to_tsquery('{SEARCH_TS_CONFIG}', :text_q)")
+        params["text_q"] = text_q
+    elif text_q:
         where.append("data ILIKE :text_q")
         params["text_q"] = f"%{text_q}%"
 
-    # date range: treat start/end as calendar dates
-    if start:
-        where.append("publish_time::date >= :start")
-        params["start"] = start
+    # date range: half-open [start, end) on the bare column
+    if start_dt is not None:
+        where.append("publish_time >= :start")
+        params["start"] = start_dt
 
-    if end:
-        where.append("publish_time::date <= :end")
-        params["end"] = end
+    if end_dt is not None:
+        where.append("publish_time < :end")
+        params["end"] = end_dt
 
     if dup in ("true", "false"):
         where.append("is_duplicate = :dup")
@@ -484,7 +1904,33 @@ def list_messages():
     where_sql = ""
     if where:
         where_sql = "WHERE " + " AND ".join(where)
-
+    filter_params = dict(params)
+
+    page_where = list(where)
+    order_sql = "ORDER BY publish_time DESC, id DESC"
+    rank_sql = "NULL"
+    if ranked:
+        # the index only finds matches; ranking recomputes their vectors
+        rank_sql = f"ts_rank({DATA_TSV_SQL}, websearch_to_tsquery('{SEARCH_TS_CONFIG}', :text_q))"
+        order_sql = "ORDER BY rank DESC, publish_time DESC, id DESC"
+    if cursor is not None:
+        cur_time, cur_id, direction = cursor
+        params["cur_time"] = cur_time
+        params["cur_id"] = cur_id
+        # the row comparison is the real bound; the plain one on publish_time
+        # is implied by it and lets the planner prune partitions
+        if direction == "next":
+            page_where.append("(publish_time, id) < (:cur_time, :cur_id)")
+            page_where.append("publish_time <= :cur_time")
+        else:
+            # walk backwards from the cursor, then flip the rows below
+            page_where.append("(publish_time, id) > (:cur_time, :cur_id)")
+            page_where.append("publish_time >= :cur_time")
+            order_sql = "ORDER BY publish_time ASC, id ASC"
+        offset = 0
+    page_where_sql = ("WHERE " + " AND ".join(page_where)) if page_where else ""
+
+    # one extra row tells us whether there is another page
     query_items = f"""
         SELECT
             id,
@@ -492,60 +1938,303 @@ def list_messages():
             data,
             source,
             publish_time,
-            is_duplicate
-        FROM messages
-        {where_sql}
-        ORDER BY publish_time DESC
-        LIMIT :limit OFFSET :offset
-    """
-
-    query_count = f"""
-        SELECT COUNT(*)
+            is_duplicate,
+            {rank_sql} AS rank
         FROM messages
-        {where_sql}
+        {page_where_sql}
+        {order_sql}
+        LIMIT :limit_plus_one OFFSET :offset
     """
 
-    params["limit"] = limit
+    params["limit_plus_one"] = limit + 1
     params["offset"] = offset
 
-    with engine.begin() as conn:
-        rows = conn.execute(text(query_items), params).fetchall()
-        total = conn.execute(text(query_count), params).scalar() or 0
+    plan = {
+        "query_items": query_items,
+        "params": params,
+        "where_sql": where_sql,
+        "filter_params": filter_params,
+        "count_strategy": count_strategy,
+        "limit": limit,
+        "page": page,
+        "cursor": cursor,
+        "ranked": ranked,
+    }
+    return plan, None
+
+def _run_messages_query(conn, plan) -> dict:
+    """Execute a planned /api/messages query and shape the JSON payload."""
+    limit, page, cursor, ranked = plan["limit"], plan["page"], plan["cursor"], plan["ranked"]
+    count_strategy = plan["count_strategy"]
+    mode = "ranked" if ranked else ("keyset" if cursor is not None else "offset")
+    with metrics.MESSAGES_QUERY_SECONDS.labels("page", mode).time():
+        rows = conn.execute(hot(plan["query_items"]), plan["params"]).fetchall()
+    with metrics.MESSAGES_QUERY_SECONDS.labels("count", count_strategy).time():
+        total = _count_messages(conn, plan["where_sql"], plan["filter_params"], count_strategy)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if cursor is not None and cursor[2] == "prev":
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    elif cursor is not None:
+        has_next, has_prev = has_more, True
+    else:
+        has_next, has_prev = has_more, page > 1
+
+    next_cursor = prev_cursor = None
+    if ranked:
+        # rank order has no (publish_time, id) keyset to resume from
+        has_next = has_prev = False
+    if rows and has_next:
+        next_cursor = _encode_cursor(rows[-1].publish_time, rows[-1].id, "next")
+    if rows and has_prev:
+        prev_cursor = _encode_cursor(rows[0].publish_time, rows[0].id, "prev")
 
     # Shape rows for your React table
     items = []
     for r in rows:
-        items.append({
+        item = {
             "id": r.id,
             "messageId": getattr(r, "client_message_id", None),
             "data": r.data,
             "source": r.source,
             "publishTime": r.publish_time.isoformat() if r.publish_time else None,
             "is_duplicate": bool(r.is_duplicate),
-        })
-
-    return jsonify({"items": items, "total": total})
-
+        }
+        if ranked:
+            item["rank"] = float(r.rank)
+        items.append(item)
 
+    return {
+        "items": items,
+        "total": total,
+        "total_strategy": count_strategy,
+        "total_is_estimate": count_strategy == "estimate",
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+    }
+
+# --- bulk export ---
+EXPORTER = MessageExporter(
+    read_engine,
+    fetch_size=EXPORT_FETCH_SIZE,
+    max_concurrent=EXPORT_MAX_CONCURRENT,
+    compress_level=EXPORT_GZIP_LEVEL,
+)
 
+@app.get("/api/messages/export")
+def export_messages():
+    """
+    Every message matching the /api/messages filters, streamed as NDJSON or
+    CSV. page/limit/cursor don't apply; max_rows caps the export instead.
+    """
+    plan, err = _plan_messages_query(request.args)
+    if err:
+        return jsonify({"error": err}), 400
+
+    fmt = request.args.get("format", "").strip().lower()
+    if not fmt:
+        best = request.accept_mimetypes.best_match(["application/x-ndjson", "text/csv"])
+        fmt = "csv" if best == "text/csv" else "ndjson"
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}."}), 400
+    order = request.args.get("order", "desc").strip().lower()
+    if order not in ("asc", "desc"):
+        return jsonify({"error": "order must be asc or desc."}), 400
+    try:
+        max_rows = int(request.args.get("max_rows", "0"))
+    except ValueError:
+        max_rows = -1
+    if max_rows < 0:
+        return jsonify({"error": "max_rows must be a non-negative integer."}), 400
+    # ?gzip=1|0 wins; otherwise compress when the client accepts it
+    gzip_arg = request.args.get("gzip")
+    compress = _truthy(gzip_arg) if gzip_arg is not None else request.accept_encodings.quality("gzip") > 0
+
+    if EXPORTER.busy():
+        return jsonify({"error": "Too many exports running; try again shortly."}), 503
+    chunks = EXPORTER.open(plan["where_sql"], plan["filter_params"], fmt=fmt, order=order,
+                           max_rows=max_rows, compress=compress)
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    headers = {
+        "Content-Disposition": f'attachment; filename="messages-{stamp}.{fmt}"',
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    # not wrapped in stream_with_context: the generator needs no request
+    # context, and a plain generator is close()d by the server on disconnect
+    return Response(chunks, content_type=export_content_type(fmt), headers=headers)
+
+# --- dashboard stats ---
+# Served from message_rollups_minute/_hour only (see backend/rollups.py), so
+# the cost depends on the range asked for, not on how big `messages` is.
+STATS_DEFAULT_WINDOW = {"minute": timedelta(hours=1), "hour": timedelta(days=1)}
+
+@app.get("/api/stats")
+def message_stats():
+    """Messages, duplicates and flagged messages per source per minute or hour."""
+    plan, err = _plan_stats_query(request.args)
+    if err:
+        return jsonify({"error": err}), 400
+    with read_engine.begin() as conn:
+        payload = _run_stats_query(conn, plan)
+    return jsonify(payload), 200
+
+def _plan_stats_query(args):
+    """
+    Turn /api/stats query args into a rollup range.
 
+    start/end/tz work as on /api/messages; without start the window is the
+    last hour (minute) or day (hour). Bounds widen to whole buckets.
+    Returns (plan, None), or (None, error message) for bad input.
+    """
+    granularity = args.get("granularity", "hour").strip().lower()
+    if granularity not in ROLLUP_GRANULARITIES:
+        return None, f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}."
+    tz_name = args.get("tz", DEFAULT_TIMEZONE).strip() or DEFAULT_TIMEZONE
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None, f"Unknown time zone: {tz_name}"
+    start, end = args.get("start", "").strip(), args.get("end", "").strip()
+    try:
+        until = _parse_range_bound(end, tz, is_end=True) if end else datetime.now(timezone.utc)
+        since = _parse_range_bound(start, tz, is_end=False) if start else until - STATS_DEFAULT_WINDOW[granularity]
+    except ValueError:
+        return None, "start/end must be YYYY-MM-DD or YYYY-MM-DDTHH:MM[:SS]."
+    if since >= until:
+        return None, "start must be before end."
+
+    step = timedelta(seconds=ROLLUP_GRANULARITIES[granularity])
+    since = floor_to(since, granularity)
+    until = floor_to(until - timedelta(microseconds=1), granularity) + step
+    if (until - since) / step > STATS_MAX_BUCKETS:
+        return None, f"Range is more than {STATS_MAX_BUCKETS} {granularity} buckets; narrow it or use a coarser granularity."
+    source = args.get("source", "").strip() or None
+    return {"granularity": granularity, "since": since, "until": until, "source": source, "tz": tz}, None
+
+def _stats_totals(messages: int, duplicates: int, flagged: int) -> dict:
+    return {
+        "messages": messages,
+        "duplicates": duplicates,
+        "flagged": flagged,
+        "duplicate_rate": round(duplicates / messages, 4) if messages else None,
+    }
+
+def _run_stats_query(conn, plan) -> dict:
+    """Read a planned /api/stats range from the rollups and shape the JSON payload."""
+    tz = plan["tz"]
+    with metrics.STATS_QUERY_SECONDS.labels(plan["granularity"]).time():
+        rows = MessageRollups.query(conn, plan["granularity"], plan["since"], plan["until"], plan["source"])
+
+    per_source: dict = {}
+    for r in rows:
+        acc = per_source.setdefault(r["source"], [0, 0, 0])
+        acc[0] += r["messages"]
+        acc[1] += r["duplicates"]
+        acc[2] += r["flagged"]
+    sources = sorted(per_source.items(), key=lambda kv: -kv[1][0])
 
+    return {
+        "granularity": plan["granularity"],
+        "start": plan["since"].astimezone(tz).isoformat(),
+        "end": plan["until"].astimezone(tz).isoformat(),
+        "source": plan["source"],
+        "totals": _stats_totals(*(sum(acc[i] for acc in per_source.values()) for i in range(3))),
+        "sources": [{"source": src, **_stats_totals(*acc)} for src, acc in sources],
+        # sparse: a (bucket, source) with nothing stored has no entry
+        "buckets": [{**r, "bucket": r["bucket"].astimezone(tz).isoformat()} for r in rows],
+        # the newest bucket trails stored messages by up to this many seconds
+        "flush_interval": ROLLUP_FLUSH_INTERVAL,
+    }
+
+
+@app.get("/api/stream")
+def stream_messages():
+    """Server-Sent Events feed of messages as the puller receives them."""
+    last_raw = (request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or "").strip()
+    last_event_id = int(last_raw) if last_raw.isdigit() else None
+
+    client = STREAM_HUB.subscribe(last_event_id, max_clients=STREAM_MAX_CLIENTS)
+    if client is None:
+        return jsonify({"error": "Too many stream clients; poll /api/messages instead."}), 503
+
+    def _events():
+        try:
+            # tell EventSource how long to wait before reconnecting
+            yield "retry: 2000\n\n"
+            if client.reset:
+                yield "event: reset\ndata: {}\n\n"
+            while not client.lagging:
+                try:
+                    event_id, item = client.queue.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event_id}\nevent: message\ndata: {json.dumps(item)}\n\n"
+            # slow consumer: drop it, the browser reconnects with Last-Event-ID
+            yield "event: lagged\ndata: {}\n\n"
+        finally:
+            STREAM_HUB.unsubscribe(client)
+
+    return Response(
+        stream_with_context(_events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # --- background poll launcher ---
 from flask import current_app
 import threading
 
+def _on_elected():
+    global PULLER_IS_LEADER
+    PULLER_IS_LEADER = True
+    start_sync_poll_loop()
+
+def _on_lost_leadership():
+    global PULLER_IS_LEADER, SYNC_PULLER, INGEST_SINK
+    PULLER_IS_LEADER = False
+    # the sink's final flush acks through the puller, so it stops first
+    if INGEST_SINK is not None:
+        INGEST_SINK.stop()
+        INGEST_SINK = None
+    if SYNC_PULLER is not None:
+        SYNC_PULLER.stop()
+        SYNC_PULLER = None
+
 def _start_bg_threads():
     app = current_app
     # Prevent multiple threads if Flask reloads workers
-    if not app.config.get("SYNC_POLL_STARTED", False):
+    if app.config.get("SYNC_POLL_STARTED", False):
+        return
+    app.config["SYNC_POLL_STARTED"] = True
+
+    if PULLER_LEADER_LOCK == "none":
         t = threading.Thread(
-            target=start_sync_poll_loop,
+            target=_on_elected,
             name="sync-poll",
             daemon=True
         )
         t.start()
-        app.config["SYNC_POLL_STARTED"] = True
+        return
+
+    # multi-worker: only the lock holder pulls
+    if PULLER_LEADER_LOCK == "postgres":
+        lock = PostgresLeaderLock(engine)
+    else:
+        lock = FileLeaderLock(PULLER_LOCK_PATH)
+    run_for_leadership(
+        lock,
+        _on_elected,
+        _on_lost_leadership,
+        log=lambda line: print(line, flush=True),
+    )
 
 # Temporary alias for legacy call names
 def start_sync_poll():
@@ -559,14 +2248,14 @@ def _ensure_thread():
 def debug_pid():
     return jsonify({
         "pid": os.getpid(),
+        "puller_leader": PULLER_IS_LEADER,
         "recent_len": len(RECENT),
         "use_sync_poll": USE_SYNC_POLL,
     }), 200
        
 def debug_subscription():
     from flask import jsonify
-    from google.cloud import pubsub_v1
-    sc = pubsub_v1.SubscriberClient(credentials=CREDS)
+    sc = PUBSUB.subscriber()
     sub_path = sc.subscription_path(PROJECT_ID, SUB_PULL_ID)
     try:
         s = sc.get_subscription(request={"subscription": sub_path})
@@ -586,7 +2275,7 @@ def debug_iam():
     perms = ["pubsub.subscriptions.consume", "pubsub.subscriptions.get"]
     resource = f"projects/{PROJECT_ID}/subscriptions/{SUB_PULL_ID}"
     try:
-        sub = pubsub_v1.SubscriberClient(credentials=CREDS)
+        sub = PUBSUB.subscriber()
         resp = sub.test_iam_permissions(request={"resource": resource, "permissions": perms})
         return {"resource": resource, "asked": perms, "granted": list(resp.permissions)}, 200
     except Exception as e:
@@ -595,12 +2284,12 @@ def debug_iam():
 @app.route("/_debug/pull_long")
 def debug_pull_long():
     try:
-        sub = pubsub_v1.SubscriberClient(credentials=CREDS)
+        sub = PUBSUB.subscriber()
         sub_path = sub.subscription_path(PROJECT_ID, SUB_PULL_ID)
         print(f"[PULL_LONG] pulling for 60s on {sub_path}", flush=True)
 
         deadline = time.time() + 60
-        total = 0
+        total = recorded = 0
         while time.time() < deadline:
             resp = sub.pull(
                 request={"subscription": sub_path, "max_messages": 10},
@@ -610,15 +2299,8 @@ def debug_pull_long():
             if resp.received_messages:
                 ack_ids = []
                 for rm in resp.received_messages:
-                    m = rm.message
-                    item = {
-                        "data": m.data.decode("utf-8"),
-                        "attributes": dict(m.attributes or {}),
-                        "messageId": m.message_id,
-                        "publishTime": str(m.publish_time),
-                    }
-                    with RECENT_LOCK:
-                        RECENT.append(item)
+                    item = _pulled_item(rm.message)
+                    recorded += _record_received(item)
                     ack_ids.append(rm.ack_id)
                 sub.acknowledge(request={"subscription": sub_path, "ack_ids": ack_ids})
                 total += len(ack_ids)
@@ -627,7 +2309,7 @@ def debug_pull_long():
                 print("[PULL_LONG] no messages, waiting...", flush=True)
                 time.sleep(2)
 
-        return {"pulled_total": total, "recent_len": len(RECENT)}, 200
+        return {"pulled_total": total, "recorded": recorded, "recent_len": len(RECENT)}, 200
     except Exception as e:
         return {"error": str(e)}, 500
 
@@ -638,6 +2320,9 @@ def debug_whoami():
         "pid": os.getpid(),
         "thread_count": threading.active_count(),
         "use_sync_poll": bool(int(os.environ.get("USE_SYNC_POLL", "1"))),
+        "puller_lock": PULLER_LEADER_LOCK,
+        "puller_leader": PULLER_IS_LEADER,
+        "recent_shared": bool(RECENT_SHM_PATH),
     }, 200
 
 @app.route("/_debug/messages_debug")
@@ -660,20 +2345,24 @@ def messages_debug():
 
 def start_streaming_pull():
     global SUBSCRIBER, SUB_FUTURE
+    sink = _start_ingest_sink(
+        lambda msgs: [m.ack() for m in msgs],
+        on_failed=lambda msgs: [m.nack() for m in msgs],
+    )
 
     def run_pull():
         global SUBSCRIBER, SUB_FUTURE
         while True:
             try:
-                SUBSCRIBER = pubsub_v1.SubscriberClient(credentials=CREDS)
+                SUBSCRIBER = PUBSUB.subscriber()
                 sub_path = SUBSCRIBER.subscription_path(PROJECT_ID, SUB_PULL_ID)
-                print(f"[PULL] Connecting to {sub_path}", flush=True)
+                EVENTS.emit("pull.connect", subscription=sub_path)
 
                 try:
                     sub_info = SUBSCRIBER.get_subscription(request={"subscription": sub_path})
-                    print(f"[PULL] Verified subscription; topic={sub_info.topic}", flush=True)
+                    EVENTS.emit("pull.verified", subscription=sub_path, topic=sub_info.topic)
                 except NotFound:
-                    print(f"[PULL] SUB NOT FOUND: {sub_path}", flush=True)
+                    EVENTS.emit("pull.not_found", level="error", subscription=sub_path)
 
                 def callback(message):
                     try:
@@ -684,23 +2373,149 @@ def start_streaming_pull():
                             "messageId": message.message_id,
                             "publishTime": str(message.publish_time),
                         }
-                        with RECENT_LOCK:
-                            RECENT.append(item)
-
-                        print(f"[PULL]  {item}", flush=True)
-                        message.ack()
+                        _record_received(item)
+
+                        EVENTS.emit(
+                            "pull.message", level="debug",
+                            message_id=message.message_id,
+                            bytes=len(message.data),
+                            source=item["attributes"].get("source"),
+                        )
+                        if sink is not None:
+                            # acked by the sink once the row is committed
+                            sink.add(row_from_message(message), message)
+                        else:
+                            message.ack()
                     except Exception as e:
-                        print(f"[PULL]  callback error: {e}", flush=True)
+                        EVENTS.emit("pull.error", level="error", message_id=message.message_id, error=repr(e))
                         message.nack()
 
                 SUB_FUTURE = SUBSCRIBER.subscribe(sub_path, callback=callback)
-                print("[PULL] Listening...", flush=True)
+                EVENTS.emit("pull.listening", subscription=sub_path)
                 SUB_FUTURE.result()
             except Exception as e:
-                print(f"[PULL]  Stream error, restarting: {e}", flush=True)
+                EVENTS.emit("pull.stream_error", level="error", error=repr(e))
                 time.sleep(2)
 
     threading.Thread(target=run_pull, daemon=True).start()
 
+# -----------------------------
+# Startup / warm-up
+# -----------------------------
+
+def _check_database():
+    for eng in (engine, read_engine):
+        with eng.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+def _warm_up():
+    """Build the lazy clients and run the boot checks in parallel, then mark ready."""
+    def step(name, fn):
+        with _boot_phase(name):
+            fn()
+
+    def database():
+        if MIGRATE_ON_BOOT and not SCHEMA_MIGRATED.is_set():
+            step("schema", _migrate_schema_once)
+        else:
+            step("database", _check_database)
+        if PARTITIONS.is_partitioned(refresh=True):
+            PARTITIONS.start(PARTITION_MAINTENANCE_INTERVAL)
+        if MIGRATE_DATA_HASH_ON_BOOT:
+            _start_data_hash_migration()
+
+    failed = []
+
+    def run(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            failed.append(e)
+
+    with BOOT_LOCK:
+        BOOT_STATE["errors"].clear()
+    # daemon threads: a check stuck retrying (get_topic) must not block exit
+    threads = [
+        threading.Thread(target=run, args=args, name=f"warm-up-{i}", daemon=True)
+        for i, args in enumerate((
+            (database,),
+            (step, "topic", _verify_topic),
+            (SUBSCRIBER.resolve,),
+            (MODERATION.resolve,),
+        ))
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with BOOT_LOCK:
+        BOOT_STATE["warming"] = False
+        BOOT_STATE["ready"] = not failed
+        if not failed:
+            BOOT_STATE["ready_ms"] = _boot_ms()
+        phases = ", ".join(f"{k}={v['ms']:.0f}ms" for k, v in BOOT_PHASES.items())
+    if failed:
+        print(f"[BOOT] warm-up failed: {failed[0]!r} ({phases})", flush=True)
+    else:
+        print(f"[BOOT] ready in {BOOT_STATE['ready_ms']:.0f}ms ({phases})", flush=True)
+    return not failed
+
+def _start_warm_up():
+    with BOOT_LOCK:
+        if BOOT_STATE["warming"]:
+            return
+        BOOT_STATE["warming"] = True
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Create/upgrade the schema and backfill data_hash, then exit."""
+    t0 = time.perf_counter()
+    migrate_schema()
+    migrate_data_hash()
+    print(f"[MIGRATE] done in {time.perf_counter() - t0:.1f}s", flush=True)
+
+@app.cli.command("partition-messages")
+def partition_messages_command():
+    """Convert a plain messages table into time partitions, then rebuild indexes.
+
+    Blocks writes while rows are copied; restart the app afterwards.
+    """
+    if not MESSAGES_PARTITION_INTERVAL:
+        die("set MESSAGES_PARTITION_INTERVAL=day|month first")
+    t0 = time.perf_counter()
+    migrate_data_hash()
+    PARTITIONS.convert()
+    migrate_schema()
+    print(f"[MIGRATE] partitioned in {time.perf_counter() - t0:.1f}s", flush=True)
+
+@app.cli.command("archive-messages")
+def archive_messages_command():
+    """Create upcoming partitions and archive expired ones now."""
+    print(json.dumps(PARTITIONS.maintain(), default=str), flush=True)
+
+@app.cli.command("rollup-messages")
+@click.option("--since", default="", help="YYYY-MM-DD[THH:MM] in UTC; default: the oldest message.")
+@click.option("--until", default="", help="Same format; default: when live counting began.")
+def rollup_messages_command(since, until):
+    """Backfill the /api/stats rollups from messages stored before they existed."""
+    with engine.begin() as conn:
+        ROLLUPS.create_tables(conn)
+    try:
+        lo = _parse_range_bound(since, timezone.utc, is_end=False) if since else None
+        hi = _parse_range_bound(until, timezone.utc, is_end=False) if until else None
+    except ValueError:
+        die("--since/--until must be YYYY-MM-DD or YYYY-MM-DDTHH:MM[:SS]")
+    print(json.dumps(ROLLUPS.backfill(lo, hi)), flush=True)
+
+if SERVING:
+    if LAZY_INIT:
+        _start_warm_up()
+    else:
+        BOOT_STATE["warming"] = True
+        if not _warm_up():
+            die(f"startup failed: {BOOT_STATE['errors']}")
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
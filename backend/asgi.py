@@ -0,0 +1,225 @@
+"""
+ASGI serving mode for the hot routes: /publish, /api/messages, /api/stats,
+/healthz, /readyz and /metrics.
+
+    uvicorn backend.asgi:app --host 0.0.0.0 --port $PORT
+
+Everything else (debug routes, the background puller, /api/stream) stays
+on the Flask app. Validation, moderation, caches and SQL all come from
+backend/app.py, so both modes return the same JSON; only the I/O differs:
+Pub/Sub publish futures are awaited on the event loop and Postgres goes
+through an asyncpg pool, so a slow ack or query parks a coroutine instead
+of a worker thread.
+"""
+import asyncio, os
+from contextlib import asynccontextmanager
+
+from google.cloud.sql.connector import create_async_connector, IPTypes
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from backend import app as core
+from backend import metrics
+
+ASYNC_DB_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", "20"))
+ASYNC_DB_MAX_OVERFLOW = int(os.environ.get("ASYNC_DB_MAX_OVERFLOW", "10"))
+
+_db = {}
+_background = set()
+
+
+def _async_creator(instance):
+    async def getconn():
+        return await _db["connector"].connect_async(
+            instance,
+            "asyncpg",
+            user=core.DB_USER,
+            password=core.DB_PASS,
+            db=core.DB_NAME,
+            ip_type=IPTypes.PUBLIC,
+        )
+    return getconn
+
+
+def _async_engine(url, instance, pool):
+    if url:
+        return create_async_engine(make_url(url).set(drivername="postgresql+asyncpg"), **pool)
+    return create_async_engine("postgresql+asyncpg://", async_creator=_async_creator(instance), **pool)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    pool = {
+        "pool_size": ASYNC_DB_POOL_SIZE,
+        "max_overflow": ASYNC_DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+    if not core.DATABASE_URL or (core.DB_READ_INSTANCE and not core.DATABASE_READ_URL):
+        _db["connector"] = await create_async_connector()
+    _db["engine"] = _async_engine(core.DATABASE_URL, core.DB_INSTANCE, pool)
+    # reads split off the same way as the Flask app's read_engine
+    if core.READ_IS_REPLICA:
+        _db["read_engine"] = _async_engine(core.DATABASE_READ_URL, core.DB_READ_INSTANCE, pool)
+    else:
+        _db["read_engine"] = _db["engine"]
+    yield
+    if _background:
+        await asyncio.gather(*_background, return_exceptions=True)
+    await _db["engine"].dispose()
+    if _db["read_engine"] is not _db["engine"]:
+        await _db["read_engine"].dispose()
+    if "connector" in _db:
+        await _db["connector"].close_async()
+
+
+async def _store_message(msg: dict, pubsub_id):
+    sql = text(core._insert_message_sql(msg["client_id"]))
+    params = core._insert_message_params(
+        msg["client_id"], pubsub_id, msg["to_send"], msg["source"], msg["attrs"]
+    )
+    for attempt in range(2):
+        try:
+            with metrics.DB_TX_SECONDS.time():
+                async with _db["engine"].begin() as conn:
+                    row = (await conn.execute(sql, params)).first()
+                    ingested = row is None
+                    if ingested:
+                        row = (await conn.execute(text(core._INGESTED_ROW_SQL), params)).first()
+            break
+        except IntegrityError:
+            # lost the race for "original" of this text; the retry sees it
+            if attempt:
+                raise
+    return core._message_stored(msg["client_id"], pubsub_id, row, msg["source"], msg["flagged"], ingested)
+
+
+async def _finish_publish(msg: dict, future):
+    try:
+        pubsub_id = await asyncio.wrap_future(future)
+    except Exception as e:
+        core._bump(core.PUBLISH_STATS, core.PUBLISH_STATS_LOCK, "pubsub_errors")
+        print(f"[ASGI] pubsub publish failed client_message_id={msg['client_id']}: {e!r}", flush=True)
+        return
+    core._bump(core.PUBLISH_STATS, core.PUBLISH_STATS_LOCK, "acked")
+    try:
+        await _store_message(msg, pubsub_id)
+        core._bump(core.PUBLISH_STATS, core.PUBLISH_STATS_LOCK, "stored")
+    except Exception as e:
+        core._bump(core.PUBLISH_STATS, core.PUBLISH_STATS_LOCK, "db_errors")
+        print(f"[ASGI] DB insert failed client_message_id={msg['client_id']}: {e!r}", flush=True)
+
+
+async def publish(request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+    wait = core._truthy(request.query_params.get("wait", payload.get("wait", "")))
+
+    msg, err = core._prepare_publish(payload)
+    if err:
+        return JSONResponse({"error": err}, status_code=400)
+
+    seen = core._replayed(msg["client_id"], msg["source"], msg["flagged"])
+    if seen is not None:
+        return JSONResponse(core._publish_result(
+            msg, seen["pubsub_message_id"], seen["row_id"], True, cached=True
+        ))
+
+    future = core._start_publish(msg)
+
+    if not wait:
+        task = asyncio.ensure_future(_finish_publish(msg, future))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+        return JSONResponse(core._publish_result(msg, None, None, None, accepted=True), status_code=202)
+
+    try:
+        pubsub_id = await asyncio.wait_for(asyncio.wrap_future(future), timeout=20)
+    except Exception as e:
+        core._bump(core.PUBLISH_STATS, core.PUBLISH_STATS_LOCK, "pubsub_errors")
+        return JSONResponse({"error": "publish failed", "detail": str(e)}, status_code=502)
+    core._bump(core.PUBLISH_STATS, core.PUBLISH_STATS_LOCK, "acked")
+
+    try:
+        row_id, is_dup = await _store_message(msg, pubsub_id)
+    except Exception as e:
+        core._bump(core.PUBLISH_STATS, core.PUBLISH_STATS_LOCK, "db_errors")
+        return JSONResponse({"error": "db_error", "detail": str(e)}, status_code=500)
+    core._bump(core.PUBLISH_STATS, core.PUBLISH_STATS_LOCK, "stored")
+    return JSONResponse(core._publish_result(msg, pubsub_id, row_id, is_dup))
+
+
+async def list_messages(request):
+    key = core._messages_cache_key(request.query_params.multi_items())
+    cached = core._messages_cache_get(key)
+    if cached is not None:
+        body, etag = cached
+    else:
+        version = core._messages_version()
+        plan, err = core._plan_messages_query(request.query_params)
+        if err:
+            return JSONResponse({"error": err}, status_code=400)
+        async with _db["read_engine"].begin() as conn:
+            payload = await conn.run_sync(core._run_messages_query, plan)
+        body, etag = core._messages_cache_put(key, version, payload, store=not core._replica_may_lag())
+
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    sent = [t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")]
+    not_modified = headers["ETag"] in sent or "*" in sent
+    core._messages_cache_served(len(body), not_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def stats(request):
+    plan, err = core._plan_stats_query(request.query_params)
+    if err:
+        return JSONResponse({"error": err}, status_code=400)
+    async with _db["read_engine"].begin() as conn:
+        payload = await conn.run_sync(core._run_stats_query, plan)
+    return JSONResponse(payload)
+
+
+async def healthz(request):
+    return PlainTextResponse("ok")
+
+
+async def metrics_route(request):
+    body, content_type = metrics.render()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+async def readyz(request):
+    # same readiness as the Flask app: warm-up done (clients built, DB/topic checked)
+    with core.BOOT_LOCK:
+        state = {**core.BOOT_STATE, "errors": dict(core.BOOT_STATE["errors"])}
+    if not state["ready"] and not state["warming"]:
+        core._start_warm_up()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+app = Starlette(
+    routes=[
+        Route("/publish", publish, methods=["POST"]),
+        Route("/api/messages", list_messages, methods=["GET"]),
+        Route("/api/stats", stats, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/readyz", readyz, methods=["GET"]),
+        Route("/metrics", metrics_route, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"],
+                           allow_headers=["*"], expose_headers=["ETag"])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,87 @@
+"""
+Per-request latency of the admin/debug calls with cold vs warm channels.
+
+    # emulator: creates a throwaway topic + subscription
+    PUBSUB_EMULATOR_HOST=localhost:8085 python bench/admin_latency_bench.py --requests 200
+
+    # real Pub/Sub (read-only calls, shows TLS + token cost on cold channels)
+    GOOGLE_APPLICATION_CREDENTIALS=sa.json python bench/admin_latency_bench.py \\
+        --subscription projects/PROJECT/subscriptions/SUB
+
+"cold" builds a new SubscriberClient for every request, as the debug
+endpoints used to; "warm" takes the subscriber from one PubSubClients
+registry. Each request is what /_debug/subscription_info does: one
+get_subscription call. Prints p50/p95/mean milliseconds as JSON.
+"""
+import argparse, json, os, statistics, sys, time, uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from google.cloud import pubsub_v1
+from backend.pubsub_clients import PubSubClients
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "requests": len(samples),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 2),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--subscription", help="existing subscription path (real Pub/Sub)")
+    args = ap.parse_args()
+
+    created = None
+    sub_path = args.subscription
+    if not sub_path:
+        if not os.environ.get("PUBSUB_EMULATOR_HOST"):
+            sys.exit("set PUBSUB_EMULATOR_HOST, or pass --subscription for read-only calls")
+        project = os.environ.get("PROJECT_ID", "local-test")
+        run_id = uuid.uuid4().hex[:8]
+        pub, sub = pubsub_v1.PublisherClient(), pubsub_v1.SubscriberClient()
+        topic_path = pub.topic_path(project, f"admin-bench-{run_id}")
+        sub_path = sub.subscription_path(project, f"admin-bench-{run_id}")
+        pub.create_topic(request={"name": topic_path})
+        sub.create_subscription(request={"name": sub_path, "topic": topic_path})
+        created = (pub, sub, topic_path)
+
+    cold = []
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        client = pubsub_v1.SubscriberClient()
+        client.get_subscription(request={"subscription": sub_path})
+        cold.append(time.perf_counter() - t0)
+        client.close()  # the old endpoints leaked these; don't let the bench run out of fds
+
+    registry = PubSubClients(log=lambda line: None)
+    warm = []
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        registry.subscriber().get_subscription(request={"subscription": sub_path})
+        warm.append(time.perf_counter() - t0)
+    registry.close()
+
+    if created:
+        pub, sub, topic_path = created
+        sub.delete_subscription(request={"subscription": sub_path})
+        pub.delete_topic(request={"topic": topic_path})
+
+    c, w = _summary(cold), _summary(warm)
+    print(json.dumps({
+        "subscription": sub_path,
+        "cold": c,
+        "warm": w,
+        # the first warm request pays the one-time build; exclude it here
+        "warm_after_first_p50_ms": _summary(warm[1:])["p50_ms"] if len(warm) > 1 else None,
+        "p50_speedup": round(c["p50_ms"] / w["p50_ms"], 1) if w["p50_ms"] else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Concurrency benchmark: many simultaneous clients against one server.
+
+Start the same backend both ways against local stand-ins (Pub/Sub emulator
+via PUBSUB_EMULATOR_HOST, plain Postgres via DATABASE_URL):
+
+    gunicorn backend.app:app --workers=1 --worker-class=gthread --threads=32 --bind 127.0.0.1:5000
+    uvicorn backend.asgi:app --host 127.0.0.1 --port 5001
+
+then run
+
+    python bench/concurrency_bench.py --url http://127.0.0.1:5000 --clients 500
+    python bench/concurrency_bench.py --url http://127.0.0.1:5001 --clients 500
+
+Each client runs its own keep-alive connection and loops over the chosen
+route for --seconds. The client side is a single asyncio loop, so it is
+not itself limited by thread count.
+"""
+import argparse, asyncio, json, statistics, time
+from urllib.parse import urlsplit
+
+
+async def client(host, port, route, seconds, idx, lat, errors):
+    deadline = time.perf_counter() + seconds
+    reader = writer = None
+    n = 0
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            if route == "publish":
+                body = json.dumps({
+                    "message": f"bench {idx}-{n}",
+                    "attributes": {"source": "bench", "messageId": f"{idx:04d}{n:08d}"},
+                }).encode("utf-8")
+                head = (f"POST /publish HTTP/1.1\r\nHost: {host}\r\n"
+                        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+                payload = head.encode("ascii") + body
+            else:
+                payload = (f"GET /api/messages?limit=10&page={1 + n % 5} HTTP/1.1\r\n"
+                           f"Host: {host}\r\n\r\n").encode("ascii")
+            n += 1
+            t0 = time.perf_counter()
+            writer.write(payload)
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value.strip())
+            if length:
+                await reader.readexactly(length)
+            if not status_line.split(b" ")[1].startswith((b"2", b"3")):
+                errors.append(status_line)
+            else:
+                lat.append(time.perf_counter() - t0)
+        except (OSError, asyncio.IncompleteReadError, IndexError) as e:
+            errors.append(repr(e))
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    lat, errors = [], []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(
+        client(parts.hostname, parts.port or 80, args.route, args.seconds, i, lat, errors)
+        for i in range(args.clients)
+    ))
+    elapsed = time.perf_counter() - t0
+    lat.sort()
+    pick = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 2) if lat else None
+    print(json.dumps({
+        "url": args.url,
+        "route": args.route,
+        "clients": args.clients,
+        "requests": len(lat),
+        "errors": len(errors),
+        "rps": round(len(lat) / elapsed, 1),
+        "p50_ms": pick(0.50),
+        "p99_ms": pick(0.99),
+        "mean_ms": round(statistics.mean(lat) * 1000, 2) if lat else None,
+    }, indent=2))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--route", choices=["messages", "publish"], default="messages")
+    ap.add_argument("--clients", type=int, default=500)
+    ap.add_argument("--seconds", type=float, default=20)
+    args = ap.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
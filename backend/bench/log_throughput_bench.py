@@ -0,0 +1,164 @@
+"""
+Pull-loop logging cost: per-message print() vs the queued EventLog.
+
+    python bench/log_throughput_bench.py --messages 50000
+    python bench/log_throughput_bench.py --messages 20000 --sink slowpipe --rate 5000
+
+Each mode logs the same pulled-message dicts the streaming callback sees.
+"print" is what the callback used to do (print the whole item with
+flush=True, one write syscall per message); "eventlog_all" queues every
+message through EventLog with no policy, so only the batching differs;
+"eventlog" uses the app's default pull.message policy (1 in 100, at most
+10/s). --sink file writes to a temp file, --sink pipe to a child process
+reading stdout like a log collector would, and --sink slowpipe to a reader
+capped at --pipe-kbps, i.e. a collector that can't keep up: print() then
+blocks the pull callback, EventLog queues (and past queue_size drops and
+counts). With --rate the producer is paced at that many msgs/s and the
+report shows whether it kept up.
+Prints caller-side microseconds per message and the implied max msgs/s.
+"""
+import argparse, json, os, subprocess, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.eventlog import EventLog
+
+PULL_MESSAGE_POLICY = {"every": 100, "rate": 10.0, "burst": 10}
+
+
+def _items(n):
+    return [
+        {
+            "data": f"message body number {i} " + "x" * 80,
+            "attributes": {"source": "bench", "client_message_id": f"cid-{i}"},
+            "messageId": str(10_000_000 + i),
+            "publishTime": "2026-01-01 00:00:00.000000+00:00",
+        }
+        for i in range(n)
+    ]
+
+
+def _open_sink(kind, kbps=0):
+    if kind in ("pipe", "slowpipe"):
+        reader = "import sys\nfor _ in sys.stdin.buffer: pass"
+        if kind == "slowpipe":
+            reader = (
+                "import sys, time\n"
+                f"while sys.stdin.buffer.read1(4096): time.sleep(4096 / ({kbps} * 1024))"
+            )
+        proc = subprocess.Popen(
+            [sys.executable, "-c", reader],
+            stdin=subprocess.PIPE, text=True, bufsize=1,
+        )
+        return proc.stdin, proc
+    return tempfile.TemporaryFile("w+"), None
+
+
+def _close_sink(stream, proc):
+    stream.close()
+    if proc is not None:
+        proc.wait()
+
+
+def _drive(items, log_one, rate):
+    """Call log_one(item) for every item; returns (elapsed seconds, fell behind)."""
+    interval = 1.0 / rate if rate else 0.0
+    t0 = time.perf_counter()
+    for i, item in enumerate(items):
+        if interval:
+            due = t0 + i * interval
+            now = time.perf_counter()
+            if now < due:
+                time.sleep(due - now)
+        log_one(item)
+    elapsed = time.perf_counter() - t0
+    behind = bool(rate) and elapsed > len(items) / rate * 1.05
+    return elapsed, behind
+
+
+def _result(name, n, busy, elapsed, behind, extra=None):
+    per = busy / n
+    return {
+        "mode": name,
+        "us_per_message": round(per * 1e6, 2),
+        "max_msgs_per_s": int(1 / per) if per else None,
+        "elapsed_s": round(elapsed, 3),
+        "fell_behind": behind,
+        **(extra or {}),
+    }
+
+
+def run_print(items, sink, rate, kbps):
+    stream, proc = _open_sink(sink, kbps)
+    busy = [0.0]
+
+    def log_one(item):
+        t = time.perf_counter()
+        print(f"[PULL]  {item}", file=stream, flush=True)
+        busy[0] += time.perf_counter() - t
+
+    elapsed, behind = _drive(items, log_one, rate)
+    _close_sink(stream, proc)
+    return _result("print", len(items), busy[0], elapsed, behind)
+
+
+def run_eventlog(name, items, sink, rate, kbps, policies):
+    stream, proc = _open_sink(sink, kbps)
+    events = EventLog(stream, policies=policies, queue_size=10000, report_interval=3600)
+    events.start()
+    busy = [0.0]
+
+    def log_one(item):
+        t = time.perf_counter()
+        events.emit(
+            "pull.message", level="debug",
+            message_id=item["messageId"],
+            bytes=len(item["data"]),
+            source=item["attributes"].get("source"),
+        )
+        busy[0] += time.perf_counter() - t
+
+    elapsed, behind = _drive(items, log_one, rate)
+    t = time.perf_counter()
+    events.stop(timeout=60)
+    drain = time.perf_counter() - t
+    stats = events.stats()
+    _close_sink(stream, proc)
+    return _result(name, len(items), busy[0], elapsed, behind, {
+        "drain_s": round(drain, 3),
+        "written": stats["written"],
+        "suppressed": stats["suppressed"],
+        "dropped": stats["dropped"],
+    })
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=50000)
+    ap.add_argument("--sink", choices=["file", "pipe", "slowpipe"], default="file")
+    ap.add_argument("--pipe-kbps", type=int, default=512, help="slowpipe reader speed")
+    ap.add_argument("--rate", type=float, default=0, help="pace the producer at N msgs/s (0 = flat out)")
+    args = ap.parse_args()
+
+    items = _items(args.messages)
+    results = [
+        run_print(items, args.sink, args.rate, args.pipe_kbps),
+        run_eventlog("eventlog_all", items, args.sink, args.rate, args.pipe_kbps, None),
+        run_eventlog("eventlog", items, args.sink, args.rate, args.pipe_kbps,
+                     {"pull.message": PULL_MESSAGE_POLICY}),
+    ]
+    base = results[0]["us_per_message"]
+    for r in results:
+        r["speedup_vs_print"] = round(base / r["us_per_message"], 1) if r["us_per_message"] else None
+        r["sustains_5k_per_s"] = bool(r["max_msgs_per_s"] and r["max_msgs_per_s"] >= 5000)
+
+    print(json.dumps({
+        "messages": args.messages,
+        "sink": args.sink,
+        "rate": args.rate or None,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
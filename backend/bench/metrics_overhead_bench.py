@@ -0,0 +1,91 @@
+"""
+Cost of the /metrics instrumentation on the hot paths.
+
+    python bench/metrics_overhead_bench.py --iterations 200000
+
+Times each primitive the request paths use (a bound histogram's time()
+block, observe(), a labelled lookup + time(), counter inc) and a pooled
+connection checkout with and without metrics.timed_pool (SQLite in memory,
+so only the pool's own cost is measured). Per-request overhead is the sum
+of what one /publish or /api/messages call records. Prints JSON, in
+microseconds.
+"""
+import argparse, json, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from backend import metrics
+
+
+def _us(fn, iterations):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=200000)
+    args = ap.parse_args()
+    n = args.iterations
+
+    def noop():
+        pass
+
+    def bound_timer():
+        with metrics.MODERATION_SECONDS.time():
+            pass
+
+    def labelled_timer():
+        with metrics.MESSAGES_QUERY_SECONDS.labels("count", "exact").time():
+            pass
+
+    primitives = {
+        "baseline_call": _us(noop, n),
+        "bound_histogram_time": _us(bound_timer, n),
+        "histogram_observe": _us(lambda: metrics.PULL_ACK_SECONDS.observe(0.001), n),
+        "labelled_histogram_time": _us(labelled_timer, n),
+        "counter_inc": _us(metrics.PULL_IDLE_CYCLES.inc, n),
+    }
+
+    plain = create_engine("sqlite://", poolclass=QueuePool, pool_size=5)
+    timed = create_engine("sqlite://", poolclass=metrics.timed_pool("bench"), pool_size=5)
+
+    def checkout(engine):
+        def run():
+            with engine.connect():
+                pass
+        return run
+
+    pool = {
+        "checkout_plain": _us(checkout(plain), n // 10),
+        "checkout_timed": _us(checkout(timed), n // 10),
+    }
+
+    # what one request records: /publish = moderation + ack + db_tx timers and
+    # a checkout; /api/messages = page + count timers and a checkout
+    checkout_extra = pool["checkout_timed"] - pool["checkout_plain"]
+    per_request = {
+        "publish_us": round(3 * primitives["bound_histogram_time"] + checkout_extra, 2),
+        "messages_us": round(2 * primitives["labelled_histogram_time"] + checkout_extra, 2),
+    }
+
+    t0 = time.perf_counter()
+    body, _ = metrics.render()
+    render_ms = (time.perf_counter() - t0) * 1000
+
+    print(json.dumps({
+        "iterations": n,
+        "primitives_us": {k: round(v, 3) for k, v in primitives.items()},
+        "pool_checkout_us": {k: round(v, 2) for k, v in pool.items()},
+        "per_request_overhead": per_request,
+        "scrape": {"render_ms": round(render_ms, 2), "bytes": len(body)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Microbenchmark: moderation cost per message, old path vs backend/moderation.py.
+
+    python bench/moderation_bench.py --iterations 2000
+
+"Old" is what the publish route did before: contains_bad(raw) and, when
+flagged, mask_text(raw), i.e. _norm + better_profanity twice. "New" is one
+ModerationEngine.moderate(raw). Short and long messages, clean and
+profane, are timed separately. Prints microseconds per message as JSON.
+"""
+import argparse, json, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.moderation import ModerationEngine, load_wordlist
+from backend.tests.test_moderation import make_legacy
+
+
+SENTENCE = "Deploy finished for the capstone receiver, latency looks fine and the dashboard is green. "
+MESSAGES = {
+    "short_clean": "hello from the publisher",
+    "short_profane": "what the fuuuck is this sh!t",
+    "long_clean": SENTENCE * 20,
+    "long_profane": SENTENCE * 10 + "b1tch please, that was a blow-job level f.u.c.k up. " + SENTENCE * 10,
+}
+
+
+def _per_message_us(fn, raw, iterations):
+    fn(raw)  # warm
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn(raw)
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=2000)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    engine = ModerationEngine(load_wordlist())
+    compile_ms = (time.perf_counter() - t0) * 1000
+    legacy = make_legacy()
+
+    results = {"compile_ms": round(compile_ms, 1), "messages": {}}
+    for name, raw in MESSAGES.items():
+        if legacy(raw) != engine.moderate(raw):
+            sys.exit(f"{name}: engine and legacy disagree")
+        # the old path is 100-1000x slower; fewer rounds keep the run short
+        old = _per_message_us(legacy, raw, max(1, args.iterations // 200))
+        new = _per_message_us(engine.moderate, raw, args.iterations)
+        results["messages"][name] = {
+            "chars": len(raw),
+            "old_us": round(old, 1),
+            "new_us": round(new, 1),
+            "speedup": round(old / new, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
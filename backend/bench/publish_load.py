@@ -0,0 +1,109 @@
+"""
+Load test for POST /publish.
+
+Run the backend against the Pub/Sub emulator, then point this at it:
+
+    gcloud beta emulators pubsub start --project=local-test
+    export PUBSUB_EMULATOR_HOST=localhost:8085 PROJECT_ID=local-test
+    python bench/publish_load.py --setup-emulator        # creates topic/sub once
+    gunicorn backend.app:app --workers=1 --bind 127.0.0.1:5000 &
+    python bench/publish_load.py --requests 2000 --concurrency 32 --wait   # before
+    python bench/publish_load.py --requests 2000 --concurrency 32          # after
+
+Prints p50/p99 latency and requests per second.
+"""
+import argparse, json, os, statistics, threading, time
+import urllib.request, urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+
+def setup_emulator():
+    from google.cloud import pubsub_v1
+    from google.api_core.exceptions import AlreadyExists
+
+    project = os.environ.get("PROJECT_ID", "local-test")
+    topic_id = os.environ.get("TOPIC_ID", "app-messages")
+    sub_id = os.environ.get("SUB_PULL_ID", "app-sub-pull-test")
+    pub = pubsub_v1.PublisherClient()
+    sub = pubsub_v1.SubscriberClient()
+    topic_path = pub.topic_path(project, topic_id)
+    sub_path = sub.subscription_path(project, sub_id)
+    try:
+        pub.create_topic(request={"name": topic_path})
+    except AlreadyExists:
+        pass
+    try:
+        sub.create_subscription(request={"name": sub_path, "topic": topic_path})
+    except AlreadyExists:
+        pass
+    print(f"emulator ready: {topic_path} -> {sub_path}")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--wait", action="store_true", help="use the blocking durable-ack mode")
+    ap.add_argument("--setup-emulator", action="store_true")
+    args = ap.parse_args()
+
+    if args.setup_emulator:
+        setup_emulator()
+        return
+
+    url = f"{args.url}/publish" + ("?wait=1" if args.wait else "")
+    base_id = int(time.time() * 1000)
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        body = json.dumps({
+            "message": f"load test message {i}",
+            "attributes": {"source": "loadtest", "messageId": str(base_id + i)},
+        }).encode("utf-8")
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                resp.read()
+            ok = True
+        except (urllib.error.URLError, OSError):
+            ok = False
+        dt = time.perf_counter() - t0
+        with lock:
+            if ok:
+                latencies.append(dt)
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        list(ex.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - t0
+
+    report = {
+        "mode": "wait" if args.wait else "async",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Drive backend/puller.py against the Pub/Sub emulator.
+
+    gcloud beta emulators pubsub start --project=local-test
+    PUBSUB_EMULATOR_HOST=localhost:8085 python bench/pull_bench.py --messages 20000
+
+Publishes a backlog, drains it with AdaptivePuller, checks every message
+arrived and was acked, and prints throughput. Exits non-zero on a mismatch.
+"""
+import argparse, json, os, sys, threading, time, uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from google.cloud import pubsub_v1
+from backend.puller import AdaptivePuller
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=20000)
+    ap.add_argument("--streams", type=int, default=2)
+    ap.add_argument("--max-batch", type=int, default=1000)
+    ap.add_argument("--timeout", type=float, default=120)
+    args = ap.parse_args()
+
+    if not os.environ.get("PUBSUB_EMULATOR_HOST"):
+        sys.exit("PUBSUB_EMULATOR_HOST is not set; refusing to run against real Pub/Sub")
+
+    project = os.environ.get("PROJECT_ID", "local-test")
+    run_id = uuid.uuid4().hex[:8]
+    pub = pubsub_v1.PublisherClient(
+        batch_settings=pubsub_v1.types.BatchSettings(max_messages=1000, max_latency=0.05)
+    )
+    sub = pubsub_v1.SubscriberClient()
+    topic_path = pub.topic_path(project, f"pull-bench-{run_id}")
+    sub_path = sub.subscription_path(project, f"pull-bench-{run_id}")
+    pub.create_topic(request={"name": topic_path})
+    sub.create_subscription(request={"name": sub_path, "topic": topic_path, "ack_deadline_seconds": 60})
+
+    futures = [pub.publish(topic_path, f"msg {i}".encode("utf-8"), seq=str(i)) for i in range(args.messages)]
+    for f in futures:
+        f.result(timeout=60)
+    print(f"published {args.messages} messages", flush=True)
+
+    seen = set()
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def on_message(m):
+        with lock:
+            seen.add(m.attributes["seq"])
+            if len(seen) >= args.messages:
+                done.set()
+
+    puller = AdaptivePuller(sub, sub_path, on_message, streams=args.streams,
+                            max_batch=args.max_batch, log=lambda line: None)
+    t0 = time.perf_counter()
+    puller.start()
+    done.wait(args.timeout)
+    elapsed = time.perf_counter() - t0
+    puller.stop()
+    stats = puller.stats()
+
+    sub.delete_subscription(request={"subscription": sub_path})
+    pub.delete_topic(request={"topic": topic_path})
+
+    ok = len(seen) == args.messages and stats["acked"] >= args.messages
+    print(json.dumps({
+        "ok": ok,
+        "messages": args.messages,
+        "unique_received": len(seen),
+        "seconds": round(elapsed, 2),
+        "msgs_per_sec": round(len(seen) / elapsed, 1) if elapsed else None,
+        "puller": stats,
+    }, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
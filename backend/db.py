@@ -0,0 +1,229 @@
+"""
+SQLAlchemy engines for the write and read roles.
+
+    engine = make_engine(url, role="write", pool_size=5, max_overflow=5)
+    read_engine = make_engine(replica_url, role="read", pool_size=5, max_overflow=10)
+    with read_engine.begin() as conn:
+        rows = conn.execute(hot(sql), params).fetchall()
+
+Each role gets its own pool (and its own db_pool_* metrics label), so a
+burst of dashboard COUNTs waits on the read pool instead of taking the
+connections publishes need.
+
+Liveness: ping="always" is pool_pre_ping, a SELECT 1 round trip on every
+checkout. ping="idle" only pings connections that sat in the pool longer
+than ping_idle seconds; ones in steady use skip it. A connection that died
+anyway fails its statement, SQLAlchemy sees the disconnect and invalidates
+every connection older than it, so an outage costs one failed request per
+pool rather than one per stale connection. pool_recycle still retires
+connections before server or proxy idle timeouts get to them.
+
+Prepared statements: pg8000 runs each parameterized statement unnamed, with
+a Parse, a Describe and a Bind/Execute, three round trips and a fresh plan
+every time. Statements built with hot() (or executed with
+execution_options(prepare=True)) are instead parsed once per pooled
+connection as a named statement and then run with a single Bind/Execute.
+The set is bounded per connection by max_prepared and dies with the
+connection. Needs session-level pooling: leave prepare off behind a
+transaction-mode pgbouncer.
+
+That path drives pg8000 below its DB-API (prepare_statement/execute_named,
+the connection's transaction flag and the cursor's result fields), so it is
+off unless make_engine(prepare=True), and even then only switched on for the
+pg8000 series it was written against (requirements.txt pins it) with every
+internal in PREPARE_INTERNALS present; tests/test_db.py checks the installed
+pg8000 against that list. Any other version, or an internal that fails
+before the statement reaches the server, falls back to plain execution;
+stats() shows why.
+"""
+import functools, threading, time, weakref
+from sqlalchemy import create_engine, event, exc as sa_exc, text
+
+from backend import metrics
+
+PING_MODES = ("always", "idle", "off")
+# pg8000 series the prepared path was written against
+PREPARE_PG8000_SERIES = "1.31."
+# what _prepare_hot_statements touches below the DB-API, by owner
+PREPARE_INTERNALS = {
+    "Connection": ("prepare_statement", "execute_named", "execute_simple", "_in_transaction"),
+    "Cursor": ("_context", "_row_iter", "_input_oids"),
+}
+
+# per-engine settings and counters for stats()
+_INFO = weakref.WeakKeyDictionary()
+
+
+@functools.lru_cache(maxsize=512)
+def hot(sql: str):
+    """text(sql) marked for per-connection prepare; cached so it's built once."""
+    return text(sql).execution_options(prepare=True)
+
+
+def make_engine(
+    url,
+    *,
+    role: str,
+    creator=None,
+    pool_size: int = 5,
+    max_overflow: int = 5,
+    pool_timeout: float = 30,
+    pool_recycle: int = 1800,
+    ping: str = "idle",
+    ping_idle: float = 30.0,
+    prepare: bool = False,
+    max_prepared: int = 64,
+):
+    if ping not in PING_MODES:
+        raise ValueError(f"ping must be one of {', '.join(PING_MODES)}, got {ping!r}")
+    engine = create_engine(
+        url,
+        **({"creator": creator} if creator is not None else {}),
+        poolclass=metrics.timed_pool(role),
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=ping == "always",
+        pool_recycle=pool_recycle,
+        pool_timeout=pool_timeout,
+    )
+    prepare = prepare and engine.dialect.driver == "pg8000"
+    unsupported = _prepare_unsupported(engine.dialect.dbapi) if prepare else None
+    info = _INFO[engine] = {
+        "role": role, "ping": ping, "prepare": prepare and unsupported is None,
+        "prepare_disabled": unsupported,
+        "lock": threading.Lock(),
+        "counters": {"pings": 0, "ping_failures": 0, "prepared": 0, "prepared_executions": 0},
+    }
+    if ping == "idle":
+        _ping_when_idle(engine, info, ping_idle)
+    if info["prepare"]:
+        _prepare_hot_statements(engine, info, max_prepared)
+    return engine
+
+
+def _count(info, key):
+    with info["lock"]:
+        info["counters"][key] += 1
+
+
+def _ping_when_idle(engine, info, idle):
+    pinged = metrics.DB_POOL_PINGS.labels(pool=info["role"], result="ok")
+    failed = metrics.DB_POOL_PINGS.labels(pool=info["role"], result="failed")
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_conn, record):
+        record.info["idle_since"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_conn, record, proxy):
+        # fresh connections (no checkin yet) were just proven alive by connecting
+        since = record.info.get("idle_since")
+        if since is None or time.monotonic() - since < idle:
+            return
+        _count(info, "pings")
+        try:
+            engine.dialect.do_ping(dbapi_conn)
+        except Exception as e:
+            _count(info, "ping_failures")
+            failed.inc()
+            # the pool discards this connection and retries the checkout
+            raise sa_exc.DisconnectionError(f"idle connection failed its ping: {e!r}") from e
+        pinged.inc()
+
+
+def _prepare_unsupported(pg):
+    """Why the prepared path can't run on this pg8000, or None if it can."""
+    version = getattr(pg, "__version__", "")
+    if not version.startswith(PREPARE_PG8000_SERIES):
+        return f"pg8000 {version or '?'} is not {PREPARE_PG8000_SERIES}x"
+    missing = prepare_internals_missing(pg)
+    if missing:
+        return f"pg8000 {version} has no {missing[0]}"
+    return None
+
+
+def prepare_internals_missing(pg) -> list:
+    """The PREPARE_INTERNALS this pg8000 module lacks, as "Owner.name"."""
+    try:
+        from pg8000.converters import make_params  # noqa: F401
+        from pg8000.dbapi import convert_paramstyle  # noqa: F401
+    except ImportError as e:
+        return [f"helper ({e})"]
+    # cursor state is set per instance; a connectionless Cursor has it all
+    owners = {"Connection": pg.Connection, "Cursor": pg.Cursor(None)}
+    return [f"{owner}.{name}" for owner, names in PREPARE_INTERNALS.items()
+            for name in names if not hasattr(owners[owner], name)]
+
+
+def _prepare_hot_statements(engine, info, max_prepared):
+    from pg8000.converters import make_params
+    from pg8000.dbapi import convert_paramstyle
+
+    pg = engine.dialect.dbapi
+    prepared = metrics.DB_PREPARED_STATEMENTS.labels(pool=info["role"])
+    executions = metrics.DB_PREPARED_EXECUTIONS.labels(pool=info["role"])
+
+    @event.listens_for(engine, "do_execute")
+    def _execute(cursor, statement, parameters, context):
+        opts = context.execution_options
+        if not info["prepare"] or not opts.get("prepare") or opts.get("stream_results"):
+            return None
+        fairy = context.root_connection.connection
+        cache = fairy.info.setdefault("prepared", {})
+        entry = cache.get(statement)
+        if entry is None and len(cache) >= max_prepared:
+            return None
+        con = fairy.dbapi_connection
+        try:
+            pg_sql, vals = convert_paramstyle("format", statement, parameters)
+            params = make_params(con.py_types, vals)
+        except Exception as e:
+            # nothing has been sent yet: run it the ordinary way from now on
+            info["prepare"] = False
+            info["prepare_disabled"] = f"pg8000 internals failed: {e!r}"
+            return None
+        # the same steps (and error mapping) as pg8000's Cursor.execute, with a
+        # named statement in place of execute_unnamed
+        try:
+            if entry is None:
+                # (name, columns, input converters); the server infers param types
+                entry = cache[statement] = con.prepare_statement(pg_sql, ())
+                _count(info, "prepared")
+                prepared.inc()
+            if not con._in_transaction and not con.autocommit:
+                con.execute_simple("begin transaction")
+            name, columns, input_funcs = entry
+            result = con.execute_named(name, params, columns, input_funcs, pg_sql)
+        except pg.DatabaseError as e:
+            msg = e.args[0]
+            code = msg.get("C") if isinstance(msg, dict) else None
+            if code == "23505":
+                raise pg.IntegrityError(msg) from e
+            if code == "28000":
+                raise pg.InterfaceError(msg) from e
+            raise pg.ProgrammingError(msg) from e
+        cursor._context = result
+        cursor._row_iter = iter([] if result.rows is None else result.rows)
+        cursor._input_oids = ()
+        _count(info, "prepared_executions")
+        executions.inc()
+        return True
+
+
+def stats(engine) -> dict:
+    pool = engine.pool
+    info = _INFO[engine]
+    with info["lock"]:
+        counters = dict(info["counters"])
+    return {
+        "role": info["role"],
+        "url": engine.url.render_as_string(hide_password=True),
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "ping": info["ping"],
+        "prepare": info["prepare"],
+        "prepare_disabled": info["prepare_disabled"],
+        **counters,
+    }
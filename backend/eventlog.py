@@ -0,0 +1,165 @@
+"""
+Non-blocking structured event log for the pull loops.
+
+    EVENTS = EventLog(sys.stdout, policies={"sync.idle": {"rate": 1 / 60}})
+    EVENTS.start()
+    EVENTS.emit("pull.message", level="debug", message_id=m.message_id, bytes=len(m.data))
+
+emit() never touches the stream: it applies the event's policy (sample 1 in
+`every`, then a token bucket of `rate` per second with `burst`), and puts
+accepted records on a bounded queue. A background thread serializes them
+as one JSON object per line and writes/flushes in batches. Events dropped
+by a policy (or because the queue was full) are counted per event, and the
+counts are written every `report_interval` seconds as one "log.suppressed"
+record, so nothing disappears without a trace.
+"""
+import json, queue, threading, time
+from datetime import datetime, timezone
+
+
+class _Policy:
+    __slots__ = ("every", "rate", "burst", "tokens", "last", "seen")
+
+    def __init__(self, every: int = 1, rate: float = None, burst: float = None):
+        self.every = max(1, int(every))
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.seen = 0
+
+    def admit(self, now: float) -> bool:
+        self.seen += 1
+        if self.seen % self.every:
+            return False
+        if self.rate is None:
+            return True
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class EventLog:
+    def __init__(
+        self,
+        stream,
+        *,
+        policies=None,
+        queue_size: int = 10000,
+        report_interval: float = 60.0,
+        batch_max: int = 500,
+    ):
+        """
+        policies: {event: {"every": n, "rate": per_second, "burst": n}};
+        events without one are always written.
+        """
+        self.stream = stream
+        self.report_interval = report_interval
+        self.batch_max = batch_max
+        self._policy_args = dict(policies or {})
+        self._policies = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._suppressed = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {"emitted": 0, "written": 0, "suppressed": 0, "dropped": 0, "write_errors": 0}
+
+    # --- producers ---
+
+    def emit(self, event: str, level: str = "info", **fields) -> bool:
+        """Queue one record; returns False if it was sampled out, rate limited or dropped."""
+        now = time.monotonic()
+        with self._lock:
+            policy = self._policies.get(event)
+            if policy is None and event in self._policy_args:
+                policy = self._policies[event] = _Policy(**self._policy_args[event])
+            if policy is not None and not policy.admit(now):
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                self.counters["suppressed"] += 1
+                return False
+            self.counters["emitted"] += 1
+        try:
+            self._queue.put_nowait((time.time(), level, event, fields))
+        except queue.Full:
+            with self._lock:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                self.counters["dropped"] += 1
+            return False
+        return True
+
+    def logger(self, event: str, level: str = "info"):
+        """Adapter for components that take log=callable(line)."""
+        return lambda line: self.emit(event, level=level, msg=line)
+
+    # --- writer ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Write what is queued plus a final suppressed report, then stop."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        next_report = time.monotonic() + self.report_interval
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=0.2))
+                while len(batch) < self.batch_max:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            stopping = self._stop.is_set() and self._queue.empty()
+            if stopping or time.monotonic() >= next_report:
+                report = self._suppressed_report()
+                if report is not None:
+                    batch.append(report)
+                next_report = time.monotonic() + self.report_interval
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _suppressed_report(self):
+        with self._lock:
+            counts, self._suppressed = self._suppressed, {}
+        if not counts:
+            return None
+        return (time.time(), "info", "log.suppressed", {"counts": counts, "window_s": self.report_interval})
+
+    def _write(self, batch):
+        lines = []
+        for ts, level, event, fields in batch:
+            record = {
+                "ts": datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds"),
+                "level": level,
+                "event": event,
+                **fields,
+            }
+            lines.append(json.dumps(record, default=str, ensure_ascii=False))
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            with self._lock:
+                self.counters["write_errors"] += 1
+            return
+        with self._lock:
+            self.counters["written"] += len(lines)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "queued": self._queue.qsize(),
+                "suppressed_pending": dict(self._suppressed),
+            }
@@ -0,0 +1,298 @@
+"""
+Batched writer for messages consumed from Pub/Sub.
+
+Pull loops hand every received message to IngestSink.add() together with an
+ack token. Rows are buffered and written to `messages` in one statement per
+batch (multi-row INSERT, or COPY into a staging table) when the buffer
+reaches batch_size or flush_interval elapses. Only after that transaction
+commits are the batch's tokens passed to on_commit, so a message is acked
+once it is durable. Writes are idempotent: rows whose pubsub_message_id (or
+client_message_id) is already stored are skipped; on a partitioned table
+that check goes through message_keys (see backend/partitions.py). A batch
+that loses a race with a concurrent /publish (unique violation on the text's
+original or the client ID) is retried once, and the retry sees that row.
+"""
+import collections, hashlib, io, json, threading, time
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from backend.partitions import keyed_insert_sql
+
+COLUMNS = (
+    "client_message_id", "pubsub_message_id", "data", "data_hash",
+    "source", "attributes", "publish_time",
+)
+
+# same rule as the publish path: duplicate if an original with this text exists
+_IS_DUP = "EXISTS (SELECT 1 FROM messages m WHERE m.original_hash = {h})"
+
+# plain table: {src} yields COLUMNS + is_duplicate; originals also get original_hash.
+# A redelivery (same pubsub_message_id) or a replayed client ID is skipped;
+# any other conflict raises, so a row is never dropped and acked unseen.
+_PLAIN_INSERT = """
+    INSERT INTO messages (
+        client_message_id, pubsub_message_id, data, data_hash, source,
+        attributes, publish_time, is_duplicate, original_hash
+    )
+    SELECT v.*, CASE WHEN v.is_duplicate THEN NULL ELSE v.data_hash END
+    FROM ({src}) AS v
+    WHERE NOT EXISTS (SELECT 1 FROM messages m WHERE m.client_message_id = v.client_message_id)
+    ON CONFLICT (pubsub_message_id) DO NOTHING
+    RETURNING source, publish_time, is_duplicate
+"""
+
+def _unique_violation(e) -> bool:
+    # SQLAlchemy raises IntegrityError; the raw COPY cursor raises pg8000's
+    # DatabaseError with the SQLSTATE under "C"
+    if isinstance(e, IntegrityError):
+        return True
+    info = e.args[0] if e.args else None
+    return isinstance(info, dict) and info.get("C") == "23505"
+
+def _copy_field(val) -> str:
+    # COPY csv reads an unquoted empty field as NULL and a quoted one as ''.
+    # csv.writer can't emit that split (QUOTE_NONNUMERIC quotes None as ""),
+    # so every value is quoted here and None is left empty.
+    if val is None:
+        return ""
+    return '"' + str(val).replace('"', '""') + '"'
+
+
+# what on_stored gets per inserted row on the raw-cursor (COPY) path
+_Stored = collections.namedtuple("_Stored", "source publish_time is_duplicate")
+
+
+def row_from_message(message) -> dict:
+    """Shape a Pub/Sub message into a `messages` row."""
+    attrs = dict(message.attributes or {})
+    data = message.data.decode("utf-8")
+    client_id = (attrs.get("messageId") or "").strip() or None
+    return {
+        "client_message_id": client_id,
+        "pubsub_message_id": message.message_id,
+        "data": data,
+        "data_hash": hashlib.sha256(data.encode("utf-8")).hexdigest(),
+        "source": (attrs.get("source") or "").strip() or None,
+        "attributes": json.dumps(attrs),
+        "publish_time": message.publish_time,
+    }
+
+
+class IngestSink:
+    def __init__(
+        self,
+        engine,
+        on_commit,
+        *,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        method: str = "insert",
+        on_failed=None,
+        on_stored=None,
+        partitioned=None,
+        log=print,
+    ):
+        """
+        on_commit(tokens) runs after a batch commits (ack here).
+        on_failed(tokens) runs when a batch can't be written (nack here, or
+        nothing and let the ack deadline expire).
+        on_stored(rows) gets the rows a batch inserted, each with
+        source, publish_time and is_duplicate.
+        partitioned() says whether `messages` is partitioned (keyed writes).
+        method is "insert" (multi-row VALUES) or "copy" (COPY into a temp
+        staging table; pg8000 only).
+        """
+        if method not in ("insert", "copy"):
+            raise ValueError(f"unknown ingest method {method!r}")
+        self.engine = engine
+        self.on_commit = on_commit
+        self.on_failed = on_failed
+        self.on_stored = on_stored
+        self.partitioned = partitioned or (lambda: False)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.method = method
+        self.log = log
+
+        self._buf = []
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.counters = {
+            "received": 0,
+            "batches": 0,
+            "rows_written": 0,
+            "rows_skipped": 0,
+            "failed_batches": 0,
+            "flush_seconds": 0.0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ingest-sink", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def add(self, row: dict, token):
+        with self._cond:
+            self._buf.append((row, token))
+            self.counters["received"] += 1
+            if len(self._buf) >= self.batch_size:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stop and len(self._buf) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._buf = self._buf[:self.batch_size], self._buf[self.batch_size:]
+                stopping = self._stop and not self._buf
+            if batch:
+                self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        rows = [r for r, _ in batch]
+        tokens = [t for _, t in batch]
+        t0 = time.perf_counter()
+        try:
+            stored = self.write(rows)
+        except Exception as e:
+            self.counters["failed_batches"] += 1
+            self.log(f"[INGEST] batch of {len(rows)} failed: {e!r}")
+            if self.on_failed is not None:
+                self.on_failed(tokens)
+            return
+        self.counters["flush_seconds"] += time.perf_counter() - t0
+        self.counters["batches"] += 1
+        self.counters["rows_written"] += len(stored)
+        self.counters["rows_skipped"] += len(rows) - len(stored)
+        if stored and self.on_stored is not None:
+            self.on_stored(stored)
+        self.on_commit(tokens)
+
+    def write(self, rows) -> list:
+        """Write one batch in a single transaction. Returns the inserted rows."""
+        # a client ID repeated inside the batch is a replay of its first row,
+        # and the second copy of a text can't see the first via EXISTS
+        client_ids, seen, kept, dups = set(), set(), [], []
+        for r in rows:
+            cid = r["client_message_id"]
+            if cid is not None:
+                if cid in client_ids:
+                    continue
+                client_ids.add(cid)
+            kept.append(r)
+            dups.append(r["data_hash"] in seen)
+            seen.add(r["data_hash"])
+        write = self._write_copy if self.method == "copy" else self._write_insert
+        for attempt in (0, 1):
+            try:
+                return write(kept, dups)
+            except Exception as e:
+                # a concurrent /publish stored this text as its original, or
+                # this client ID, after our checks; the retry sees its row
+                if attempt or not _unique_violation(e):
+                    raise
+
+    def _write_insert(self, rows, dups) -> list:
+        keyed = self.partitioned()
+        values, params = [], {}
+        for i, (r, dup) in enumerate(zip(rows, dups)):
+            # keyed: VALUES feeds a CTE, not the table, so untyped params would become text
+            is_dup = f"CAST(:dup{i} AS BOOLEAN)" if keyed else f":dup{i} OR {_IS_DUP.format(h=f':hash{i}')}"
+            values.append(
+                f"(:cid{i}, :pid{i}, :data{i}, :hash{i}, :source{i}, CAST(:attrs{i} AS JSONB), "
+                f"CAST(:pt{i} AS TIMESTAMPTZ), {is_dup})"
+            )
+            params.update({
+                f"cid{i}": r["client_message_id"],
+                f"pid{i}": r["pubsub_message_id"],
+                f"data{i}": r["data"],
+                f"hash{i}": r["data_hash"],
+                f"source{i}": r["source"],
+                f"attrs{i}": r["attributes"],
+                f"pt{i}": r["publish_time"],
+                f"dup{i}": dup,
+            })
+        if keyed:
+            with self.engine.begin() as conn:
+                return conn.execute(text(keyed_insert_sql(f"""
+                    SELECT * FROM (VALUES {", ".join(values)}) AS v (
+                        client_message_id, pubsub_message_id, data, data_hash, source,
+                        attributes, publish_time, dup
+                    )
+                """, replay=False)), params).fetchall()
+        with self.engine.begin() as conn:
+            result = conn.execute(text(_PLAIN_INSERT.format(src=f"""
+                SELECT * FROM (VALUES {", ".join(values)}) AS v (
+                    client_message_id, pubsub_message_id, data, data_hash, source,
+                    attributes, publish_time, is_duplicate
+                )
+            """)), params)
+            return result.fetchall()
+
+    def _write_copy(self, rows, dups) -> list:
+        buf = io.StringIO()
+        for r, dup in zip(rows, dups):
+            buf.write(",".join(_copy_field(
+                r[c].isoformat() if c == "publish_time" and r[c] is not None else r[c]
+            ) for c in COLUMNS))
+            buf.write(",t\n" if dup else ",f\n")
+        buf.seek(0)
+
+        raw = self.engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS ingest_stage (
+                    client_message_id TEXT, pubsub_message_id TEXT, data TEXT,
+                    data_hash TEXT, source TEXT, attributes JSONB,
+                    publish_time TIMESTAMPTZ, dup BOOLEAN
+                ) ON COMMIT DELETE ROWS
+            """)
+            cur.execute(
+                f"COPY ingest_stage ({', '.join(COLUMNS)}, dup) FROM STDIN WITH (FORMAT csv)",
+                stream=buf,
+            )
+            if self.partitioned():
+                cur.execute(keyed_insert_sql(
+                    f"SELECT {', '.join(COLUMNS)}, dup FROM ingest_stage", replay=False,
+                ))
+                stored = [_Stored(r[3], r[4], r[2]) for r in cur.fetchall()]
+            else:
+                cur.execute(_PLAIN_INSERT.format(src=f"""
+                    SELECT {', '.join('s.' + c for c in COLUMNS)},
+                           s.dup OR {_IS_DUP.format(h='s.data_hash')} AS is_duplicate
+                    FROM ingest_stage s
+                """))
+                stored = [_Stored(*r) for r in cur.fetchall()]
+            raw.commit()
+            return stored
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            buffered = len(self._buf)
+        c = dict(self.counters)
+        return {
+            **c,
+            "buffered": buffered,
+            "method": self.method,
+            "batch_size": self.batch_size,
+            "rows_per_sec_while_flushing": round(c["rows_written"] / c["flush_seconds"], 1)
+            if c["flush_seconds"] else None,
+        }
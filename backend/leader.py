@@ -0,0 +1,113 @@
+"""
+Leader election for the background puller.
+
+With several gunicorn workers only one process may pull from the
+subscription. Each worker runs a candidate loop; whoever holds the lock
+runs the puller, the rest retry every few seconds so a new leader takes
+over when the old one exits.
+
+    file:     fcntl.flock on a shared file (one host)
+    postgres: pg_try_advisory_lock on a dedicated connection (any host)
+
+Received messages then only reach the leader's process; set RECENT_SHM_PATH
+so the other workers on the host read them from the shared ring (app.py
+warns at boot when a lock is set without it).
+"""
+import fcntl, os, threading
+from sqlalchemy import text
+
+# arbitrary app-wide key for pg advisory locks
+ADVISORY_KEY = 0x70756C6C  # "pull"
+
+
+class FileLeaderLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def still_held(self) -> bool:
+        # flock lives as long as this process keeps the fd open
+        return self._fd is not None
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class PostgresLeaderLock:
+    def __init__(self, engine, key: int = ADVISORY_KEY):
+        self.engine = engine
+        self.key = key
+        self._conn = None
+
+    def try_acquire(self) -> bool:
+        conn = self.engine.connect()
+        got = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": self.key}).scalar()
+        conn.commit()
+        if not got:
+            conn.close()
+            return False
+        # session-level lock: keep this connection out of the pool for good
+        conn.detach()
+        self._conn = conn
+        return True
+
+    def still_held(self) -> bool:
+        if self._conn is None:
+            return False
+        try:
+            self._conn.execute(text("SELECT 1")).scalar()
+            self._conn.commit()
+            return True
+        except Exception:
+            # connection gone means the lock went with it
+            self._conn = None
+            return False
+
+    def release(self):
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": self.key})
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+def run_for_leadership(lock, on_elected, on_lost, *, retry: float = 5.0, log=print):
+    """Start a daemon thread that calls on_elected() while `lock` is held."""
+    stop = threading.Event()
+
+    def _loop():
+        leading = False
+        while not stop.is_set():
+            if not leading:
+                try:
+                    leading = lock.try_acquire()
+                except Exception as e:
+                    log(f"[LEADER] acquire failed: {e!r}")
+                if leading:
+                    log(f"[LEADER] pid {os.getpid()} is now the puller leader")
+                    on_elected()
+            elif not lock.still_held():
+                leading = False
+                log(f"[LEADER] pid {os.getpid()} lost leadership")
+                on_lost()
+            stop.wait(retry)
+        if leading:
+            on_lost()
+            lock.release()
+
+    threading.Thread(target=_loop, name="leader-election", daemon=True).start()
+    return stop
@@ -0,0 +1,114 @@
+"""
+Prometheus metrics for the hot paths, served at GET /metrics.
+
+    publish_stage_seconds{stage="moderation"|"pubsub_ack"|"db_tx"}
+    messages_query_seconds{query="page"|"count", strategy=...}
+    pull_batch_size, pull_idle_cycles_total, pull_ack_seconds, pull_acked_total
+    recent_buffer_items / recent_buffer_capacity
+    db_pool_checkout_seconds{pool}, db_pool_checkouts_total{pool},
+    db_pool_timeouts_total{pool}, db_pool_checked_out{pool}  (pool="write"|"read")
+    db_pool_pings_total{pool, result}, db_prepared_statements_total{pool},
+    db_prepared_executions_total{pool}
+
+Children for fixed label values are bound once at import so the hot paths
+only pay for an observe() (a few microseconds, see bench/metrics_overhead_bench.py).
+With several gunicorn workers, point PROMETHEUS_MULTIPROC_DIR at an empty
+directory before the server starts and render() aggregates every worker.
+"""
+import os, time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+from sqlalchemy import event, exc as sa_exc
+from sqlalchemy.pool import QueuePool
+
+# 0.5ms .. 10s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PUBLISH_STAGE_SECONDS = Histogram(
+    "publish_stage_seconds", "Time spent per /publish stage", ["stage"], buckets=LATENCY_BUCKETS,
+)
+MODERATION_SECONDS = PUBLISH_STAGE_SECONDS.labels(stage="moderation")
+PUBSUB_ACK_SECONDS = PUBLISH_STAGE_SECONDS.labels(stage="pubsub_ack")
+DB_TX_SECONDS = PUBLISH_STAGE_SECONDS.labels(stage="db_tx")
+
+MESSAGES_QUERY_SECONDS = Histogram(
+    "messages_query_seconds", "/api/messages SQL time", ["query", "strategy"], buckets=LATENCY_BUCKETS,
+)
+STATS_QUERY_SECONDS = Histogram(
+    "stats_query_seconds", "/api/stats rollup read time", ["granularity"], buckets=LATENCY_BUCKETS,
+)
+
+PULL_BATCH_SIZE = Histogram(
+    "pull_batch_size", "Messages returned per pull", buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+PULL_IDLE_CYCLES = Counter("pull_idle_cycles_total", "Pulls that returned no messages")
+PULL_ACK_SECONDS = Histogram("pull_ack_seconds", "Latency of batched acknowledge calls", buckets=LATENCY_BUCKETS)
+PULL_ACKED = Counter("pull_acked_total", "Messages acknowledged by the pull loop")
+
+RECENT_ITEMS = Gauge("recent_buffer_items", "Messages held in RECENT", multiprocess_mode="max")
+RECENT_CAPACITY = Gauge("recent_buffer_capacity", "RECENT size limit", multiprocess_mode="max")
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time to get a usable pooled connection (wait + connect + ping)",
+    ["pool"], buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Pool checkouts", ["pool"])
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that hit pool_timeout", ["pool"])
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out", ["pool"],
+                            multiprocess_mode="livesum")
+DB_POOL_PINGS = Counter("db_pool_pings_total", "Liveness pings of idle connections on checkout", ["pool", "result"])
+DB_PREPARED_STATEMENTS = Counter("db_prepared_statements_total", "Statements prepared on a pooled connection", ["pool"])
+DB_PREPARED_EXECUTIONS = Counter("db_prepared_executions_total", "Executions of prepared statements", ["pool"])
+
+# refreshed right before each scrape (values that are cheaper to read than to track)
+_samplers = []
+
+
+def add_sampler(fn):
+    _samplers.append(fn)
+    return fn
+
+
+def render():
+    """Return (body, content type) for the /metrics response."""
+    for fn in _samplers:
+        try:
+            fn()
+        except Exception:
+            pass
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def timed_pool(name: str):
+    """A QueuePool subclass that reports checkouts for pool `name`.
+
+        create_engine(url, poolclass=timed_pool("write"), pool_size=5, ...)
+    """
+    seconds = DB_POOL_CHECKOUT_SECONDS.labels(pool=name)
+    checkouts = DB_POOL_CHECKOUTS.labels(pool=name)
+    timeouts = DB_POOL_TIMEOUTS.labels(pool=name)
+    checked_out = DB_POOL_CHECKED_OUT.labels(pool=name)
+
+    class TimedQueuePool(QueuePool):
+        def connect(self):
+            t0 = time.perf_counter()
+            try:
+                conn = super().connect()
+            except sa_exc.TimeoutError:
+                timeouts.inc()
+                raise
+            seconds.observe(time.perf_counter() - t0)
+            checkouts.inc()
+            return conn
+
+    event.listen(TimedQueuePool, "checkout", lambda *a: checked_out.inc())
+    event.listen(TimedQueuePool, "checkin", lambda *a: checked_out.dec())
+    TimedQueuePool.__name__ = f"TimedQueuePool[{name}]"
+    return TimedQueuePool
@@ -0,0 +1,226 @@
+"""
+Compiled profanity filter for the publish path.
+
+Replaces the old `_norm()` + better_profanity pair, which normalized every
+message twice (once for contains_bad, once for mask_text) and then compared
+each word against ~900 word variants one by one. Here the word list is
+compiled once into a trie whose edges are followed through the same
+look-alike character map better_profanity uses (a/@/4, i/l/1, s/$/5, ...),
+and one pass over the normalized text both detects and masks:
+
+    engine = ModerationEngine.from_env()
+    flagged, to_send = engine.moderate(raw)
+
+Matching rules follow better_profanity 0.7 so published text does not
+change: words are runs of its allowed characters, a word (or up to N
+following words, with or without the separators between them, for entries
+like "blow job" or "f.u.c.k") must match a whole list entry, and each match
+becomes "****". Flagged messages are sent in normalized form, as before.
+
+Normalization is not folded into that pass. It keeps the old steps (NFKC
+for non-ASCII text, one translate for the leet table, then the repeat and
+doubled-word regexes), because matching better_profanity means reproducing
+exactly what _norm handed it, and the doubled-word rule needs a
+backreference. It now runs once per message instead of twice.
+tests/test_moderation.py checks all of this against the old implementation.
+"""
+import hashlib, importlib.util, json, os, re, string, unicodedata
+
+# better_profanity's look-alike map: list char -> text chars it may appear as
+CHARS_MAPPING = {
+    "a": ("a", "@", "*", "4"),
+    "i": ("i", "*", "l", "1"),
+    "o": ("o", "*", "0", "@"),
+    "u": ("u", "*", "v"),
+    "v": ("v", "*", "u"),
+    "l": ("l", "1"),
+    "e": ("e", "*", "3"),
+    "s": ("s", "$", "5"),
+    "t": ("t", "7"),
+}
+
+# leetspeak folded before matching (the old _norm substitutions, as one table)
+_LEET = str.maketrans({
+    "@": "a", "4": "a",
+    "!": "i", "1": "i", "|": "i",
+    "$": "s", "5": "s",
+    "0": "o",
+    "3": "e",
+})
+# collapse 3+ repeated characters
+_REPEATS = re.compile(r"(.)\1{2,}")
+# "fuckfuck" / "fuck-fuck" -> "fuck fuck" so each half is seen as a word
+_DOUBLED = re.compile(r"\b([a-z]{3,})[\W_]*\1\b", re.I)
+
+CENSOR = "****"
+
+
+def _better_profanity_file(name: str) -> str:
+    # word list and alphabet ship with better-profanity; locate them without
+    # importing the package (its __init__ builds a full Profanity())
+    spec = importlib.util.find_spec("better_profanity")
+    if spec is None or not spec.submodule_search_locations:
+        raise RuntimeError("better-profanity is not installed; it provides the default word list")
+    return os.path.join(list(spec.submodule_search_locations)[0], name)
+
+
+def load_wordlist(path: str = None) -> list:
+    path = path or _better_profanity_file("profanity_wordlist.txt")
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def load_word_chars() -> set:
+    """Characters that make up a word (better_profanity's ALLOWED_CHARACTERS)."""
+    chars = set(string.ascii_letters) | set(string.digits) | {"@", "$", "*", '"', "'"}
+    with open(_better_profanity_file("alphabetic_unicode.json"), encoding="utf-8") as f:
+        chars.update(json.load(f))
+    return chars
+
+
+def _char_class(chars) -> str:
+    # compact [...] class from a set of code points
+    points = sorted(ord(c) for c in chars)
+    parts, i = [], 0
+    while i < len(points):
+        j = i
+        while j + 1 < len(points) and points[j + 1] == points[j] + 1:
+            j += 1
+        lo, hi = re.escape(chr(points[i])), re.escape(chr(points[j]))
+        parts.append(lo if i == j else f"{lo}-{hi}")
+        i = j + 1
+    return "[" + "".join(parts) + "]"
+
+
+class ModerationEngine:
+    def __init__(self, words, *, whitelist=(), word_chars=None, char_map=CHARS_MAPPING):
+        """
+        words: list entries to censor (case-insensitive).
+        whitelist: entries to drop from `words`.
+        word_chars: characters that form words; defaults to better_profanity's.
+        """
+        skip = {w.strip().lower() for w in whitelist if w.strip()}
+        self.words = sorted({w.lower() for w in words if w.strip()} - skip)
+        # changes whenever the effective word set does (extra/whitelist edits)
+        self.version = hashlib.sha256("\n".join(self.words).encode("utf-8")).hexdigest()[:16]
+        word_chars = word_chars if word_chars is not None else load_word_chars()
+        self._token = re.compile(_char_class(word_chars) + "+")
+
+        # text char -> list chars it can stand for (inverse of char_map)
+        self._alts = {}
+        for listed, shown in char_map.items():
+            for ch in shown:
+                self._alts.setdefault(ch, set()).add(listed)
+        for ch, alts in self._alts.items():
+            if ch not in char_map:
+                alts.add(ch)
+        self._alts = {ch: tuple(alts) for ch, alts in self._alts.items()}
+
+        # trie: node index -> {list char: child}; _final marks whole entries
+        self._edges = [{}]
+        self._final = [False]
+        for w in self.words:
+            node = 0
+            for ch in w:
+                nxt = self._edges[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._edges)
+                    self._edges[node][ch] = nxt
+                    self._edges.append({})
+                    self._final.append(False)
+                node = nxt
+            self._final[node] = True
+
+        # how many following words a multi-word entry can span
+        self.max_span = max([1] + [sum(1 for ch in w if ch not in word_chars) for w in self.words])
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Default list plus PROFANITY_EXTRA_WORDS, minus PROFANITY_WHITELIST."""
+        extra = [w.strip() for w in environ.get("PROFANITY_EXTRA_WORDS", "").split(",") if w.strip()]
+        white = [w.strip() for w in environ.get("PROFANITY_WHITELIST", "").split(",") if w.strip()]
+        return cls(load_wordlist() + extra, whitelist=white)
+
+    # --- public ---
+
+    def normalize(self, t: str) -> str:
+        if not t.isascii():
+            t = unicodedata.normalize("NFKC", t)
+        t = t.translate(_LEET)
+        t = _REPEATS.sub(r"\1\1", t)
+        return _DOUBLED.sub(r"\1 \1", t)
+
+    def censor(self, text: str) -> str:
+        """Mask list entries in already-normalized text."""
+        tokens = [m.span() for m in self._token.finditer(text)]
+        n = len(text)
+        if not tokens or tokens[0][0] >= n - 1:
+            return text
+
+        out, pos, i = [], 0, 0
+        while i < len(tokens):
+            start, end = tokens[i]
+            word = text[start:end].lower()
+            states = self._walk((0,), word)
+            span_to = None
+            # a following word can only complete an entry when this one is
+            # followed by a separator and the next word isn't the last char
+            if states and end < n:
+                plain, joined, prev_end = states, states, end
+                for j in range(i + 1, min(i + 1 + self.max_span, len(tokens))):
+                    nstart, nend = tokens[j]
+                    if nstart >= n - 1:
+                        break
+                    plain = self._walk(plain, text[nstart:nend].lower())
+                    joined = self._walk(joined, text[prev_end:nend].lower())
+                    if self._is_final(plain) or self._is_final(joined):
+                        span_to = j
+                        break
+                    if not plain and not joined:
+                        break
+                    prev_end = nend
+            if span_to is not None:
+                out.append(text[pos:start])
+                out.append(CENSOR)
+                pos = tokens[span_to][1]
+                i = span_to + 1
+                continue
+            if self._is_final(states):
+                out.append(text[pos:start])
+                out.append(CENSOR)
+                pos = end
+            i += 1
+        if pos == 0:
+            return text
+        out.append(text[pos:])
+        return "".join(out)
+
+    def moderate(self, raw: str):
+        """Return (flagged, text to publish): masked normalized text if flagged, else raw."""
+        norm = self.normalize(raw)
+        masked = self.censor(norm)
+        if masked == norm:
+            return False, raw
+        return True, masked
+
+    # --- trie walk ---
+
+    def _walk(self, states, s: str):
+        edges, alts = self._edges, self._alts
+        for ch in s:
+            if not states:
+                return states
+            cand = alts.get(ch, (ch,))
+            nxt = []
+            for node in states:
+                e = edges[node]
+                for c in cand:
+                    child = e.get(c)
+                    if child is not None:
+                        nxt.append(child)
+            states = nxt if len(nxt) < 2 else tuple(set(nxt))
+        return states
+
+    def _is_final(self, states) -> bool:
+        final = self._final
+        return any(final[s] for s in states)
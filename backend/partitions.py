@@ -0,0 +1,499 @@
+"""
+Time partitioning, retention and archival for `messages`.
+
+With MESSAGES_PARTITION_INTERVAL=day|month the table is range partitioned
+on publish_time:
+
+    messages              PARTITION BY RANGE (publish_time), PK (id, publish_time)
+      messages_p202601    [2026-01-01, 2026-02-01) UTC, one per day or month
+      messages_default    rows outside the premade range
+    message_keys          client_message_id, pubsub_message_id and one
+                          original per data_hash, unique across partitions
+
+Postgres only enforces unique indexes on a partitioned table per partition
+(they must include publish_time), so the publish/ingest writes go through
+keyed_insert_sql(), which claims the row's keys in message_keys first and
+only inserts rows whose keys were new.
+
+maintain() creates the next `premake` partitions and archives partitions
+that ended more than retention_days ago: each is detached, copied to
+<archive_dir>/<partition>.csv.gz, its key rows are trimmed and the table is
+dropped. No row-by-row DELETE on messages.
+
+    parts = MessagePartitions(engine, interval="month", premake=3,
+                              retention_days=365, archive_dir="archive")
+    parts.convert()     # once: move an existing plain table into partitions
+    parts.maintain()    # periodically (start() runs it on a thread)
+"""
+import gzip, os, re, threading, time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+
+# pg advisory lock key so only one process runs maintenance at a time
+ADVISORY_KEY = 0x70617274  # "part"
+DEFAULT_PARTITION = "messages_default"
+KEY_TRIM_CHUNK = 50000
+
+_NAME = re.compile(r"^messages_p(\d{4})(\d{2})(\d{2})?$")
+
+
+def keyed_insert_sql(src_sql: str, *, replay: bool) -> str:
+    """
+    INSERT into partitioned `messages` with message_keys as the arbiter.
+
+    src_sql selects (client_message_id, pubsub_message_id, data, data_hash,
+    source, attributes, publish_time, dup); dup marks rows already known to
+    be text duplicates (repeats inside the batch). A row is stored only if
+    its key row is new, and is a duplicate if dup or an original with the
+    same data_hash already holds a key.
+
+    replay=True: a client_message_id that already has a key under another
+    pubsub_message_id is folded into the stored row, like ON CONFLICT
+    (client_message_id) DO UPDATE on the plain table (is_duplicate,
+    publish_time = NOW()); under the same pubsub_message_id (stored by the
+    ingest sink) it returns nothing. replay=False (the ingest sink): rows
+    whose pubsub_message_id or client_message_id already has a key are
+    skipped. Any other key clash, such as a concurrent original of the same
+    text, raises IntegrityError. Returns rows (id, client_message_id,
+    is_duplicate, source, publish_time).
+    """
+    target = "(client_message_id)" if replay else "(pubsub_message_id)"
+    known_client = "" if replay else """
+            WHERE NOT EXISTS (SELECT 1 FROM message_keys k WHERE k.client_message_id = s.client_message_id)"""
+    sql = f"""
+        WITH src AS (
+            SELECT nextval('messages_id_seq') AS id, x.* FROM ({src_sql}) AS x
+        ), claimed AS (
+            INSERT INTO message_keys (id, client_message_id, pubsub_message_id, original_hash, publish_time)
+            SELECT s.id, s.client_message_id, s.pubsub_message_id,
+                   CASE WHEN s.dup OR EXISTS (
+                       SELECT 1 FROM message_keys k WHERE k.original_hash = s.data_hash
+                   ) THEN NULL ELSE s.data_hash END,
+                   s.publish_time
+            FROM src s{known_client}
+            ON CONFLICT {target} DO NOTHING
+            RETURNING id, original_hash IS NULL AS is_duplicate
+        ), stored AS (
+            INSERT INTO messages (
+                id, client_message_id, pubsub_message_id, data, data_hash, source,
+                attributes, publish_time, is_duplicate
+            )
+            SELECT s.id, s.client_message_id, s.pubsub_message_id, s.data, s.data_hash,
+                   s.source, s.attributes, s.publish_time, c.is_duplicate
+            FROM claimed c JOIN src s ON s.id = c.id
+            RETURNING id, client_message_id, is_duplicate, source, publish_time
+        )"""
+    if not replay:
+        return sql + "\n        SELECT id, client_message_id, is_duplicate, source, publish_time FROM stored"
+    # the UPDATEs run on the statement's snapshot, so they only see keys
+    # that existed before it: exactly the replayed IDs
+    return sql + """, replayed AS (
+            UPDATE message_keys k SET publish_time = NOW()
+            FROM src s
+            WHERE k.client_message_id = s.client_message_id
+              AND k.pubsub_message_id IS DISTINCT FROM s.pubsub_message_id
+            RETURNING k.id
+        ), folded AS (
+            UPDATE messages m SET is_duplicate = TRUE, publish_time = NOW()
+            FROM replayed r
+            WHERE m.id = r.id
+            RETURNING m.id, m.client_message_id, m.is_duplicate, m.source, m.publish_time
+        )
+        SELECT id, client_message_id, is_duplicate, source, publish_time FROM stored
+        UNION ALL
+        SELECT id, client_message_id, is_duplicate, source, publish_time FROM folded"""
+
+
+class MessagePartitions:
+    def __init__(
+        self,
+        engine,
+        *,
+        interval: str = "",
+        premake: int = 3,
+        retention_days: int = 0,
+        archive_dir: str = "archive",
+        log=print,
+    ):
+        """
+        interval: "day" or "month"; "" leaves new tables unpartitioned (an
+        already partitioned table is still detected and maintained, monthly
+        unless configured).
+        premake: future partitions kept ahead of now.
+        retention_days: archive partitions that ended this long ago (0 = keep).
+        """
+        if interval not in ("", "day", "month"):
+            raise ValueError(f"partition interval must be day or month, got {interval!r}")
+        self.engine = engine
+        self.enabled = bool(interval)
+        self.interval = interval or "month"
+        self.premake = premake
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.log = log
+
+        self._partitioned = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {
+            "runs": 0,
+            "skipped_locked": 0,
+            "created": 0,
+            "moved_from_default": 0,
+            "archived": 0,
+            "archived_rows": 0,
+            "archive_bytes": 0,
+            "errors": 0,
+            "last_run_at": None,
+            "last_error": None,
+        }
+
+    # --- state ---
+
+    def is_partitioned(self, refresh: bool = False) -> bool:
+        """Whether `messages` is a partitioned table (cached after the first check)."""
+        if self._partitioned is None or refresh:
+            with self.engine.connect() as conn:
+                kind = conn.execute(text("""
+                    SELECT relkind FROM pg_class
+                    WHERE oid = to_regclass('messages')
+                """)).scalar()
+            self._partitioned = kind == "p"
+        return self._partitioned
+
+    # --- bounds and names ---
+
+    def period(self, t: datetime):
+        """[lo, hi) of the partition holding t."""
+        t = t.astimezone(timezone.utc)
+        if self.interval == "day":
+            lo = datetime(t.year, t.month, t.day, tzinfo=timezone.utc)
+            return lo, lo + timedelta(days=1)
+        lo = datetime(t.year, t.month, 1, tzinfo=timezone.utc)
+        return lo, _next_month(lo)
+
+    def name_for(self, lo: datetime) -> str:
+        fmt = "%Y%m%d" if self.interval == "day" else "%Y%m"
+        return f"messages_p{lo.strftime(fmt)}"
+
+    @staticmethod
+    def bounds_of(name: str):
+        """[lo, hi) encoded in a partition name, or None for other tables."""
+        m = _NAME.match(name)
+        if not m:
+            return None
+        y, mo, d = int(m.group(1)), int(m.group(2)), m.group(3)
+        if d:
+            lo = datetime(y, mo, int(d), tzinfo=timezone.utc)
+            return lo, lo + timedelta(days=1)
+        lo = datetime(y, mo, 1, tzinfo=timezone.utc)
+        return lo, _next_month(lo)
+
+    def attached(self, conn) -> list:
+        return conn.execute(text("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'messages'::regclass
+            ORDER BY c.relname
+        """)).scalars().all()
+
+    # --- schema ---
+
+    def create_table(self, conn):
+        """Create an empty partitioned `messages` (new deployments)."""
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id BIGSERIAL,
+                client_message_id TEXT,
+                pubsub_message_id TEXT,
+                data TEXT NOT NULL,
+                source TEXT,
+                attributes JSONB,
+                publish_time TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                is_duplicate BOOLEAN NOT NULL DEFAULT FALSE,
+                PRIMARY KEY (id, publish_time)
+            ) PARTITION BY RANGE (publish_time)
+        """))
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF messages DEFAULT"))
+        self.create_keys_table(conn)
+        self._partitioned = True
+
+    def create_keys_table(self, conn):
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS message_keys (
+                id BIGINT PRIMARY KEY,
+                client_message_id TEXT UNIQUE,
+                pubsub_message_id TEXT UNIQUE,
+                original_hash TEXT UNIQUE,
+                publish_time TIMESTAMPTZ NOT NULL
+            )
+        """))
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_message_keys_publish_time
+            ON message_keys(publish_time)
+        """))
+
+    def convert(self):
+        """
+        Move a plain `messages` table into partitions, in one transaction.
+
+        Writes block on the table lock until it commits; reads continue on
+        the old table. Indexes are built afterwards by migrate_schema(), and
+        running processes need a restart to switch to the keyed writes.
+        """
+        if self.is_partitioned(refresh=True):
+            self.log("[PARTITION] messages is already partitioned")
+            return 0
+        t0 = time.perf_counter()
+        with self.engine.begin() as conn:
+            conn.execute(text("LOCK TABLE messages IN EXCLUSIVE MODE"))
+            cols = _insertable_columns(conn, "messages")
+            oldest = conn.execute(text("SELECT MIN(publish_time) FROM messages")).scalar()
+
+            # keep the id sequence; the old table is dropped below
+            conn.execute(text("ALTER SEQUENCE messages_id_seq OWNED BY NONE"))
+            conn.execute(text("ALTER TABLE messages RENAME TO messages_unpartitioned"))
+            conn.execute(text("""
+                CREATE TABLE messages (LIKE messages_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED)
+                PARTITION BY RANGE (publish_time)
+            """))
+            conn.execute(text("ALTER TABLE messages ADD PRIMARY KEY (id, publish_time)"))
+            conn.execute(text("ALTER SEQUENCE messages_id_seq OWNED BY messages.id"))
+            conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF messages DEFAULT"))
+            self._partitioned = True
+            self._create_range(conn, oldest or datetime.now(timezone.utc))
+
+            # one original per text, the oldest row, as migrate_data_hash sets it
+            self.create_keys_table(conn)
+            conn.execute(text("""
+                INSERT INTO message_keys (id, client_message_id, pubsub_message_id, original_hash, publish_time)
+                SELECT id, client_message_id, pubsub_message_id,
+                       CASE WHEN data_hash IS NOT NULL
+                            AND id = MIN(id) OVER (PARTITION BY data_hash)
+                            THEN data_hash END,
+                       publish_time
+                FROM messages_unpartitioned
+            """))
+            col_sql = ", ".join(cols)
+            moved = conn.execute(text(f"""
+                INSERT INTO messages ({col_sql}) SELECT {col_sql} FROM messages_unpartitioned
+            """)).rowcount
+            conn.execute(text("DROP TABLE messages_unpartitioned"))
+        self.log(f"[PARTITION] moved {moved} row(s) into {self.interval} partitions "
+                 f"in {time.perf_counter() - t0:.1f}s")
+        return moved
+
+    # --- maintenance ---
+
+    def ensure_partitions(self, now=None) -> list:
+        """Create the current and next `premake` partitions; returns new names."""
+        with self.engine.begin() as conn:
+            return self._create_range(conn, now or datetime.now(timezone.utc), now)
+
+    def _create_range(self, conn, start: datetime, now=None) -> list:
+        now = now or datetime.now(timezone.utc)
+        lo, _ = self.period(start)
+        _, last = self.period(now)
+        for _ in range(self.premake):
+            _, last = self.period(last)
+        existing = set(self.attached(conn))
+        created = []
+        while lo < last:
+            lo_next = self.period(lo)[1]
+            name = self.name_for(lo)
+            if name not in existing:
+                self._create_partition(conn, name, lo, lo_next)
+                created.append(name)
+            lo = lo_next
+        if created:
+            self.counters["created"] += len(created)
+            self.log(f"[PARTITION] created {', '.join(created)}")
+        return created
+
+    def _create_partition(self, conn, name, lo, hi):
+        bounds = f"FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+        in_default = conn.execute(text(f"""
+            SELECT 1 FROM {DEFAULT_PARTITION}
+            WHERE publish_time >= :lo AND publish_time < :hi LIMIT 1
+        """), {"lo": lo, "hi": hi}).first()
+        if not in_default:
+            conn.execute(text(f"CREATE TABLE {name} PARTITION OF messages FOR VALUES {bounds}"))
+            return
+        # Postgres refuses a new partition while the default holds rows in its
+        # range: build it on the side, move those rows over, then attach
+        cols = ", ".join(_insertable_columns(conn, "messages"))
+        conn.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING GENERATED)"))
+        moved = conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE publish_time >= :lo AND publish_time < :hi
+                RETURNING {cols}
+            )
+            INSERT INTO {name} ({cols}) SELECT {cols} FROM moved
+        """), {"lo": lo, "hi": hi}).rowcount
+        conn.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES {bounds}"))
+        self.counters["moved_from_default"] += moved
+
+    def archive_expired(self, now=None) -> list:
+        """Detach, archive and drop partitions that ended retention_days ago."""
+        if not self.retention_days:
+            return []
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=self.retention_days)
+        with self.engine.connect() as conn:
+            attached = set(self.attached(conn))
+            # detached by an earlier run that failed before the drop
+            leftovers = conn.execute(text("""
+                SELECT relname FROM pg_class
+                WHERE relkind = 'r' AND relname ~ '^messages_p[0-9]+$'
+                  AND relnamespace = to_regnamespace(current_schema())
+            """)).scalars().all()
+        expired = sorted(
+            name for name in set(leftovers) | attached
+            if (b := self.bounds_of(name)) is not None and b[1] <= cutoff
+        )
+        done = []
+        for name in expired:
+            if name in attached:
+                with self.engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+            self._archive(name)
+            done.append(name)
+        return done
+
+    def _archive(self, name: str):
+        lo, hi = self.bounds_of(name)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.csv.gz")
+        tmp = path + ".part"
+
+        with self.engine.connect() as conn:
+            cols = ", ".join(_insertable_columns(conn, name))
+        raw = self.engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            with gzip.open(tmp, "wt", encoding="utf-8", newline="") as f:
+                cur.execute(f"COPY (SELECT {cols} FROM {name} ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)",
+                            stream=f)
+                rows = cur.rowcount
+            raw.commit()
+        finally:
+            raw.close()
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        # keys of archived rows no longer block new messages; trimmed in
+        # chunks so the keys table isn't locked for the whole range
+        while True:
+            with self.engine.begin() as conn:
+                n = conn.execute(text("""
+                    DELETE FROM message_keys WHERE id IN (
+                        SELECT id FROM message_keys
+                        WHERE publish_time >= :lo AND publish_time < :hi
+                        LIMIT :n
+                    )
+                """), {"lo": lo, "hi": hi, "n": KEY_TRIM_CHUNK}).rowcount
+            if n < KEY_TRIM_CHUNK:
+                break
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE {name}"))
+
+        size = os.path.getsize(path)
+        self.counters["archived"] += 1
+        self.counters["archived_rows"] += max(rows, 0)
+        self.counters["archive_bytes"] += size
+        self.log(f"[PARTITION] archived {name}: {rows} row(s), {size} bytes -> {path}")
+
+    def maintain(self, now=None) -> dict:
+        """One maintenance pass; skipped if another process holds the lock."""
+        if not self.is_partitioned(refresh=True):
+            return {"partitioned": False}
+        if not self.enabled:
+            # not configured here: keep whatever granularity the table has
+            with self.engine.connect() as conn:
+                names = self.attached(conn)
+            if any((m := _NAME.match(n)) and m.group(3) for n in names):
+                self.interval = "day"
+        with self.engine.connect() as lock_conn:
+            got = lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": ADVISORY_KEY}).scalar()
+            lock_conn.commit()
+            if not got:
+                self.counters["skipped_locked"] += 1
+                return {"partitioned": True, "skipped": True}
+            try:
+                created = self.ensure_partitions(now)
+                archived = self.archive_expired(now)
+            except Exception as e:
+                self.counters["errors"] += 1
+                self.counters["last_error"] = repr(e)
+                raise
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_KEY})
+                lock_conn.commit()
+                self.counters["runs"] += 1
+                self.counters["last_run_at"] = int(time.time())
+        return {"partitioned": True, "created": created, "archived": archived}
+
+    def start(self, every: float = 3600.0):
+        """Run maintain() now and then every `every` seconds on a daemon thread."""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.maintain()
+                except Exception as e:
+                    self.log(f"[PARTITION] maintenance failed: {e!r}")
+                self._stop.wait(every)
+
+        self._thread = threading.Thread(target=loop, name="partition-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- reads ---
+
+    def estimate_rows(self, conn) -> int:
+        """Planner row estimate for the whole table (sum over partitions)."""
+        n = conn.execute(text("""
+            SELECT SUM(c.reltuples)::bigint FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'messages'::regclass AND c.reltuples >= 0
+        """)).scalar()
+        return int(n or 0)
+
+    def stats(self) -> dict:
+        out = {
+            **self.counters,
+            "partitioned": self._partitioned,
+            "interval": self.interval if self._partitioned else None,
+            "premake": self.premake,
+            "retention_days": self.retention_days,
+            "archive_dir": self.archive_dir,
+        }
+        if self._partitioned:
+            try:
+                with self.engine.connect() as conn:
+                    names = self.attached(conn)
+                ranged = [n for n in names if n != DEFAULT_PARTITION]
+                out["partitions"] = len(names)
+                out["oldest"] = ranged[0] if ranged else None
+                out["newest"] = ranged[-1] if ranged else None
+            except Exception as e:
+                out["partitions_error"] = repr(e)
+        return out
+
+
+def _next_month(lo: datetime) -> datetime:
+    return lo.replace(year=lo.year + (lo.month == 12), month=lo.month % 12 + 1)
+
+
+def _insertable_columns(conn, table: str) -> list:
+    return conn.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :t
+          AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """), {"t": table}).scalars().all()
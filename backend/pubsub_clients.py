@@ -0,0 +1,189 @@
+"""
+Process-wide Pub/Sub clients.
+
+Every SubscriberClient/PublisherClient owns a gRPC channel, and a fresh one
+pays a TLS handshake and a token fetch on its first call. PubSubClients
+builds one publisher and one subscriber per process on first use and hands
+the same instances to every caller: publish routes, the pull loops and the
+debug/admin endpoints. Channel options (keepalive, message size limits, any
+extra grpc.* option) are applied to both channels, and close() flushes the
+publisher and closes the channels on worker exit.
+
+    clients = PubSubClients(credentials=load_creds, keepalive_ms=30000)
+    clients.subscriber().get_subscription(request={"subscription": path})
+"""
+import concurrent.futures, os, threading, time
+
+import grpc
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import pubsub_v1
+from google.pubsub_v1.services.publisher.transports.grpc import PublisherGrpcTransport
+from google.pubsub_v1.services.subscriber.transports.grpc import SubscriberGrpcTransport
+
+
+def channel_options(keepalive_ms: int, keepalive_timeout_ms: int,
+                    keepalive_without_calls: bool, extra=None) -> list:
+    # the library's own defaults, then ours on top (later names win)
+    opts = {
+        "grpc.max_send_message_length": -1,
+        "grpc.max_receive_message_length": -1,
+        "grpc.max_metadata_size": 4 * 1024 * 1024,
+        "grpc.keepalive_time_ms": keepalive_ms,
+        "grpc.keepalive_timeout_ms": keepalive_timeout_ms,
+        "grpc.keepalive_permit_without_calls": int(keepalive_without_calls),
+    }
+    opts.update(extra or {})
+    return list(opts.items())
+
+
+class _Publisher(pubsub_v1.PublisherClient):
+    """PublisherClient that remembers its unresolved publish futures."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._unresolved = set()
+        self._unresolved_lock = threading.Lock()
+
+    def publish(self, *args, **kwargs):
+        future = super().publish(*args, **kwargs)
+        with self._unresolved_lock:
+            self._unresolved.add(future)
+        future.add_done_callback(self._resolved)
+        return future
+
+    def _resolved(self, future):
+        with self._unresolved_lock:
+            self._unresolved.discard(future)
+
+    def unresolved(self) -> list:
+        with self._unresolved_lock:
+            return list(self._unresolved)
+
+
+class PubSubClients:
+    def __init__(
+        self,
+        credentials=None,
+        *,
+        batch_settings=None,
+        keepalive_ms: int = 30000,
+        keepalive_timeout_ms: int = 10000,
+        keepalive_without_calls: bool = False,
+        extra_options=None,
+        drain_timeout: float = 5.0,
+        log=print,
+    ):
+        """
+        credentials: zero-arg callable returning google-auth credentials,
+        called when the first channel is built (None = application default).
+        batch_settings: pubsub_v1.types.BatchSettings for the shared publisher.
+        extra_options: {grpc option name: value} merged over the defaults.
+        drain_timeout: how long close() waits for queued publishes to go out.
+        """
+        self._credentials = credentials
+        self.batch_settings = batch_settings
+        self.options = channel_options(keepalive_ms, keepalive_timeout_ms,
+                                       keepalive_without_calls, extra_options)
+        self.drain_timeout = drain_timeout
+        self.log = log
+
+        self._publisher = None
+        self._subscriber = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.counters = {
+            "publisher_builds": 0,
+            "subscriber_builds": 0,
+            "publisher_gets": 0,
+            "subscriber_gets": 0,
+            "build_seconds": 0.0,
+        }
+
+    # --- public ---
+
+    def publisher(self) -> pubsub_v1.PublisherClient:
+        with self._lock:
+            self.counters["publisher_gets"] += 1
+            if self._publisher is None:
+                self._check_open()
+                t0 = time.perf_counter()
+                self._publisher = _Publisher(
+                    batch_settings=self.batch_settings or (),
+                    transport=self._transport(PublisherGrpcTransport),
+                )
+                self._built("publisher", t0)
+            return self._publisher
+
+    def subscriber(self) -> pubsub_v1.SubscriberClient:
+        with self._lock:
+            self.counters["subscriber_gets"] += 1
+            if self._subscriber is None or self._subscriber.closed:
+                self._check_open()
+                t0 = time.perf_counter()
+                self._subscriber = pubsub_v1.SubscriberClient(
+                    transport=self._transport(SubscriberGrpcTransport),
+                )
+                self._built("subscriber", t0)
+            return self._subscriber
+
+    def close(self):
+        """Flush the publisher and close both channels. Idempotent."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            publisher, subscriber = self._publisher, self._subscriber
+        if publisher is not None:
+            try:
+                publisher.stop()
+                # stop() only starts the last commits; wait on their futures
+                _, pending = concurrent.futures.wait(publisher.unresolved(), timeout=self.drain_timeout)
+                if pending:
+                    self.log(f"[PUBSUB] {len(pending)} publishes unresolved at shutdown")
+                publisher.transport.close()
+            except Exception as e:
+                self.log(f"[PUBSUB] publisher shutdown error: {e!r}")
+        if subscriber is not None:
+            try:
+                subscriber.close()
+            except Exception as e:
+                self.log(f"[PUBSUB] subscriber shutdown error: {e!r}")
+        self.log("[PUBSUB] clients closed")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "build_seconds": round(self.counters["build_seconds"], 4),
+                "publisher_open": self._publisher is not None and not self._closed,
+                "subscriber_open": self._subscriber is not None and not self._subscriber.closed,
+                "closed": self._closed,
+                "channel_options": dict(self.options),
+            }
+
+    # --- internals ---
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("Pub/Sub clients are shut down")
+
+    def _built(self, kind: str, t0: float):
+        elapsed = time.perf_counter() - t0
+        self.counters[f"{kind}_builds"] += 1
+        self.counters["build_seconds"] += elapsed
+        self.log(f"[PUBSUB] {kind} client ready in {elapsed * 1000:.0f}ms")
+
+    def _transport(self, cls):
+        emulator = os.environ.get("PUBSUB_EMULATOR_HOST")
+        if emulator:
+            channel = grpc.insecure_channel(emulator, options=self.options)
+            return cls(host=emulator, channel=channel, credentials=AnonymousCredentials())
+
+        options = self.options
+
+        def make_channel(host, **kwargs):
+            kwargs["options"] = list(dict((kwargs.get("options") or []) + options).items())
+            return cls.create_channel(host, **kwargs)
+
+        creds = self._credentials() if self._credentials is not None else None
+        return cls(credentials=creds, channel=make_channel)
@@ -0,0 +1,221 @@
+"""
+Adaptive synchronous Pub/Sub puller.
+
+Several pull streams share one subscription. Each stream grows its
+max_messages while pulls come back full (a backlog) and shrinks it again
+when they don't. Acks from all streams are buffered and sent by a separate
+thread in batches, flushed by size or time. Empty pulls and errors back off
+exponentially with jitter.
+"""
+import collections, queue, random, threading, time
+
+
+class AdaptivePuller:
+    def __init__(
+        self,
+        subscriber,
+        subscription_path: str,
+        on_message,
+        *,
+        streams: int = 2,
+        min_batch: int = 10,
+        max_batch: int = 1000,
+        ack_batch: int = 500,
+        ack_interval: float = 0.1,
+        pull_timeout: float = 10.0,
+        idle_backoff_max: float = 5.0,
+        error_backoff_max: float = 30.0,
+        on_pull=None,
+        on_ack=None,
+        manual_ack: bool = False,
+        log=print,
+        log_prefix: str = "[SYNC]",
+    ):
+        """
+        on_message(message) is called once per received message; if it
+        raises, the message is not acked and Pub/Sub will redeliver it.
+        With manual_ack=True it is called as on_message(message, ack_id)
+        instead and nothing is acked until the caller passes the id to ack().
+        on_pull(n) is called after every pull attempt with the batch size.
+        on_ack(n, seconds) is called after every successful acknowledge call.
+        """
+        self.subscriber = subscriber
+        self.subscription_path = subscription_path
+        self.on_message = on_message
+        self.on_pull = on_pull
+        self.on_ack = on_ack
+        self.manual_ack = manual_ack
+        self.streams = streams
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.ack_batch = ack_batch
+        self.ack_interval = ack_interval
+        self.pull_timeout = pull_timeout
+        self.idle_backoff_max = idle_backoff_max
+        self.error_backoff_max = error_backoff_max
+        self.log = log
+        self.log_prefix = log_prefix
+
+        self._acks = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._rate_samples = collections.deque(maxlen=64)
+        self._batch_sizes = [min_batch] * streams
+        self.counters = {
+            "pulls": 0,
+            "empty_pulls": 0,
+            "received": 0,
+            "handler_errors": 0,
+            "pull_errors": 0,
+            "acked": 0,
+            "ack_batches": 0,
+            "ack_errors": 0,
+        }
+        self.last_pull_at = 0
+        self.last_lag_seconds = None
+
+    # -- lifecycle --
+    def start(self):
+        for i in range(self.streams):
+            t = threading.Thread(target=self._pull_loop, args=(i,), name=f"sync-pull-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._ack_loop, name="sync-ack", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    # -- pulling --
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _backoff(self, attempt: int, cap: float) -> float:
+        # equal jitter: anywhere in [delay/2, delay], so streams spread out yet always wait half
+        delay = min(cap, 0.1 * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _pull_loop(self, idx: int):
+        idle = errors = 0
+        while not self._stop.is_set():
+            batch = self._batch_sizes[idx]
+            try:
+                resp = self.subscriber.pull(
+                    request={"subscription": self.subscription_path, "max_messages": batch},
+                    retry=None,
+                    timeout=self.pull_timeout,
+                )
+            except Exception as e:
+                self._count("pull_errors")
+                self.log(f"{self.log_prefix} pull error: {e!r}")
+                errors += 1
+                self._stop.wait(self._backoff(errors, self.error_backoff_max))
+                continue
+            errors = 0
+            self.last_pull_at = int(time.time())
+
+            received = resp.received_messages
+            n = len(received)
+            self._count("pulls")
+            if self.on_pull is not None:
+                self.on_pull(n)
+
+            if not n:
+                self._count("empty_pulls")
+                self._batch_sizes[idx] = self.min_batch
+                idle += 1
+                self._stop.wait(self._backoff(idle, self.idle_backoff_max))
+                continue
+            idle = 0
+
+            for rm in received:
+                try:
+                    if self.manual_ack:
+                        self.on_message(rm.message, rm.ack_id)
+                        continue
+                    self.on_message(rm.message)
+                except Exception as e:
+                    self._count("handler_errors")
+                    self.log(f"{self.log_prefix} handler error: {e!r}")
+                    continue
+                self._acks.put(rm.ack_id)
+
+            self._count("received", n)
+            with self._lock:
+                self._rate_samples.append((time.monotonic(), self.counters["received"]))
+            publish_time = received[-1].message.publish_time
+            if publish_time is not None and hasattr(publish_time, "timestamp"):
+                self.last_lag_seconds = max(0.0, time.time() - publish_time.timestamp())
+
+            # full batch means there is more waiting: ask for more next time
+            if n >= batch:
+                self._batch_sizes[idx] = min(self.max_batch, batch * 2)
+            elif n < batch // 2:
+                self._batch_sizes[idx] = max(self.min_batch, batch // 2)
+
+    # -- acking --
+    def ack(self, ack_ids):
+        """Queue ack ids for the batched acker (manual_ack mode)."""
+        for ack_id in ack_ids:
+            self._acks.put(ack_id)
+
+    def _ack_loop(self):
+        pending = []
+        deadline = time.monotonic() + self.ack_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                pending.append(self._acks.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if len(pending) >= self.ack_batch or (pending and now >= deadline):
+                self._flush(pending)
+                pending = []
+            if now >= deadline:
+                deadline = now + self.ack_interval
+            if self._stop.is_set() and self._acks.empty():
+                if pending:
+                    self._flush(pending)
+                return
+
+    def _flush(self, ack_ids):
+        t0 = time.perf_counter()
+        try:
+            self.subscriber.acknowledge(
+                request={"subscription": self.subscription_path, "ack_ids": ack_ids}
+            )
+        except Exception as e:
+            # unacked messages come back after the ack deadline
+            self._count("ack_errors")
+            self.log(f"{self.log_prefix} ack error ({len(ack_ids)} ids): {e!r}")
+            return
+        self._count("acked", len(ack_ids))
+        self._count("ack_batches")
+        if self.on_ack is not None:
+            self.on_ack(len(ack_ids), time.perf_counter() - t0)
+
+    # -- reporting --
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            samples = list(self._rate_samples)
+        now = time.monotonic()
+        recent = [s for s in samples if now - s[0] <= 10.0]
+        rate = 0.0
+        if len(recent) >= 2 and recent[-1][0] > recent[0][0]:
+            rate = (recent[-1][1] - recent[0][1]) / (recent[-1][0] - recent[0][0])
+        return {
+            **counters,
+            "streams": self.streams,
+            "batch_sizes": list(self._batch_sizes),
+            "pending_acks": self._acks.qsize(),
+            "received_per_sec": round(rate, 1),
+            "last_lag_seconds": None if self.last_lag_seconds is None else round(self.last_lag_seconds, 3),
+            "last_pull_at": self.last_pull_at,
+        }
@@ -0,0 +1,355 @@
+"""
+Per-source message counts by minute and hour, kept current as messages are
+stored so dashboards never aggregate `messages`.
+
+    ROLLUPS = MessageRollups(engine, flush_interval=5.0, minute_retention_days=14)
+    ROLLUPS.create_tables(conn)     # from migrate_schema()
+    ROLLUPS.start()
+    ROLLUPS.record("web", duplicate=False, flagged=True)    # per stored publish
+    ROLLUPS.record_rows(rows)                               # per ingest batch
+    buckets = ROLLUPS.query(conn, "minute", since, until, source="web")
+
+    message_rollups_minute  (bucket, source) -> messages, duplicates, flagged
+    message_rollups_hour    same, per UTC hour
+
+record() only adds to an in-memory delta per (minute, source). A flusher
+thread folds the deltas into both tables every flush_interval seconds, one
+additive upsert per table, so a publish never waits on (or contends for) a
+hot rollup row and every worker process flushes its own share. Deltas from
+a failed flush are merged back and retried; a crash loses at most one
+interval. Minute rows older than minute_retention_days are pruned; hour
+rows are kept, so stats outlive archived partitions.
+
+The counts are what the service stored: every publish answered as stored
+(replays included, as duplicates) and every row the ingest sink inserted.
+flagged is only known on the publish path, where moderation runs.
+backfill() fills history from before recording started with messages and
+duplicates counted from `messages` itself.
+"""
+import threading, time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+
+GRANULARITIES = {"minute": 60, "hour": 3600}
+TABLES = {g: f"message_rollups_{g}" for g in GRANULARITIES}
+
+# a NULL source is stored as '' so it can be part of the primary key
+_NO_SOURCE = ""
+
+_UPSERT = """
+    INSERT INTO {table} AS r (bucket, source, messages, duplicates, flagged)
+    SELECT * FROM unnest(
+        CAST(:buckets AS timestamptz[]), CAST(:sources AS text[]),
+        CAST(:messages AS bigint[]), CAST(:duplicates AS bigint[]), CAST(:flagged AS bigint[])
+    ) AS d (bucket, source, messages, duplicates, flagged)
+    ORDER BY bucket, source
+    ON CONFLICT (bucket, source) DO UPDATE SET
+        messages = r.messages + EXCLUDED.messages,
+        duplicates = r.duplicates + EXCLUDED.duplicates,
+        flagged = r.flagged + EXCLUDED.flagged
+"""
+
+# one chunk of history: minute and hour rows from the same aggregate. These
+# replace messages/duplicates (so a re-run is safe) and keep flagged.
+_BACKFILL = """
+    WITH m AS (
+        SELECT date_trunc('minute', publish_time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+               COALESCE(source, '') AS source,
+               COUNT(*) AS messages,
+               COUNT(*) FILTER (WHERE is_duplicate) AS duplicates
+        FROM messages
+        WHERE publish_time >= :lo AND publish_time < :hi
+        GROUP BY 1, 2
+    ), minutes AS (
+        INSERT INTO message_rollups_minute AS r (bucket, source, messages, duplicates)
+        SELECT bucket, source, messages, duplicates FROM m
+        WHERE bucket >= :minute_floor
+        ON CONFLICT (bucket, source) DO UPDATE SET
+            messages = EXCLUDED.messages, duplicates = EXCLUDED.duplicates
+        RETURNING 1
+    ), hours AS (
+        INSERT INTO message_rollups_hour AS r (bucket, source, messages, duplicates)
+        SELECT date_trunc('hour', bucket AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', source,
+               SUM(messages), SUM(duplicates)
+        FROM m
+        GROUP BY 1, 2
+        ON CONFLICT (bucket, source) DO UPDATE SET
+            messages = EXCLUDED.messages, duplicates = EXCLUDED.duplicates
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM minutes), (SELECT COUNT(*) FROM hours)
+"""
+
+
+def floor_to(dt: datetime, granularity: str) -> datetime:
+    """Start of the UTC minute/hour holding dt (naive values are UTC)."""
+    step = GRANULARITIES[granularity]
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(int(dt.timestamp()) // step * step, tz=timezone.utc)
+
+
+def _epoch_minute(at) -> int:
+    if at is None:
+        ts = time.time()
+    elif isinstance(at, datetime):
+        ts = (at if at.tzinfo is not None else at.replace(tzinfo=timezone.utc)).timestamp()
+    else:
+        ts = float(at)
+    return int(ts) // 60 * 60
+
+
+class MessageRollups:
+    def __init__(
+        self,
+        engine,
+        *,
+        flush_interval: float = 5.0,
+        minute_retention_days: int = 14,
+        prune_interval: float = 3600.0,
+        log=print,
+    ):
+        """
+        minute_retention_days: minute rows older than this are deleted (0
+        keeps them); hour rows are never pruned.
+        """
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.minute_retention_days = minute_retention_days
+        self.prune_interval = prune_interval
+        self.log = log
+
+        self._lock = threading.Lock()
+        self._pending = {}  # (epoch minute, source) -> [messages, duplicates, flagged]
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+        self._failing_since = None
+        self.counters = {
+            "recorded": 0,
+            "flushes": 0,
+            "rows_upserted": 0,
+            "failed_flushes": 0,
+            "pruned_rows": 0,
+            "last_flush_ms": None,
+            "last_error": None,
+        }
+
+    # --- schema ---
+
+    def create_tables(self, conn):
+        for table in TABLES.values():
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TIMESTAMPTZ NOT NULL,
+                    source TEXT NOT NULL,
+                    messages BIGINT NOT NULL DEFAULT 0,
+                    duplicates BIGINT NOT NULL DEFAULT 0,
+                    flagged BIGINT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (bucket, source)
+                )
+            """))
+
+    # --- recording ---
+
+    def record(self, source, at=None, *, duplicate: bool = False, flagged: bool = False, n: int = 1):
+        """Count n stored messages from source at `at` (datetime or epoch; default now)."""
+        key = (_epoch_minute(at), source or _NO_SOURCE)
+        with self._lock:
+            delta = self._pending.get(key)
+            if delta is None:
+                delta = self._pending[key] = [0, 0, 0]
+            delta[0] += n
+            if duplicate:
+                delta[1] += n
+            if flagged:
+                delta[2] += n
+            self.counters["recorded"] += n
+
+    def record_rows(self, rows):
+        """Count stored rows with .source, .publish_time and .is_duplicate."""
+        with self._lock:
+            for r in rows:
+                key = (_epoch_minute(r.publish_time), r.source or _NO_SOURCE)
+                delta = self._pending.get(key)
+                if delta is None:
+                    delta = self._pending[key] = [0, 0, 0]
+                delta[0] += 1
+                if r.is_duplicate:
+                    delta[1] += 1
+                self.counters["recorded"] += 1
+
+    # --- flushing ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="rollup-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flusher and write whatever is still pending."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            if self.minute_retention_days and time.monotonic() - self._last_prune >= self.prune_interval:
+                self._last_prune = time.monotonic()
+                try:
+                    self.prune()
+                except Exception as e:
+                    self.log(f"[ROLLUP] prune failed: {e!r}")
+
+    def flush(self) -> int:
+        """Upsert pending deltas into both tables. Returns rows upserted."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        hours = {}
+        for (minute, source), (m, d, f) in pending.items():
+            h = hours.setdefault((minute // 3600 * 3600, source), [0, 0, 0])
+            h[0] += m
+            h[1] += d
+            h[2] += f
+        t0 = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                for granularity, deltas in (("minute", pending), ("hour", hours)):
+                    conn.execute(text(_UPSERT.format(table=TABLES[granularity])), _columns(deltas))
+        except Exception as e:
+            self._merge_back(pending)
+            self.counters["failed_flushes"] += 1
+            self.counters["last_error"] = repr(e)
+            # a missing table (not migrated yet) would otherwise log every interval
+            now = time.monotonic()
+            if self._failing_since is None or now - self._failing_since >= 60:
+                self._failing_since = now
+                self.log(f"[ROLLUP] flush of {len(pending)} bucket(s) failed, will retry: {e!r}")
+            return 0
+        self._failing_since = None
+        written = len(pending) + len(hours)
+        self.counters["flushes"] += 1
+        self.counters["rows_upserted"] += written
+        self.counters["last_flush_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        return written
+
+    def _merge_back(self, pending):
+        with self._lock:
+            for key, (m, d, f) in pending.items():
+                delta = self._pending.get(key)
+                if delta is None:
+                    self._pending[key] = [m, d, f]
+                else:
+                    delta[0] += m
+                    delta[1] += d
+                    delta[2] += f
+
+    def prune(self, now=None) -> int:
+        """Delete minute rows past minute_retention_days."""
+        now = now or datetime.now(timezone.utc)
+        cutoff = floor_to(now - timedelta(days=self.minute_retention_days), "hour")
+        with self.engine.begin() as conn:
+            n = conn.execute(
+                text(f"DELETE FROM {TABLES['minute']} WHERE bucket < :cutoff"), {"cutoff": cutoff}
+            ).rowcount
+        self.counters["pruned_rows"] += n
+        if n:
+            self.log(f"[ROLLUP] pruned {n} minute row(s) before {cutoff.isoformat()}")
+        return n
+
+    # --- backfill ---
+
+    def backfill(self, since=None, until=None, *, chunk: timedelta = timedelta(days=1)) -> dict:
+        """
+        Rebuild messages/duplicates for [since, until) from `messages`.
+
+        until defaults to the start of the hour live recording began in (the
+        oldest minute row), so backfilled and recorded counts never share a
+        bucket; since defaults to the oldest message. Each chunk is its own
+        transaction; flagged counts are left as they are.
+        """
+        with self.engine.connect() as conn:
+            if until is None:
+                first = conn.execute(text(f"SELECT MIN(bucket) FROM {TABLES['minute']}")).scalar()
+                until = floor_to(first, "hour") if first is not None else datetime.now(timezone.utc)
+            if since is None:
+                since = conn.execute(text("SELECT MIN(publish_time) FROM messages")).scalar()
+        out = {"since": None, "until": until.isoformat(), "minute_rows": 0, "hour_rows": 0}
+        if since is None or since >= until:
+            return out
+        since = floor_to(since, "hour")
+        out["since"] = since.isoformat()
+        minute_floor = (floor_to(datetime.now(timezone.utc) - timedelta(days=self.minute_retention_days), "hour")
+                        if self.minute_retention_days else since)
+        lo = since
+        while lo < until:
+            hi = min(lo + chunk, until)
+            with self.engine.begin() as conn:
+                minutes, hours = conn.execute(text(_BACKFILL), {
+                    "lo": lo, "hi": hi, "minute_floor": minute_floor,
+                }).one()
+            out["minute_rows"] += minutes
+            out["hour_rows"] += hours
+            lo = hi
+        # plan the range reads from the new rows rather than an empty table
+        with self.engine.begin() as conn:
+            for table in TABLES.values():
+                conn.execute(text(f"ANALYZE {table}"))
+        self.log(f"[ROLLUP] backfilled {out['since']} .. {out['until']}: "
+                 f"{out['minute_rows']} minute / {out['hour_rows']} hour row(s)")
+        return out
+
+    # --- reads ---
+
+    @staticmethod
+    def query(conn, granularity: str, since: datetime, until: datetime, source=None) -> list:
+        """Rollup rows for buckets in [floor(since), until), oldest first."""
+        where = "bucket >= :since AND bucket < :until"
+        params = {"since": floor_to(since, granularity), "until": until}
+        if source is not None:
+            where += " AND source = :source"
+            params["source"] = source or _NO_SOURCE
+        # epoch seconds: pg8000's timestamptz parsing is most of the cost per row
+        rows = conn.execute(text(f"""
+            SELECT CAST(extract(epoch FROM bucket) AS bigint) AS epoch, source,
+                   messages, duplicates, flagged
+            FROM {TABLES[granularity]}
+            WHERE {where}
+            ORDER BY bucket, source
+        """), params).fetchall()
+        return [
+            {
+                "bucket": datetime.fromtimestamp(r.epoch, tz=timezone.utc),
+                "source": r.source or None,
+                "messages": r.messages,
+                "duplicates": r.duplicates,
+                "flagged": r.flagged,
+            }
+            for r in rows
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            **self.counters,
+            "pending_buckets": pending,
+            "flush_interval": self.flush_interval,
+            "minute_retention_days": self.minute_retention_days,
+        }
+
+
+def _columns(deltas: dict) -> dict:
+    keys = sorted(deltas)
+    return {
+        "buckets": [datetime.fromtimestamp(k[0], tz=timezone.utc) for k in keys],
+        "sources": [k[1] for k in keys],
+        "messages": [deltas[k][0] for k in keys],
+        "duplicates": [deltas[k][1] for k in keys],
+        "flagged": [deltas[k][2] for k in keys],
+    }
@@ -0,0 +1,138 @@
+"""
+Fixed-size ring of JSON records in a shared mmap file.
+
+Lets every gunicorn worker see the same "recent messages" buffer. Exactly
+one process (the puller leader) appends; any number of processes read
+without locks. Each slot carries the sequence number it was written for,
+and readers re-check it after copying the payload, so a slot overwritten
+mid-read is skipped instead of returned torn. A record too big for its
+slot is stored as its messageId and publishTime plus as much of its data
+as fits, marked "truncated".
+
+The header also holds a change counter that any process may bump (under an
+flock), for per-worker caches that must notice each other's writes.
+
+    header: magic(8) slots(u32) slot_size(u32) seq(u64) version(u64)   padded to 64 bytes
+    slot:   seq(u64) length(u32) payload(slot_size - 12)
+"""
+import fcntl, json, mmap, os, struct, threading
+
+MAGIC = b"PSRING01"
+_HEADER = struct.Struct("<8sIIQ")
+_HEADER_SIZE = 64
+_SEQ_OFFSET = 16
+_VERSION_OFFSET = 24
+_SLOT = struct.Struct("<QI")
+# what an oversized record is cut down to, besides a prefix of its data
+_SUMMARY_KEYS = ("messageId", "publishTime")
+
+
+class SharedRing:
+    def __init__(self, path: str, slots: int = 2000, slot_size: int = 4096):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # first process in sizes and stamps the file; the rest attach
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            size = _HEADER_SIZE + slots * slot_size
+            head = os.pread(fd, _HEADER.size, 0)
+            if len(head) == _HEADER.size and head[:8] == MAGIC:
+                _, slots, slot_size, _ = _HEADER.unpack(head)
+                size = _HEADER_SIZE + slots * slot_size
+            else:
+                os.ftruncate(fd, size)
+                os.pwrite(fd, _HEADER.pack(MAGIC, slots, slot_size, 0), 0)
+            self._mm = mmap.mmap(fd, size)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        except BaseException:
+            os.close(fd)  # drops the lock too
+            raise
+        # kept open for bump_version()
+        self._fd = fd
+        self._version_lock = threading.Lock()
+        self.slots = slots
+        self.slot_size = slot_size
+        self.maxlen = slots
+
+    # -- writer (leader only) --
+    @property
+    def seq(self) -> int:
+        return struct.unpack_from("<Q", self._mm, _SEQ_OFFSET)[0]
+
+    def append(self, item: dict):
+        payload = self._encode(item)
+        seq = self.seq + 1
+        off = _HEADER_SIZE + ((seq - 1) % self.slots) * self.slot_size
+        _SLOT.pack_into(self._mm, off, 0, 0)  # mark in-progress
+        self._mm[off + _SLOT.size: off + _SLOT.size + len(payload)] = payload
+        _SLOT.pack_into(self._mm, off, seq, len(payload))
+        struct.pack_into("<Q", self._mm, _SEQ_OFFSET, seq)
+
+    def _encode(self, item: dict) -> bytes:
+        room = self.slot_size - _SLOT.size
+        payload = json.dumps(item).encode("utf-8")
+        if len(payload) <= room:
+            return payload
+        # too big for a slot: keep the ids and the longest prefix of the body
+        # that still encodes within it, so every slot holds a whole document
+        summary = {k: item[k] for k in _SUMMARY_KEYS if k in item}
+        data = str(item.get("data", ""))
+        best, lo, hi = None, 0, len(data)
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            payload = json.dumps(dict(summary, data=data[:mid], truncated=True)).encode("utf-8")
+            if len(payload) <= room:
+                best, lo = payload, mid + 1
+            else:
+                hi = mid - 1
+        if best is None:
+            raise ValueError(f"record does not fit a {self.slot_size}-byte slot even without its data")
+        return best
+
+    # -- change counter (any process) --
+    @property
+    def version(self) -> int:
+        return struct.unpack_from("<Q", self._mm, _VERSION_OFFSET)[0]
+
+    def bump_version(self) -> int:
+        """Increment the shared counter and return the new value."""
+        # flock excludes other processes; threads here share the fd's lock
+        with self._version_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                version = self.version + 1
+                struct.pack_into("<Q", self._mm, _VERSION_OFFSET, version)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return version
+
+    # -- readers (any process) --
+    def _read(self, seq: int):
+        off = _HEADER_SIZE + ((seq - 1) % self.slots) * self.slot_size
+        got, length = _SLOT.unpack_from(self._mm, off)
+        if got != seq:
+            return None
+        payload = self._mm[off + _SLOT.size: off + _SLOT.size + length]
+        if _SLOT.unpack_from(self._mm, off)[0] != seq:
+            return None
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def since(self, last_seq: int):
+        """Return [(seq, item)] written after last_seq (at most one ring's worth)."""
+        head = self.seq
+        first = max(last_seq + 1, head - self.slots + 1, 1)
+        out = []
+        for s in range(first, head + 1):
+            item = self._read(s)
+            if item is not None:
+                out.append((s, item))
+        return out
+
+    def __iter__(self):
+        return iter([item for _, item in self.since(0)])
+
+    def __len__(self):
+        return min(self.seq, self.slots)
@@ -0,0 +1,36 @@
+import collections, threading
+
+from google.api_core.exceptions import NotFound
+
+
+def test_warm_up_retries_migrate_once(core, monkeypatch):
+    calls = collections.Counter()
+    release = threading.Event()
+    monkeypatch.setattr(core, "SCHEMA_MIGRATED", threading.Event())
+    monkeypatch.setattr(core, "DATA_HASH_MIGRATED", threading.Event())
+    monkeypatch.setattr(core, "_data_hash_thread", None)
+    monkeypatch.setattr(core, "migrate_schema", lambda: calls.update(["schema"]))
+    monkeypatch.setattr(core, "migrate_data_hash", lambda: (calls.update(["data_hash"]), release.wait(5)))
+
+    core._migrate_schema_once()
+    core._migrate_schema_once()
+    # a second start while the backfill runs is a no-op
+    core._start_data_hash_migration()
+    core._start_data_hash_migration()
+    release.set()
+    core._data_hash_thread.join(5)
+    # and so is one after it finished
+    core._start_data_hash_migration()
+    assert calls == {"schema": 1, "data_hash": 1}
+
+
+class _MissingTopic:
+    def get_topic(self, request):
+        raise NotFound("topic")
+
+
+def test_missing_topic_degrades_readiness_instead_of_failing(core, monkeypatch):
+    monkeypatch.setattr(core, "publisher", _MissingTopic())
+    monkeypatch.setattr(core, "BOOT_STATE", {**core.BOOT_STATE, "degraded": {}})
+    core._verify_topic()
+    assert "topic" in core.BOOT_STATE["degraded"]
@@ -0,0 +1,84 @@
+import pytest
+
+from backend import db
+
+SQL = "SELECT CAST(:n AS INTEGER) + 1 AS m"
+
+
+def _run(engine, times=3):
+    with engine.connect() as conn:
+        return [conn.execute(db.hot(SQL), {"n": i}).scalar() for i in range(times)]
+
+
+@pytest.fixture
+def make(database_url):
+    engines = []
+
+    def _make(**kw):
+        kw.setdefault("prepare", True)
+        engine = db.make_engine(database_url, role="write", ping="off", **kw)
+        engines.append(engine)
+        return engine
+
+    yield _make
+    for engine in engines:
+        engine.dispose()
+
+
+def test_installed_pg8000_has_the_internals_prepare_uses():
+    # prepare=True quietly falls back when these move; this makes the move loud
+    import pg8000.dbapi
+
+    assert pg8000.__version__.startswith(db.PREPARE_PG8000_SERIES), pg8000.__version__
+    assert db.prepare_internals_missing(pg8000.dbapi) == []
+
+
+def test_prepare_is_off_by_default(database_url):
+    engine = db.make_engine(database_url, role="write", ping="off")
+    try:
+        assert _run(engine) == [1, 2, 3]
+        stats = db.stats(engine)
+        assert (stats["prepare"], stats["prepared_executions"]) == (False, 0)
+    finally:
+        engine.dispose()
+
+
+def test_hot_statements_are_prepared_once_per_connection(make):
+    engine = make(pool_size=1, max_overflow=0)
+    assert _run(engine) == [1, 2, 3]
+    stats = db.stats(engine)
+    assert stats["prepare"] is True
+    assert (stats["prepared"], stats["prepared_executions"]) == (1, 3)
+
+
+def test_unsupported_pg8000_runs_statements_unprepared(make, monkeypatch):
+    monkeypatch.setattr(db, "PREPARE_PG8000_SERIES", "0.0.")
+    engine = make()
+    assert _run(engine) == [1, 2, 3]
+    stats = db.stats(engine)
+    assert stats["prepare"] is False
+    assert stats["prepare_disabled"].endswith("is not 0.0.x")
+    assert stats["prepared_executions"] == 0
+
+
+def test_internals_failing_before_send_fall_back(make, monkeypatch):
+    import pg8000.dbapi
+
+    def broken(*args):
+        raise TypeError("changed signature")
+
+    monkeypatch.setattr(pg8000.dbapi, "convert_paramstyle", broken)
+    engine = make()
+    assert _run(engine) == [1, 2, 3]
+    stats = db.stats(engine)
+    assert stats["prepare"] is False
+    assert "changed signature" in stats["prepare_disabled"]
+
+
+def test_missing_internal_disables_prepare(make, monkeypatch):
+    monkeypatch.setitem(db.PREPARE_INTERNALS, "Cursor", ("_context", "_renamed_in_a_later_release"))
+    engine = make()
+    assert _run(engine) == [1, 2, 3]
+    stats = db.stats(engine)
+    assert stats["prepare"] is False
+    assert stats["prepare_disabled"].endswith("has no Cursor._renamed_in_a_later_release")
@@ -0,0 +1,79 @@
+"""
+The /api/messages list and search queries must stay index scans. Plans come
+from EXPLAIN on the SQL _plan_messages_query builds, over a seeded table.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+
+ROWS = 50_000
+NOW = datetime.now(timezone.utc)
+
+
+@pytest.fixture
+def seeded(core):
+    with core.engine.begin() as conn:
+        # ~1 in 1000 bodies holds the search word; rows go back 60 days
+        conn.execute(text("""
+            INSERT INTO messages (client_message_id, pubsub_message_id, data, data_hash, source, publish_time)
+            SELECT g::text, 'p' || g,
+                   CASE WHEN mod(g, 1000) = 0 THEN 'a needle in message ' || g ELSE 'message ' || g END,
+                   md5('message ' || g), 'web',
+                   CAST(:now AS TIMESTAMPTZ) - make_interval(secs => g * 100.0)
+            FROM generate_series(1, :n) g
+        """), {"n": ROWS, "now": NOW})
+    with core.engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE messages"))
+    return core
+
+
+def _indexes_used(core, args):
+    plan, err = core._plan_messages_query(args)
+    assert err is None
+    with core.engine.connect() as conn:
+        out = conn.execute(text("EXPLAIN (FORMAT JSON) " + plan["query_items"]), plan["params"]).scalar()
+        nodes = list(_walk((json.loads(out) if isinstance(out, str) else out)[0]["Plan"]))
+        # empty premade partitions are fine to scan; anything holding rows is not
+        scanned = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+        assert not [r for r in scanned if conn.execute(
+            text("SELECT relpages FROM pg_class WHERE oid = CAST(:r AS regclass)"), {"r": r}).scalar()]
+        # partitions have their own copies of each index; name the parent
+        return {
+            conn.execute(text("SELECT COALESCE(pg_partition_root(CAST(:i AS regclass)), CAST(:i AS regclass))::text"),
+                         {"i": n["Index Name"]}).scalar()
+            for n in nodes if "Index Name" in n
+        }
+
+
+def _walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def test_first_page_walks_the_publish_time_index(seeded):
+    assert _indexes_used(seeded, {}) == {"idx_messages_publish_time_id"}
+
+
+def test_date_range_uses_a_publish_time_index(seeded):
+    day = (NOW - timedelta(days=30)).date().isoformat()
+    used = _indexes_used(seeded, {"start": day, "end": day, "tz": "UTC"})
+    assert used and used <= {"idx_messages_publish_time", "idx_messages_publish_time_id"}
+
+
+def test_keyset_page_uses_the_publish_time_index(seeded):
+    cursor = seeded._encode_cursor(NOW - timedelta(days=10), 8640, "next")
+    assert _indexes_used(seeded, {"cursor": cursor}) <= {"idx_messages_publish_time_id"}
+
+
+def test_fulltext_search_uses_the_tsvector_index(seeded):
+    assert "idx_messages_data_fts" in _indexes_used(seeded, {"text": "needle", "search": "fulltext"})
+
+
+def test_substring_search_uses_the_trigram_index(seeded):
+    with seeded.engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass('idx_messages_data_trgm')")).scalar() is None:
+            pytest.skip("pg_trgm is not available on this server")
+    assert "idx_messages_data_trgm" in _indexes_used(seeded, {"text": "needle"})
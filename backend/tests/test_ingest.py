@@ -0,0 +1,128 @@
+import collections, threading, time
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+from backend.ingest import IngestSink, row_from_message
+from backend.partitions import MessagePartitions
+
+Msg = collections.namedtuple("Msg", "data attributes message_id publish_time")
+T0 = datetime(2026, 1, 5, 10, 30, tzinfo=timezone.utc)
+
+
+def _create_messages(engine, partitioned):
+    with engine.begin() as conn:
+        if partitioned:
+            MessagePartitions(engine, interval="month", log=lambda line: None).create_table(conn)
+            conn.execute(text("ALTER TABLE messages ADD COLUMN data_hash TEXT"))
+            conn.execute(text("CREATE INDEX idx_messages_client_message_id ON messages(client_message_id)"))
+            return
+        conn.execute(text("""
+            CREATE TABLE messages (
+                id BIGSERIAL PRIMARY KEY,
+                client_message_id TEXT,
+                pubsub_message_id TEXT,
+                data TEXT NOT NULL,
+                data_hash TEXT,
+                source TEXT,
+                attributes JSONB,
+                publish_time TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                is_duplicate BOOLEAN NOT NULL DEFAULT FALSE,
+                original_hash TEXT
+            )
+        """))
+        conn.execute(text("CREATE UNIQUE INDEX uq_messages_client_message_id ON messages(client_message_id)"))
+        conn.execute(text("CREATE UNIQUE INDEX uq_messages_original_hash ON messages(original_hash)"))
+        conn.execute(text("CREATE UNIQUE INDEX uq_messages_pubsub_message_id ON messages(pubsub_message_id)"))
+
+
+@pytest.mark.parametrize("partitioned", [False, True], ids=["plain", "partitioned"])
+@pytest.mark.parametrize("method", ["insert", "copy"])
+def test_messages_without_client_id_are_all_stored(pg_engine, method, partitioned):
+    _create_messages(pg_engine, partitioned)
+    sink = IngestSink(pg_engine, lambda tokens: None, method=method,
+                      partitioned=lambda: partitioned, log=lambda line: None)
+    rows = [
+        row_from_message(Msg(b"first", {"source": "ext"}, "ps-1", T0)),
+        row_from_message(Msg(b"second", {}, "ps-2", T0)),
+        row_from_message(Msg(b'quoted "text", with commas\nand a newline', {"messageId": "7"}, "ps-3", T0)),
+    ]
+
+    assert len(sink.write(rows)) == 3
+    with pg_engine.connect() as conn:
+        stored = conn.execute(text("""
+            SELECT pubsub_message_id, client_message_id, source, data
+            FROM messages ORDER BY pubsub_message_id
+        """)).fetchall()
+    assert [tuple(r) for r in stored] == [
+        ("ps-1", None, "ext", "first"),
+        ("ps-2", None, None, "second"),
+        ("ps-3", "7", None, 'quoted "text", with commas\nand a newline'),
+    ]
+
+    # a redelivery is skipped, not stored twice
+    assert sink.write(rows[:1]) == []
+
+
+def _original(conn, partitioned, text_, client_id, pubsub_id):
+    # what a concurrent /publish writes for a new text
+    params = {"cid": client_id, "pid": pubsub_id, "data": text_,
+              "h": row_from_message(Msg(text_.encode(), {}, pubsub_id, T0))["data_hash"], "pt": T0}
+    if partitioned:
+        conn.execute(text("""
+            INSERT INTO message_keys (id, client_message_id, pubsub_message_id, original_hash, publish_time)
+            VALUES (nextval('messages_id_seq'), :cid, :pid, :h, :pt)
+        """), params)
+        conn.execute(text("""
+            INSERT INTO messages (id, client_message_id, pubsub_message_id, data, data_hash, publish_time)
+            VALUES (currval('messages_id_seq'), :cid, :pid, :data, :h, :pt)
+        """), params)
+        return
+    conn.execute(text("""
+        INSERT INTO messages (client_message_id, pubsub_message_id, data, data_hash, publish_time, original_hash)
+        VALUES (:cid, :pid, :data, :h, :pt, :h)
+    """), params)
+
+
+@pytest.mark.parametrize("partitioned", [False, True], ids=["plain", "partitioned"])
+@pytest.mark.parametrize("method", ["insert", "copy"])
+def test_losing_a_race_with_publish_stores_a_duplicate(pg_engine, method, partitioned):
+    _create_messages(pg_engine, partitioned)
+    sink = IngestSink(pg_engine, lambda tokens: None, method=method,
+                      partitioned=lambda: partitioned, log=lambda line: None)
+    rows = [row_from_message(Msg(b"raced", {}, "ps-2", T0))]
+
+    # /publish's original is uncommitted when the sink writes the same text
+    with pg_engine.connect() as conn:
+        tx = conn.begin()
+        _original(conn, partitioned, "raced", "1", "ps-1")
+        result = []
+        writer = threading.Thread(target=lambda: result.append(sink.write(rows)))
+        writer.start()
+        time.sleep(0.5)
+        tx.commit()
+    writer.join(10)
+
+    assert [r[2] for r in result[0]] == [True]
+    with pg_engine.connect() as conn:
+        stored = conn.execute(text("SELECT pubsub_message_id, is_duplicate FROM messages ORDER BY id")).fetchall()
+    assert [tuple(r) for r in stored] == [("ps-1", False), ("ps-2", True)]
+
+
+@pytest.mark.parametrize("partitioned", [False, True], ids=["plain", "partitioned"])
+@pytest.mark.parametrize("method", ["insert", "copy"])
+def test_replayed_client_ids_are_skipped(pg_engine, method, partitioned):
+    _create_messages(pg_engine, partitioned)
+    sink = IngestSink(pg_engine, lambda tokens: None, method=method,
+                      partitioned=lambda: partitioned, log=lambda line: None)
+    assert len(sink.write([row_from_message(Msg(b"one", {"messageId": "1"}, "ps-1", T0))])) == 1
+    # a replay of "1" under a new Pub/Sub ID, and "2" twice in one batch
+    stored = sink.write([
+        row_from_message(Msg(b"one", {"messageId": "1"}, "ps-1b", T0)),
+        row_from_message(Msg(b"two", {"messageId": "2"}, "ps-2", T0)),
+        row_from_message(Msg(b"two", {"messageId": "2"}, "ps-2b", T0)),
+    ])
+    assert len(stored) == 1
+    with pg_engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM messages")).scalar() == 2
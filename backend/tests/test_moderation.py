@@ -0,0 +1,119 @@
+"""
+Parity: backend/moderation.py against the _norm + better_profanity path it
+replaced. Both must give the same (flagged, text to publish) for list words
+in plain, upper-case, look-alike and leet spellings, stretched letters,
+doubled words, multi-word entries with other separators, full-width and
+accented text, plus clean sentences and random junk.
+
+The old path is slow (a few ms per message), so the corpus is a seeded
+sample: the fixed spellings of a few hundred list words, every multi-word
+entry, then random cases.
+"""
+import random
+import unicodedata as ud
+
+import regex
+from better_profanity import Profanity
+
+from backend.moderation import CHARS_MAPPING, ModerationEngine, load_wordlist
+
+EXTRA = ["frack", "smeg", "gosh darn"]
+SEED = 4880
+
+
+# --- the implementation being replaced, verbatim from app.py ---
+
+def _legacy_norm(t: str) -> str:
+    t = ud.normalize("NFKC", t)
+    t = regex.sub(r"[@4]", "a", t, flags=regex.I)
+    t = regex.sub(r"[!1|]", "i", t, flags=regex.I)
+    t = regex.sub(r"[$5]", "s", t, flags=regex.I)
+    t = regex.sub(r"[0]", "o", t, flags=regex.I)
+    t = regex.sub(r"[3]", "e", t, flags=regex.I)
+    t = regex.sub(r"(.)\1{2,}", r"\1\1", t)
+    t = regex.sub(r"\b([a-z]{3,})[\W_]*\1\b", r"\1 \1", t, flags=regex.I)
+    return t
+
+
+def make_legacy(extra=()):
+    p = Profanity()
+    if extra:
+        p.add_censor_words(list(extra))
+
+    def moderate(raw):
+        flagged = p.contains_profanity(_legacy_norm(raw))
+        return flagged, (p.censor(_legacy_norm(raw), censor_char="*") if flagged else raw)
+    return moderate
+
+
+# --- corpus ---
+
+CLEAN = [
+    "hello world", "Is the build green yet?", "shipping v2.3.1 today!!!",
+    "meet @ 4pm in room 305", "classic assassin's creed", "Scunthorpe United",
+    "the cocktail party", "grape juice", "I love $5 coffee", "a|b|c", "",
+    "   ", "x", "ok.", "naïve café résumé", "ＦＵＬＬＷＩＤＴＨ text", "🙂 emoji only 🙃",
+    "line one\nline two\n\n\n", "tabs\tand\tstuff", "don't \"quote\" me",
+]
+JUNK = "abcdefghijklmnopqrstuvwxyz ABC 0123456789 @$*!|'\".,-_/\\?#:;()[]{}~^&%+=<>äöüßéñ€ＡＢ　\n\t"
+SEPARATORS = [" ", "  ", "-", "_", ".", ", ", "!", "|", "/", "\n"]
+
+
+def _variant(word, rng):
+    out = []
+    for ch in word:
+        r = rng.random()
+        if ch in CHARS_MAPPING and r < 0.4:
+            out.append(rng.choice(CHARS_MAPPING[ch]))
+        elif ch == "i" and r < 0.5:
+            out.append(rng.choice("!|"))
+        elif r < 0.55:
+            out.append(ch.upper())
+        elif r < 0.6:
+            out.append(ch * rng.randint(3, 6))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def corpus(words, rng, sampled=300, n=2000):
+    cases = list(CLEAN)
+    picked = rng.sample(words, min(sampled, len(words)))
+    picked += [w for w in words if w not in picked and not w.isalnum()]
+    for w in picked:
+        cases += [w, w.upper(), f"you {w}!", f"{w}{w}", f"{w}-{w} again"]
+    while len(cases) < n:
+        kind = rng.random()
+        w = rng.choice(words)
+        if kind < 0.35:
+            filler = rng.sample(CLEAN[:10], 2)
+            cases.append(f"{filler[0]} {_variant(w, rng)}{rng.choice(SEPARATORS)}{filler[1]}")
+        elif kind < 0.55:
+            parts = regex.split(r"[^a-z0-9]+", w)
+            cases.append(rng.choice(SEPARATORS).join(parts) + rng.choice(["", ".", " ok"]))
+        elif kind < 0.65:
+            cases.append(ud.normalize("NFKD", _variant(w, rng)) if rng.random() < 0.5
+                         else "".join(chr(ord(c) + 0xFEE0) if "!" <= c <= "~" else c for c in w))
+        elif kind < 0.8:
+            cases.append(" ".join(_variant(rng.choice(words), rng) if rng.random() < 0.3
+                                  else rng.choice(CLEAN[:12]) for _ in range(rng.randint(2, 12))))
+        else:
+            cases.append("".join(rng.choice(JUNK) for _ in range(rng.randint(1, 60))))
+    return cases
+
+
+def test_engine_matches_the_old_filter():
+    engine = ModerationEngine(load_wordlist() + EXTRA)
+    legacy = make_legacy(EXTRA)
+    cases = corpus(engine.words, random.Random(SEED))
+    results = [(raw, legacy(raw), engine.moderate(raw)) for raw in cases]
+    diffs = [r for r in results if r[1] != r[2]]
+    assert not diffs, diffs[:10]
+    # the corpus has to exercise both outcomes to mean anything
+    assert 0 < sum(want[0] for _, want, _ in results) < len(cases)
+
+
+def test_whitelist_and_extra_words_come_from_the_environment():
+    engine = ModerationEngine.from_env({"PROFANITY_EXTRA_WORDS": "frack, smeg", "PROFANITY_WHITELIST": "hell"})
+    assert engine.moderate("frack this") == (True, "**** this")
+    assert engine.moderate("what the hell") == (False, "what the hell")
@@ -0,0 +1,185 @@
+import collections, concurrent.futures, itertools
+from datetime import datetime, timezone
+
+from backend.moderation import ModerationEngine
+
+Msg = collections.namedtuple("Msg", "data attributes message_id publish_time")
+
+
+def _pulled(data, attributes, message_id):
+    return Msg(data, attributes, message_id, datetime.now(timezone.utc))
+
+
+class FakePublisher:
+    """Stands in for Pub/Sub: every publish is acked at once with a new ID."""
+
+    def __init__(self):
+        self.published = []
+        self._ids = itertools.count(1)
+
+    def publish(self, topic, data, **attrs):
+        self.published.append((data, attrs))
+        future = concurrent.futures.Future()
+        future.set_result(f"fake-{next(self._ids)}")
+        return future
+
+
+def _store(core, client_id, data, pubsub_id=None):
+    return core._store_message(client_id, pubsub_id or f"ps-{client_id}", data, "web", {"messageId": client_id})
+
+
+def test_replay_keeps_the_original(core):
+    assert _store(core, "1", "hello") == (1, False)
+    # replayed ID: flagged, same row
+    assert _store(core, "1", "hello", pubsub_id="ps-1b") == (1, True)
+    # the text still has its original, so a new ID with it is a duplicate
+    row_id, is_dup = _store(core, "2", "hello")
+    assert is_dup
+    assert _store(core, "3", "other") == (row_id + 1, False)
+
+    stored = core._store_messages_bulk([
+        {"client_message_id": "4", "pubsub_message_id": "ps-4", "data": "hello",
+         "source": None, "attributes": {}},
+        {"client_message_id": "5", "pubsub_message_id": "ps-5", "data": "new in bulk",
+         "source": None, "attributes": {}},
+    ])
+    assert [(cid, dup) for cid, (_, dup, _) in sorted(stored.items())] == [("4", True), ("5", False)]
+
+
+def test_publish_after_the_sink_stored_it_is_not_a_replay(core):
+    sink = core.IngestSink(core.engine, lambda tokens: None,
+                           partitioned=core.PARTITIONS.is_partitioned, log=lambda line: None)
+    rows = [core.row_from_message(_pulled(b"fresh text", {"messageId": "7", "source": "web"}, "ps-7")),
+            core.row_from_message(_pulled(b"bulk text", {"messageId": "8"}, "ps-8"))]
+    assert len(sink.write(rows)) == 2
+
+    row_id, is_dup = _store(core, "7", "fresh text")
+    stored = core._store_messages_bulk([
+        {"client_message_id": "8", "pubsub_message_id": "ps-8", "data": "bulk text",
+         "source": None, "attributes": {}},
+    ])
+    assert not is_dup
+    assert stored["8"][1:] == (False, True)
+    # the sink's rows are untouched and the publish path didn't count them again
+    with core.engine.connect() as conn:
+        assert conn.execute(core.text("SELECT COUNT(*) FROM messages WHERE is_duplicate")).scalar() == 0
+    assert core.ROLLUPS.counters["recorded"] == 0
+
+    # a later publish under the same client ID is still a replay
+    assert _store(core, "7", "fresh text", pubsub_id="ps-7b") == (row_id, True)
+    assert core.ROLLUPS.counters["recorded"] == 1
+
+
+def test_repeated_id_in_a_batch_is_published_once(core, monkeypatch):
+    fake = FakePublisher()
+    monkeypatch.setattr(core, "publisher", fake)
+    item = {"data": "batched", "attributes": {"messageId": "1"}}
+    resp = core.app.test_client().post("/publish/batch", json=[item, item])
+
+    first, repeat = resp.get_json()["results"]
+    assert len(fake.published) == 1
+    assert repeat == {**first, "index": 1}
+    assert first["is_duplicate"] is False
+    # the stored row is the text's original, so a new ID with it is a duplicate
+    with core.engine.connect() as conn:
+        assert conn.execute(core.text("SELECT is_duplicate FROM messages")).scalar() is False
+    assert _store(core, "2", "batched")[1] is True
+
+
+class _Inline:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def test_every_cached_replay_flags_and_bumps_the_row(core, monkeypatch):
+    fake = FakePublisher()
+    monkeypatch.setattr(core, "publisher", fake)
+    monkeypatch.setattr(core, "PUBLISH_EXECUTOR", _Inline())
+    client = core.app.test_client()
+    item = {"data": "again", "attributes": {"messageId": "1"}}
+
+    def stored():
+        with core.engine.connect() as conn:
+            return conn.execute(core.text(
+                "SELECT publish_time, is_duplicate FROM messages"
+            )).one()
+
+    assert client.post("/publish?wait=1", json=item).get_json()["is_duplicate"] is False
+    times = [stored()[0]]
+    for _ in range(2):
+        body = client.post("/publish?wait=1", json=item).get_json()
+        assert (body["cached"], body["is_duplicate"]) == (True, True)
+        publish_time, is_dup = stored()
+        # flagged as a replay and moved to now
+        assert is_dup
+        assert publish_time > times[-1]
+        times.append(publish_time)
+    # replays answered from the cache are not published again
+    assert len(fake.published) == 1
+    # and the row is still the text's original
+    assert _store(core, "2", "again")[1] is True
+
+
+def test_polls_get_304_until_a_publish_changes_the_messages(core, monkeypatch):
+    monkeypatch.setattr(core, "publisher", FakePublisher())
+    monkeypatch.setattr(core, "RESPONSE_CACHE", core.TTLCache(16, 60))
+    client = core.app.test_client()
+    _store(core, "1", "first")
+
+    etag = client.get("/api/messages").headers["ETag"]
+    again = client.get("/api/messages", headers={"If-None-Match": etag})
+    assert (again.status_code, again.data) == (304, b"")
+    # the revalidation was answered from the cache, not the database
+    assert core.RESPONSE_CACHE.hits == 1
+
+    version = core._messages_version()
+    client.post("/publish?wait=1", json={"data": "second", "attributes": {"messageId": "2"}})
+    assert core._messages_version() > version
+    fresh = client.get("/api/messages", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["ETag"] != etag
+    assert sorted(m["data"] for m in fresh.get_json()["items"]) == ["first", "second"]
+
+
+class _CountingEngine(ModerationEngine):
+    def __init__(self, words):
+        super().__init__(words)
+        self.calls = 0
+
+    def moderate(self, t):
+        self.calls += 1
+        return super().moderate(t)
+
+
+def test_moderation_runs_once_per_text_and_word_list(core, monkeypatch):
+    monkeypatch.setattr(core, "publisher", FakePublisher())
+    monkeypatch.setattr(core, "MODERATION_CACHE", core.TTLCache(16, 60))
+    engine = _CountingEngine(["frack"])
+    monkeypatch.setattr(core, "MODERATION", engine)
+    client = core.app.test_client()
+
+    def publish(client_id, data):
+        body = client.post("/publish?wait=1", json={"data": data, "attributes": {"messageId": client_id}}).get_json()
+        return body["flagged"], body["data"]
+
+    assert [publish(cid, text) for cid, text in (("1", "frack this"), ("2", "frack this"),
+                                                  ("3", "all clean"), ("4", "all clean"))] == [
+        (True, "**** this"), (True, "**** this"), (False, "all clean"), (False, "all clean"),
+    ]
+    assert engine.calls == 2
+    with core.engine.connect() as conn:
+        stored = conn.execute(core.text("SELECT data FROM messages ORDER BY id")).scalars().all()
+    assert stored == ["**** this", "**** this", "all clean", "all clean"]
+
+    # a different word list has a different version and never sees those results
+    edited = _CountingEngine(["frack", "clean"])
+    monkeypatch.setattr(core, "MODERATION", edited)
+    assert publish("5", "all clean") == (True, "all ****")
+    assert edited.calls == 1
+
+    # and expired entries are moderated again
+    monkeypatch.setattr(core, "MODERATION_CACHE", core.TTLCache(16, 0))
+    publish("6", "frack again")
+    publish("7", "frack again")
+    assert edited.calls == 3
+    assert core.MODERATION_CACHE.expired == 1
@@ -0,0 +1,54 @@
+import base64, json
+
+import pytest
+
+
+def _b64(obj) -> str:
+    return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+
+
+def test_stream_cap_refuses_with_503(core, monkeypatch):
+    monkeypatch.setattr(core, "STREAM_MAX_CLIENTS", 1)
+    held = core.STREAM_HUB.subscribe()
+    client = core.app.test_client()
+    try:
+        resp = client.get("/api/stream")
+        assert resp.status_code == 503
+        assert core.STREAM_HUB.stats()["refused"] >= 1
+    finally:
+        core.STREAM_HUB.unsubscribe(held)
+
+    resp = client.get("/api/stream", buffered=False)
+    try:
+        assert resp.status_code == 200
+        assert core.STREAM_HUB.stats()["clients"] == 1
+    finally:
+        resp.close()
+    assert core.STREAM_HUB.stats()["clients"] == 0
+
+
+@pytest.mark.parametrize("cursor", [
+    "W10",  # []
+    "MQ",  # 1
+    "bnVsbA",  # null
+    "not base64!",
+    _b64({"t": "yesterday", "id": 1}),
+    _b64({"t": "2026-01-01T00:00:00+00:00", "id": [1]}),
+    _b64({"t": "2026-01-01T00:00:00+00:00", "id": 1, "d": "sideways"}),
+    _b64({"id": 1}),
+])
+def test_malformed_cursor_is_a_400(core, cursor):
+    resp = core.app.test_client().get("/api/messages", query_string={"cursor": cursor})
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Invalid cursor."
+
+
+def test_conditional_poll_preflight_is_cacheable(core):
+    resp = core.app.test_client().options("/api/messages", headers={
+        "Origin": "https://dashboard.example",
+        "Access-Control-Request-Method": "GET",
+        "Access-Control-Request-Headers": "if-none-match",
+    })
+    assert resp.status_code == 200
+    assert resp.headers["Access-Control-Max-Age"] == str(core.CORS_MAX_AGE)
+    assert "if-none-match" in resp.headers["Access-Control-Allow-Headers"].lower()
@@ -0,0 +1,47 @@
+import multiprocessing
+
+from backend.shared_ring import SharedRing
+
+
+def _bump(path, n):
+    ring = SharedRing(path, slots=8, slot_size=256)
+    for _ in range(n):
+        ring.bump_version()
+
+
+def test_version_bumps_from_several_processes_are_not_lost(tmp_path):
+    path = str(tmp_path / "ring")
+    ring = SharedRing(path, slots=8, slot_size=256)
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_bump, args=(path, 500)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+    assert [p.exitcode for p in procs] == [0, 0, 0, 0]
+    assert ring.version == 2000
+    # the counter doesn't disturb the records
+    ring.append({"messageId": "1", "data": "hello"})
+    assert list(ring) == [{"messageId": "1", "data": "hello"}]
+
+
+def test_oversized_records_are_summarized_to_valid_json(tmp_path):
+    ring = SharedRing(str(tmp_path / "ring"), slots=8, slot_size=256)
+    records = [
+        {"messageId": "1", "publishTime": "t1", "data": "x" * 1000, "attributes": {}},
+        # escapes make the encoded form several times longer than the text
+        {"messageId": "2", "data": "é\"🙂" * 200},
+        {"messageId": "3", "data": "short", "attributes": {"k": "v" * 1000}},
+    ]
+    for r in records:
+        ring.append(r)
+
+    stored = list(ring)
+    assert [r["messageId"] for r in stored] == ["1", "2", "3"]
+    assert all(r["truncated"] is True and set(r) <= {"messageId", "publishTime", "data", "truncated"}
+               for r in stored)
+    assert stored[0]["publishTime"] == "t1"
+    for want, got in zip(records, stored):
+        assert want["data"].startswith(got["data"])
+    assert stored[2]["data"] == "short"
+    assert len(stored[0]["data"]) > 150
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 
 const API_BASE = import.meta.env.VITE_API_BASE || "";
 
@@ -380,6 +380,12 @@ function formatPublishTime(value) {
   return value;
 }
 
+function formatCount(n) {
+  if (n >= 1e6) return `${(n / 1e6).toFixed(1)}M`;
+  if (n >= 1e4) return `${(n / 1e3).toFixed(1)}K`;
+  return String(n);
+}
+
 function ReceiverPage({ brandBlue, brandGold }) {
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -387,6 +393,15 @@ function ReceiverPage({ brandBlue, brandGold }) {
   const [page, setPage] = useState(1);
   const pageSize = 10;
   const [total, setTotal] = useState(0);
+  const [totalIsEstimate, setTotalIsEstimate] = useState(false);
+
+  // keyset paging: cursor for the current page (null = newest page)
+  const [cursor, setCursor] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [prevCursor, setPrevCursor] = useState(null);
+
+  // last ETag per query string, so polls can be answered with 304
+  const etags = useRef({});
 
   const [autoRefresh, setAutoRefresh] = useState(false);
 
@@ -406,9 +421,14 @@ function ReceiverPage({ brandBlue, brandGold }) {
     if (filterSource.trim()) params.append("source", filterSource.trim());
     if (filterStartDate.trim()) params.append("start", filterStartDate.trim());
     if (filterEndDate.trim()) params.append("end", filterEndDate.trim());
+    if (filterStartDate.trim() || filterEndDate.trim()) {
+      // dates are calendar days in the viewer's own time zone
+      params.append("tz", Intl.DateTimeFormat().resolvedOptions().timeZone);
+    }
     if (filterDuplicate) params.append("is_duplicate", filterDuplicate);
     if (filterText.trim()) params.append("text", filterText.trim());
-    params.append("page", page);
+    if (cursor) params.append("cursor", cursor);
+    else params.append("page", page);
     params.append("limit", pageSize);
     return `?${params.toString()}`;
   }
@@ -417,9 +437,21 @@ function ReceiverPage({ brandBlue, brandGold }) {
     setLoading(true);
     try {
       const qs = buildQuery();
-      const res = await fetch(`${API_BASE}/api/messages${qs}`);
-      if (!res.ok) throw new Error(`HTTP ${res.status}`);
-      const data = await res.json();
+      const cached = etags.current[qs];
+      const res = await fetch(`${API_BASE}/api/messages${qs}`, {
+        cache: "no-store",
+        headers: cached ? { "If-None-Match": cached.etag } : {},
+      });
+      let data;
+      if (res.status === 304 && cached) {
+        // nothing changed since we last fetched this query
+        data = cached.data;
+      } else {
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        data = await res.json();
+        const etag = res.headers.get("ETag");
+        if (etag) etags.current[qs] = { etag, data };
+      }
 
       let items = [];
       if (data && Array.isArray(data.items)) {
@@ -436,9 +468,14 @@ function ReceiverPage({ brandBlue, brandGold }) {
       }
 
       setMessages(items);
+      setTotalIsEstimate(Boolean(data?.total_is_estimate));
+      setNextCursor(data?.next_cursor ?? null);
+      setPrevCursor(data?.prev_cursor ?? null);
     } catch {
       setMessages([]);
       setTotal(0);
+      setNextCursor(null);
+      setPrevCursor(null);
     } finally {
       setLoading(false);
     }
@@ -446,11 +483,49 @@ function ReceiverPage({ brandBlue, brandGold }) {
 
   useEffect(() => {
     load();
-    if (autoRefresh) {
-      const id = setInterval(load, 10000);
-      return () => clearInterval(id);
+    if (!autoRefresh) return;
+
+    // live updates over SSE; plain 10s polling if the stream is unavailable
+    let pollId = null;
+    let reloadTimer = null;
+    const startPolling = () => {
+      if (!pollId) pollId = setInterval(load, 10000);
+    };
+
+    if (typeof EventSource === "undefined") {
+      startPolling();
+      return () => clearInterval(pollId);
     }
-  }, [page, autoRefresh]);
+
+    const es = new EventSource(`${API_BASE}/api/stream`);
+    const scheduleReload = () => {
+      // coalesce bursts of messages into one (usually 304) reload
+      clearTimeout(reloadTimer);
+      reloadTimer = setTimeout(load, 500);
+    };
+    es.addEventListener("message", scheduleReload);
+    es.addEventListener("reset", scheduleReload);
+    es.onerror = () => {
+      if (es.readyState === EventSource.CLOSED) startPolling();
+    };
+
+    return () => {
+      es.close();
+      clearTimeout(reloadTimer);
+      if (pollId) clearInterval(pollId);
+    };
+  }, [page, cursor, autoRefresh]);
+
+  function goNext() {
+    if (nextCursor) setCursor(nextCursor);
+    setPage(page + 1);
+  }
+
+  function goPrev() {
+    // page 1 is always the live "newest" page
+    setCursor(page - 1 === 1 ? null : prevCursor);
+    setPage(page - 1);
+  }
 
   function clearFilters() {
     setFilterMessageId("");
@@ -459,6 +534,7 @@ function ReceiverPage({ brandBlue, brandGold }) {
     setFilterEndDate("");
     setFilterDuplicate("");
     setFilterText("");
+    setCursor(null);
     setPage(1);
     load();
   }
@@ -653,6 +729,7 @@ function ReceiverPage({ brandBlue, brandGold }) {
       <div style={{ display: "flex", gap: 8, marginBottom: 16, alignItems: "center" }}>
         <button
           onClick={() => {
+            setCursor(null);
             setPage(1);
             load();
           }}
@@ -805,7 +882,7 @@ function ReceiverPage({ brandBlue, brandGold }) {
         >
           <button
             disabled={page === 1}
-            onClick={() => setPage(page - 1)}
+            onClick={goPrev}
             className="btn-hover"
             style={{
               background: brandBlue,
@@ -821,11 +898,13 @@ function ReceiverPage({ brandBlue, brandGold }) {
             Prev
           </button>
           <span style={{ fontSize: 12, color: "#6b7280" }}>
-            Page {page} of {Math.ceil(total / pageSize) || 1}
+            Page {page} of {totalIsEstimate ? "~" : ""}
+            {Math.ceil(total / pageSize) || 1} ({totalIsEstimate ? "~" : ""}
+            {formatCount(total)} messages)
           </span>
           <button
             disabled={page >= Math.ceil(total / pageSize)}
-            onClick={() => setPage(page + 1)}
+            onClick={goNext}
             className="btn-hover"
             style={{
               background: brandBlue,